@@ -0,0 +1,334 @@
+"""
+End-to-end load test: gateway + weather + outfit + wardrobe on this machine.
+
+Boots the four services as subprocesses on free ports (weather on the
+synthetic provider, so no API key or quota is involved; wardrobe on the memory
+backend), then drives open-loop traffic: requests are sent on a fixed
+schedule whether or not earlier ones have finished, and latency is measured
+from the scheduled send time so queueing is not hidden (no coordinated
+omission).
+
+Reports throughput and p50/p95/p99 per endpoint, grouped by hop (the gateway
+endpoints vs. direct calls to each downstream service), breaks every endpoint
+down into the spans its Server-Timing header reports (e.g. /smart-outfit into
+its weather, wardrobe and outfit calls), and writes everything to JSON for
+comparing commits.
+
+    python benchmarks/load_test.py --rate 50 --duration 30
+    python benchmarks/load_test.py --mix smart-outfit=1 --rate 200 --compare benchmarks/results/<old>.json
+    python benchmarks/load_test.py --external --gateway-url http://localhost:8000 ...   # docker-compose stack
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# service -> (directory, module holding the Flask app)
+SERVICES = {
+    "weather": ("weather-service", "app"),
+    "outfit": ("outfit-service", "app"),
+    "wardrobe": ("wardrobe-service", "App"),
+    "gateway": ("gateway", "app")
+}
+
+CITIES = ["paris", "london", "algiers", "amizour", "oslo", "rome", "madrid", "berlin", "tokyo", "cairo",
+          "lima", "quito", "dakar", "tunis", "lisbon", "vienna", "prague", "dublin", "athens", "kyiv"]
+CONDITIONS = ["sunny", "rainy", "snow", "cloudy", "clear"]
+
+DEFAULT_MIX = "smart-outfit=4,outfit-for-city=3,clothes-match=1,recommend=1,weather=1"
+
+
+def endpoint_table(urls, rng, bypass_cache):
+    """name -> (hop, function building (method, url, json body)) for each traffic class"""
+    headers = {"Cache-Control": "no-cache"} if bypass_cache else {}
+
+    def city():
+        return rng.choice(CITIES)
+
+    return {
+        "smart-outfit": ("gateway", lambda: ("GET", f"{urls['gateway']}/smart-outfit/{city()}", None, headers)),
+        "outfit-for-city": ("gateway", lambda: ("GET", f"{urls['gateway']}/outfit-for-city/{city()}", None, headers)),
+        "weather": ("weather", lambda: ("GET", f"{urls['weather']}/weather/{city()}", None, {})),
+        "recommend": ("outfit", lambda: (
+            "GET", f"{urls['outfit']}/recommend/{rng.randint(-10, 35)}/{rng.choice(CONDITIONS)}", None, {})),
+        "clothes-match": ("wardrobe", lambda: ("POST", f"{urls['wardrobe']}/clothes/match", {
+            "temperature": rng.randint(-10, 35), "condition": rng.choice(CONDITIONS), "user_id": "user123"
+        }, {}))
+    }
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_services(env_overrides, log_dir):
+    """Start every service on its own port; returns ({service: url}, [processes])"""
+    ports = {name: free_port() for name in SERVICES}
+    urls = {name: f"http://127.0.0.1:{port}" for name, port in ports.items()}
+    env = {
+        **os.environ,
+        "PYTHONUNBUFFERED": "1",
+        "WEATHER_PROVIDER": "synthetic",
+        "WARDROBE_BACKEND": "memory",
+        "WEATHER_SERVICE_URL": urls["weather"],
+        "OUTFIT_SERVICE_URL": urls["outfit"],
+        "WARDROBE_SERVICE_URL": urls["wardrobe"],
+        **env_overrides
+    }
+    processes = []
+    for name, (directory, module) in SERVICES.items():
+        code = f"import {module}; {module}.app.run(host='127.0.0.1', port={ports[name]}, threaded=True)"
+        log = open(Path(log_dir) / f"{name}.log", "w")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-c", code], cwd=ROOT / directory, env=env, stdout=log, stderr=subprocess.STDOUT
+        ))
+    return urls, processes
+
+
+def wait_until_healthy(urls, timeout=30):
+    deadline = time.monotonic() + timeout
+    for name, url in urls.items():
+        while True:
+            try:
+                if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{name} did not become healthy at {url}")
+            time.sleep(0.2)
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def parse_server_timing(header):
+    """'weather;dur=12.3, app;dur=20.1' -> {"weather": 0.0123, "app": 0.0201}; repeated spans add up"""
+    spans = {}
+    for entry in header.split(","):
+        name, *params = [part.strip() for part in entry.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if name and key.strip() == "dur":
+                try:
+                    spans[name] = spans.get(name, 0.0) + float(value) / 1000
+                except ValueError:
+                    pass
+    return spans
+
+
+def summarize_spans(spans):
+    """span -> count and p50/p95/p99 of the durations one endpoint's responses reported"""
+    ms = lambda seconds: round(seconds * 1000, 2)
+    summary = {}
+    for span, durations in spans.items():
+        ordered = sorted(durations)
+        summary[span] = {"count": len(ordered), "p50_ms": ms(percentile(ordered, 50)),
+                         "p95_ms": ms(percentile(ordered, 95)), "p99_ms": ms(percentile(ordered, 99))}
+    return summary
+
+
+def summarize(samples, errors, duration):
+    ordered = sorted(samples)
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    return {
+        "requests": len(samples) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(samples) / duration, 2),
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else None
+    }
+
+
+def run_load(endpoints, mix, rate, duration, concurrency, rng, timeout):
+    """
+    Open-loop: request i is due at start + i/rate, latency counts from that moment.
+    Returns (samples, errors, spans, elapsed); spans maps endpoint -> span -> durations
+    read from the Server-Timing header of successful responses.
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    total = int(rate * duration)
+    plan = [(i / rate, rng.choices(names, weights)[0]) for i in range(total)]
+    plan = [(due, name, endpoints[name][1]()) for due, name in plan]
+
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    spans = {name: {} for name in names}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(scheduled_at, name, request):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, url, body, headers = request
+        try:
+            response = session.request(method, url, json=body, headers=headers, timeout=timeout)
+            ok = response.status_code < 400
+            timing = parse_server_timing(response.headers.get("Server-Timing", ""))
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - scheduled_at
+        with lock:
+            if ok:
+                samples[name].append(latency)
+                for span, seconds in timing.items():
+                    spans[name].setdefault(span, []).append(seconds)
+            else:
+                errors[name] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for due, name, request in plan:
+            delay = start + due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, start + due, name, request)
+    elapsed = time.perf_counter() - start
+    return samples, errors, spans, elapsed
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result, baseline=None):
+    print(f"\n{'endpoint':<16}{'hop':<10}{'req':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}   (ms)")
+    for name, stats in result["endpoints"].items():
+        line = (f"{name:<16}{stats['hop']:<10}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9}"
+                f"{stats['p50_ms'] or '-':>9}{stats['p95_ms'] or '-':>9}{stats['p99_ms'] or '-':>9}")
+        old = (baseline or {}).get("endpoints", {}).get(name)
+        if old and old.get("p95_ms") and stats["p95_ms"]:
+            change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+            line += f"   p95 {change:+.1f}% vs {baseline.get('commit') or 'baseline'}"
+        print(line)
+    print("\nper hop:")
+    for hop, stats in result["hops"].items():
+        print(f"  {hop:<10} rps={stats['throughput_rps']:<8} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms "
+              f"p99={stats['p99_ms']}ms errors={stats['errors']}")
+    for name, stats in result["endpoints"].items():
+        if stats.get("spans"):
+            print(f"\n{name} spans (Server-Timing):")
+            for span, timing in stats["spans"].items():
+                print(f"  {span:<14} n={timing['count']:<7} p50={timing['p50_ms']}ms p95={timing['p95_ms']}ms "
+                      f"p99={timing['p99_ms']}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rate", type=float, default=50, help="total requests per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of traffic")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of unrecorded traffic first")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,... of " + DEFAULT_MIX)
+    parser.add_argument("--concurrency", type=int, default=128, help="max requests in flight")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bypass-cache", action="store_true", help="send Cache-Control: no-cache to the gateway")
+    parser.add_argument("--weather-latency-ms", type=float, default=50, help="synthetic provider latency")
+    parser.add_argument("--weather-error-rate", type=float, default=0.0)
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the services")
+    parser.add_argument("--external", action="store_true", help="don't boot services, use the URLs below")
+    parser.add_argument("--gateway-url", default="http://localhost:8000")
+    parser.add_argument("--weather-url", default="http://localhost:5001")
+    parser.add_argument("--outfit-url", default="http://localhost:5002")
+    parser.add_argument("--wardrobe-url", default="http://localhost:5003")
+    parser.add_argument("--out", help="result JSON path (default benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result JSON to compare p95s against")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    processes = []
+    log_dir = tempfile.mkdtemp(prefix="load-test-")
+    if args.external:
+        urls = {"gateway": args.gateway_url, "weather": args.weather_url,
+                "outfit": args.outfit_url, "wardrobe": args.wardrobe_url}
+    else:
+        overrides = dict(item.split("=", 1) for item in args.env)
+        overrides.setdefault("SYNTHETIC_LATENCY_MS", str(args.weather_latency_ms))
+        overrides.setdefault("SYNTHETIC_ERROR_RATE", str(args.weather_error_rate))
+        urls, processes = start_services(overrides, log_dir)
+        print(f"services starting, logs in {log_dir}")
+
+    try:
+        wait_until_healthy(urls)
+        rng = random.Random(args.seed)
+        endpoints = endpoint_table(urls, rng, args.bypass_cache)
+        unknown = set(mix) - set(endpoints)
+        if unknown:
+            parser.error(f"unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+
+        if args.warmup:
+            run_load(endpoints, mix, args.rate, args.warmup, args.concurrency, rng, args.timeout)
+        print(f"driving {args.rate} req/s for {args.duration}s: {args.mix}")
+        samples, errors, spans, elapsed = run_load(endpoints, mix, args.rate, args.duration,
+                                            args.concurrency, rng, args.timeout)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "elapsed_seconds": round(elapsed, 2),
+        "endpoints": {},
+        "hops": {}
+    }
+    by_hop = {}
+    for name in mix:
+        hop = endpoints[name][0]
+        result["endpoints"][name] = {"hop": hop, **summarize(samples[name], errors[name], elapsed),
+                                     "spans": summarize_spans(spans[name])}
+        hop_samples, hop_errors = by_hop.setdefault(hop, ([], [0]))
+        hop_samples.extend(samples[name])
+        hop_errors[0] += errors[name]
+    for hop, (hop_samples, hop_errors) in by_hop.items():
+        result["hops"][hop] = summarize(hop_samples, hop_errors[0], elapsed)
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(result, baseline)
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{result['commit'] or 'local'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+    print(f"\nresults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: scored outfit search on synthetic wardrobes of 100 / 1k / 10k items.
+
+Checks the branch-and-bound search against brute force on a small wardrobe,
+then times find_best_outfit (index lookups + scoring + search) per size.
+
+    python benchmarks/outfit_optimizer.py --sizes 100 1000 10000 --repeat 20
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "wardrobe-service"))
+os.environ.setdefault("WARDROBE_BACKEND", "memory")
+
+TYPES = ["top", "top", "dress", "bottom", "bottom", "layer", "footwear", "footwear"]
+COLORS = ["black", "white", "gray", "navy", "blue", "red", "yellow", "pink", "green", "brown"]
+CATEGORIES = ["casual", "sports", "summer", "winter", "formal"]
+NOUNS = {"top": "T-Shirt", "dress": "Dress", "bottom": "Jeans", "layer": "Jacket", "footwear": "Boots"}
+QUERIES = [(-3, "snow"), (8, "rainy"), (17, "clear"), (28, "sunny")]
+RECOMMENDATION = {"base": "t-shirt or light sweater", "layers": ["light jacket (optional)"], "footwear": "sneakers"}
+
+
+def synthetic_items(n, rng):
+    items = []
+    for i in range(n):
+        item_type = rng.choice(TYPES)
+        color = rng.choice(COLORS)
+        items.append({
+            "id": f"item-{i}",
+            "name": f"{color.title()} {NOUNS[item_type]} {i}",
+            "type": item_type,
+            "color": color,
+            "warmth": rng.randint(1, 3),
+            "category": rng.choice(CATEGORIES)
+        })
+    return items
+
+
+def brute_force(scorer, tops, bottoms, layers, footwear, k):
+    from outfit_optimizer import WORD
+
+    def unary(slot, item):
+        # Reference scoring: tokenize the name instead of the Scorer's regex search
+        bonus = scorer.w_recommendation if scorer.words.intersection(WORD.findall(item.name.lower())) else 0.0
+        return scorer.base(slot, item.warmth, item.color, item.category) + bonus
+
+    scored = []
+    for top, bottom, layer, shoe in itertools.product(tops, bottoms, layers + [None], footwear):
+        score = (unary("top", top) + unary("bottom", bottom)
+                 + (unary("layer", layer) if layer else scorer.no_layer())
+                 + unary("footwear", shoe) + scorer.harmony(top, bottom))
+        scored.append(score)
+    return sorted(scored, reverse=True)[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    import App as wardrobe
+    from outfit_optimizer import Scorer, best_outfits
+
+    rng = random.Random(42)
+
+    # Correctness: same top-k scores as trying every combination
+    small = [wardrobe.ClothingItem.from_dict(d, seq=i) for i, d in enumerate(synthetic_items(60, rng))]
+    by_type = {t: [i for i in small if i.type == t] for t in set(TYPES)}
+    for temperature, condition in QUERIES:
+        scorer = Scorer(temperature, condition, RECOMMENDATION)
+        found = best_outfits(scorer, by_type["top"] + by_type["dress"], by_type["bottom"],
+                             by_type["layer"], by_type["footwear"], k=args.top_k)
+        expected = brute_force(scorer, by_type["top"] + by_type["dress"], by_type["bottom"],
+                               by_type["layer"], by_type["footwear"], args.top_k)
+        assert [round(o[0], 9) for o in found] == [round(s, 9) for s in expected], (temperature, condition)
+    print("branch-and-bound matches brute force")
+
+    for size in args.sizes:
+        user_id = f"bench-{size}"
+        wardrobe.wardrobe_repository.add_many(user_id, synthetic_items(size, rng))
+        samples = []
+        for _ in range(args.repeat):
+            for temperature, condition in QUERIES:
+                start = time.perf_counter()
+                wardrobe.find_best_outfit(user_id, temperature, condition, RECOMMENDATION, top_k=args.top_k)
+                samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        print(f"{size:>6} items: mean={statistics.mean(samples):7.2f}ms  "
+              f"p50={samples[len(samples) // 2]:7.2f}ms  p95={samples[int(len(samples) * 0.95)]:7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
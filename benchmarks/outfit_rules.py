@@ -0,0 +1,110 @@
+"""
+Micro-benchmark: precompiled outfit rule table vs the original if/elif function.
+
+    python benchmarks/outfit_rules.py --iterations 200000
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "outfit-service"))
+
+CONDITIONS = ["rainy", "snow", "sunny", "clear", "cloudy"]
+
+
+# The pre-table implementation, kept verbatim as the baseline
+def legacy_outfit_recommendation(temperature, condition):
+    recommendations = {
+        "base": "",
+        "layers": [],
+        "accessories": [],
+        "footwear": "",
+        "style_tip": ""
+    }
+    
+    # Temperature-based logic
+    if temperature < 0:
+        recommendations.update({
+            "base": "thermal wear",
+            "layers": ["warm sweater", "winter coat"],
+            "accessories": ["scarf", "gloves", "beanie"],
+            "footwear": "insulated boots",
+            "style_tip": "Layer up! It's freezing out there ❄️"
+        })
+    elif temperature < 10:
+        recommendations.update({
+            "base": "long-sleeve shirt",
+            "layers": ["jacket or hoodie"],
+            "accessories": ["scarf"],
+            "footwear": "closed shoes or boots", 
+            "style_tip": "Perfect jacket weather! 🍂"
+        })
+    elif temperature < 20:
+        recommendations.update({
+            "base": "t-shirt or light sweater",
+            "layers": ["light jacket (optional)"],
+            "accessories": [],
+            "footwear": "sneakers or casual shoes",
+            "style_tip": "Comfortable and casual 🌤️"
+        })
+    else:
+        recommendations.update({
+            "base": "t-shirt or tank top",
+            "layers": [],
+            "accessories": ["sunglasses"],
+            "footwear": "sandals or breathable shoes",
+            "style_tip": "Stay cool and hydrated! ☀️"
+        })
+    
+    # Weather condition adjustments
+    if condition == "rainy":
+        recommendations["accessories"].append("umbrella")
+        recommendations["footwear"] = "waterproof shoes"
+        recommendations["style_tip"] += " Don't forget rain protection! ☔"
+    elif condition == "snow":
+        recommendations["accessories"].extend(["warm gloves", "earmuffs"])
+        recommendations["style_tip"] += " Winter wonderland ready! ⛄"
+    elif condition == "sunny":
+        recommendations["accessories"].append("sunglasses")
+        recommendations["style_tip"] += " Perfect for sunglasses! 😎"
+    
+    return recommendations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    import app as outfit
+
+    # Both implementations must agree on every compiled input
+    for temperature in range(outfit.MIN_TEMPERATURE, outfit.MAX_TEMPERATURE + 1):
+        for condition in CONDITIONS:
+            expected = legacy_outfit_recommendation(temperature, condition)
+            actual = outfit.get_outfit_recommendation(temperature, condition)
+            assert json.loads(json.dumps(actual)) == expected, (temperature, condition)
+
+    queries = [(t, c) for t in range(-15, 40) for c in CONDITIONS]
+
+    def run(fn):
+        for t, c in queries:
+            fn(t, c)
+
+    rounds = max(1, args.iterations // len(queries))
+    for name, fn in (("legacy", legacy_outfit_recommendation), ("table", outfit.get_outfit_recommendation)):
+        seconds = min(timeit.repeat(lambda: run(fn), number=rounds, repeat=3))
+        per_call = seconds / (rounds * len(queries)) * 1e9
+        print(f"{name:<8} {per_call:8.1f} ns/call")
+
+    client = outfit.app.test_client()
+    body = {"queries": [[t, c] for t, c in queries]}
+    single = min(timeit.repeat(lambda: [client.get(f"/recommend/{t}/{c}") for t, c in queries], number=1, repeat=3))
+    batch = min(timeit.repeat(lambda: client.post("/recommend/batch", json=body), number=1, repeat=3))
+    print(f"{len(queries)} queries over HTTP: one-by-one {single * 1000:.1f}ms, /recommend/batch {batch * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
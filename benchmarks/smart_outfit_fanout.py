@@ -0,0 +1,104 @@
+"""
+Latency comparison: sequential vs concurrent /smart-outfit orchestration.
+
+Starts stub weather/outfit/wardrobe servers with configurable latency, points
+the gateway at them and times both orchestration paths.
+
+    python benchmarks/smart_outfit_fanout.py --requests 50 --weather-ms 80 --outfit-ms 40 --wardrobe-ms 60
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "gateway"))
+
+
+def start_stub(latency_ms, payload):
+    """Tiny HTTP server that sleeps latency_ms then answers with payload"""
+    body = json.dumps(payload).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(latency_ms / 1000.0)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = _reply
+        do_POST = _reply
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(name, samples):
+    print(f"{name:<12} mean={statistics.mean(samples):7.1f}ms  "
+          f"p50={percentile(samples, 50):7.1f}ms  p95={percentile(samples, 95):7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--weather-ms", type=float, default=80)
+    parser.add_argument("--outfit-ms", type=float, default=40)
+    parser.add_argument("--wardrobe-ms", type=float, default=60)
+    args = parser.parse_args()
+
+    import app as gateway
+
+    gateway.weather_client.base_url = start_stub(args.weather_ms, {"city": "Paris", "temperature": 12, "condition": "Clouds"})
+    gateway.outfit_client.base_url = start_stub(args.outfit_ms, {"recommendation": {"base": "long-sleeve shirt"}})
+    gateway.wardrobe_client.base_url = start_stub(args.wardrobe_ms, {"matched_outfit": {}, "match_confidence": 1.0})
+    client = gateway.app.test_client()
+
+    def sequential():
+        # The original chain: weather -> outfit -> wardrobe, one after another
+        weather = gateway.get_weather_with_fallback("paris")
+        condition = weather["condition"].lower()
+        outfit = gateway.get_outfit_with_fallback(weather["temperature"], condition)
+        gateway.get_wardrobe_match(weather["temperature"], condition, outfit["recommendation"])
+
+    def concurrent():
+        # Skip the gateway response cache, we want the orchestration every time
+        client.get("/smart-outfit/paris", headers={"Cache-Control": "no-cache"})
+
+    results = {}
+    for name, fn in (("sequential", sequential), ("concurrent", concurrent)):
+        fn()  # warm-up
+        samples = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = samples
+
+    print(f"downstream latency: weather={args.weather_ms}ms outfit={args.outfit_ms}ms wardrobe={args.wardrobe_ms}ms")
+    for name, samples in results.items():
+        summarize(name, samples)
+    saved = statistics.mean(results["sequential"]) - statistics.mean(results["concurrent"])
+    print(f"saved per request: {saved:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Exercise the weather-service upstream rate limiter against a local OpenWeatherMap stub.
+
+The stub enforces its own quota (answering 429 + Retry-After past it). A burst
+of interactive lookups and background cache refreshes is thrown at
+get_real_weather; the report shows how many calls the stub rejected, how long
+each priority waited and the limiter's final state.
+
+    python benchmarks/weather_rate_limit.py --quota 30 --rate 20 --interactive 40 --background 40
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "weather-service"))
+
+
+def start_owm_stub(quota, window):
+    """OpenWeatherMap look-alike that allows `quota` calls per `window` seconds"""
+    lock = threading.Lock()
+    state = {"window_start": time.monotonic(), "used": 0, "ok": 0, "throttled": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            city = parse_qs(urlparse(self.path).query).get("q", ["nowhere"])[0]
+            with lock:
+                now = time.monotonic()
+                if now - state["window_start"] >= window:
+                    state["window_start"], state["used"] = now, 0
+                state["used"] += 1
+                allowed = state["used"] <= quota
+                state["ok" if allowed else "throttled"] += 1
+                retry_after = max(1, int(window - (now - state["window_start"])))
+
+            if allowed:
+                status, payload, headers = 200, {
+                    "name": city.title(), "sys": {"country": "XX"},
+                    "main": {"temp": 12.3, "feels_like": 11.0, "humidity": 60, "pressure": 1012},
+                    "weather": [{"main": "Clouds", "description": "broken clouds"}],
+                    "wind": {"speed": 3.1}, "coord": {"lat": 0.0, "lon": 0.0}
+                }, {}
+            else:
+                status, payload = 429, {"cod": 429, "message": "Your account is temporary blocked"}
+                headers = {"Retry-After": str(retry_after)}
+
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/data/2.5/weather", state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--quota", type=int, default=30, help="stub calls allowed per window")
+    parser.add_argument("--window", type=float, default=10.0, help="stub quota window (s)")
+    parser.add_argument("--rate", type=int, default=20, help="limiter calls per window")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--interactive", type=int, default=40)
+    parser.add_argument("--background", type=int, default=40)
+    parser.add_argument("--wait", type=float, default=20.0, help="max queueing per call (s)")
+    args = parser.parse_args()
+
+    url, stub = start_owm_stub(args.quota, args.window)
+    os.environ.update({
+        "WEATHER_API_URL": url,
+        "WEATHER_API_KEY": "stub-key",
+        "WEATHER_API_RATE_WAIT": str(args.wait),
+        "WEATHER_API_BACKGROUND_WAIT": str(args.wait)
+    })
+    import app as weather
+    from rate_limiter import TokenBucket
+
+    # The limiter's window is the stub's, so the run finishes in seconds, not minutes
+    weather.upstream_limiter = TokenBucket(rate=args.rate, per=args.window, burst=args.burst)
+
+    latencies = {"interactive": [], "background": []}
+    outcomes = {"interactive": {"ok": 0, "limited": 0}, "background": {"ok": 0, "limited": 0}}
+    lock = threading.Lock()
+
+    def call(kind, i):
+        start = time.perf_counter()
+        result = weather.get_real_weather(f"city-{kind}-{i}", background=(kind == "background"))
+        with lock:
+            latencies[kind].append(time.perf_counter() - start)
+            outcomes[kind]["limited" if result.get("rate_limited") else "ok"] += 1
+
+    jobs = [("background", i) for i in range(args.background)] + [("interactive", i) for i in range(args.interactive)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        list(pool.map(lambda job: call(*job), jobs))
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(jobs)} calls in {elapsed:.1f}s; stub served {stub['ok']}, rejected {stub['throttled']} with 429")
+    for kind in ("interactive", "background"):
+        samples = sorted(latencies[kind])
+        if samples:
+            print(f"  {kind:<11} ok={outcomes[kind]['ok']:<4} limited={outcomes[kind]['limited']:<4} "
+                  f"p50={statistics.median(samples):6.2f}s  max={samples[-1]:6.2f}s")
+    print(json.dumps(weather.upstream_limiter.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
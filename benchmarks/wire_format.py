@@ -0,0 +1,127 @@
+"""
+Payload bytes and serialization CPU for the internal hops behind /smart-outfit.
+
+Each service runs in-process (Flask test clients). The benchmark asks each hop
+for its real response three ways:
+
+    json/full        what the gateway used to get
+    json/minimal     Prefer: return=minimal (no echoed fields)
+    msgpack/minimal  what the gateway asks for now (wire.INTERNAL_HEADERS)
+
+For each way it reports bytes on the wire and the time to encode the body in
+the service and decode it in the gateway.
+
+    python benchmarks/wire_format.py --wardrobe-items 60 --iterations 2000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "common"))
+os.environ.setdefault("WEATHER_PROVIDER", "synthetic")
+os.environ.setdefault("SYNTHETIC_LATENCY_MS", "0")
+os.environ.setdefault("WARDROBE_BACKEND", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import wire  # noqa: E402
+
+MODES = {
+    "json/full": {"Accept": wire.JSON},
+    "json/minimal": {"Accept": wire.JSON, "Prefer": wire.MINIMAL},
+    "msgpack/minimal": {"Accept": wire.MSGPACK, "Prefer": wire.MINIMAL},
+}
+
+
+def load_service(directory, filename, name):
+    """Import one service's Flask module under a unique name (they're all called app)"""
+    sys.path.insert(0, str(ROOT / directory))
+    spec = importlib.util.spec_from_file_location(name, ROOT / directory / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def add_wardrobe_items(wardrobe, user_id, count):
+    types = ["top", "bottom", "layer", "footwear", "dress"]
+    colors = ["black", "white", "navy", "red", "beige", "green"]
+    for i in range(count):
+        wardrobe.wardrobe_repository.add(user_id, {
+            "id": f"bench-{i}", "name": f"Bench item {i}", "type": types[i % len(types)],
+            "color": colors[i % len(colors)], "warmth": 1 + i % 3, "category": "casual",
+            "image_url": f"/images/bench-{i}.jpg", "added_date": "2024-01-01T00:00:00"
+        })
+
+
+def time_per_call(fn, iterations):
+    return min(timeit.repeat(fn, number=iterations, repeat=3)) / iterations * 1e6
+
+
+def measure(body_bytes, mode, iterations):
+    """(bytes, encode us, decode us) for one response body"""
+    if mode.startswith("msgpack"):
+        data = wire.unpackb(body_bytes)
+        encode = lambda: wire.packb(data)  # noqa: E731
+        decode = lambda: wire.unpackb(body_bytes)  # noqa: E731
+    else:
+        data = json.loads(body_bytes)
+        encode = lambda: json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()  # noqa: E731
+        decode = lambda: json.loads(body_bytes)  # noqa: E731
+    return len(body_bytes), time_per_call(encode, iterations), time_per_call(decode, iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--city", default="London")
+    parser.add_argument("--wardrobe-items", type=int, default=60, help="extra items for the benchmark user")
+    parser.add_argument("--top-k", type=int, default=3, help="outfits (best + alternatives) in the match")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    if wire.msgpack is None:
+        sys.exit("msgpack is not installed: pip install msgpack")
+
+    weather = load_service("weather-service", "app.py", "weather_app")
+    outfit = load_service("outfit-service", "app.py", "outfit_app")
+    wardrobe = load_service("wardrobe-service", "App.py", "wardrobe_app")
+    add_wardrobe_items(wardrobe, "bench-user", args.wardrobe_items)
+
+    weather_data = weather.app.test_client().get(f"/weather/{args.city}", headers={"Accept": wire.JSON}).get_json()
+    temperature, condition = weather_data["temperature"], weather_data["condition"].lower()
+    match_body = {"temperature": temperature, "condition": condition, "user_id": "bench-user",
+                  "recommendation": outfit.get_outfit_recommendation(temperature, condition), "top_k": args.top_k}
+    hops = {
+        "weather": lambda client, headers: client.get(f"/weather/{args.city}", headers=headers),
+        "outfit": lambda client, headers: client.get(f"/recommend/{temperature}/{condition}", headers=headers),
+        "wardrobe": lambda client, headers: client.post("/clothes/match", json=match_body, headers=headers),
+    }
+    apps = {"weather": weather.app, "outfit": outfit.app, "wardrobe": wardrobe.app}
+
+    print(f"/smart-outfit chain for {args.city} ({temperature}C, {condition}), "
+          f"{args.wardrobe_items} extra wardrobe items, top_k={args.top_k}\n")
+    print(f"{'hop':<10}{'format':<18}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    totals = {mode: [0, 0.0, 0.0] for mode in MODES}
+    for hop, call in hops.items():
+        client = apps[hop].test_client()
+        for mode, headers in MODES.items():
+            response = call(client, headers)
+            assert response.status_code == 200, (hop, mode, response.status_code)
+            size, encode_us, decode_us = measure(response.get_data(), mode, args.iterations)
+            for i, value in enumerate((size, encode_us, decode_us)):
+                totals[mode][i] += value
+            print(f"{hop:<10}{mode:<18}{size:>8}{encode_us:>12.1f}{decode_us:>12.1f}")
+        print()
+
+    baseline = totals["json/full"]
+    print("chain total")
+    for mode, (size, encode_us, decode_us) in totals.items():
+        print(f"  {mode:<16}{size:>8} B ({size / baseline[0]:.0%})  "
+              f"encode+decode {encode_us + decode_us:8.1f} us ({(encode_us + decode_us) / (baseline[1] + baseline[2]):.0%})")
+
+
+if __name__ == "__main__":
+    main()
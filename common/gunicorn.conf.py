@@ -0,0 +1,51 @@
+# common/gunicorn.conf.py
+"""
+Production serving profile shared by all four services (gunicorn, not the
+Werkzeug dev server that `python app.py` starts):
+
+    gunicorn -c gunicorn.conf.py app:app          # weather, outfit, gateway (Flask)
+    gunicorn -c gunicorn.conf.py App:app          # wardrobe
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app  # async gateway
+
+Every knob is an environment variable so the Dockerfiles and k8s manifests
+can size each service differently:
+
+    PORT                       listen port (8000)
+    WEB_CONCURRENCY            worker processes (2)
+    GUNICORN_THREADS           threads per worker (4)
+    GUNICORN_WORKER_CLASS      gthread, or uvicorn.workers.UvicornWorker for asgi:app
+    GUNICORN_TIMEOUT           kill a worker stuck on one request this long (30s)
+    GUNICORN_GRACEFUL_TIMEOUT  on SIGTERM, let in-flight requests finish this long (25s,
+                               inside k8s' default 30s terminationGracePeriodSeconds)
+    GUNICORN_KEEPALIVE         idle keep-alive seconds (5)
+    GUNICORN_PRELOAD           import the app once in the master, then fork (true)
+    GUNICORN_MAX_REQUESTS      recycle a worker after this many requests (0 = never)
+    GUNICORN_ACCESS_LOG        true to log every request (off: metrics already count them)
+
+In-process state (caches, circuit breakers, rate limiters, metrics) is per
+worker, except the gateway response cache's generations, which live in memory
+shared by the workers forked from a preloaded master. Anything that can't be shared across a fork (SQLite connections, the
+log listener thread) re-creates itself in the child via os.register_at_fork.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '25'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+backlog = int(os.getenv('GUNICORN_BACKLOG', '2048'))
+
+# Worker heartbeats on tmpfs: a slow container disk must not look like a hung worker
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+errorlog = '-'
+accesslog = '-' if os.getenv('GUNICORN_ACCESS_LOG', 'false').lower() == 'true' else None
+
+
+def when_ready(server):
+    server.log.info("Serving on %s with %d workers x %d threads (%s)", bind, workers, threads, worker_class)
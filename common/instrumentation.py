@@ -0,0 +1,233 @@
+# common/instrumentation.py
+"""
+Request tracing and Prometheus metrics shared by all four services.
+
+- Every request carries an X-Request-ID. The gateway mints one (or keeps the
+  caller's) and its service clients forward it, so one ID follows a request
+  through every hop and every log line.
+- span("weather") times a block of work inside the current request. Spans are
+  returned to the caller as a Server-Timing header and feed the hop latency
+  histogram. Browser devtools show the header; benchmarks/load_test.py parses
+  it into per-span p50/p95/p99 for each endpoint.
+- /metrics serves request latency histograms, error counts, span latencies and
+  any service-specific counters (fallbacks, cache hits...) in the Prometheus
+  text format. No client library needed.
+
+The current trace lives in a contextvar: asyncio tasks inherit it, thread
+pools need contextvars.copy_context().run (see run_in_context).
+"""
+import contextvars
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+TRACE_HEADER = "X-Request-ID"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+_VALID_ID = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+
+class Trace:
+    """One request as seen by this service: its ID and the spans timed so far"""
+
+    def __init__(self, trace_id=None, metrics=None):
+        self.id = trace_id if trace_id and _VALID_ID.match(trace_id) else uuid.uuid4().hex
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.spans.append((name, seconds))
+        if self.metrics is not None:
+            self.metrics.spans.observe(seconds, service=self.metrics.service, span=name)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total_name="app"):
+        with self._lock:
+            spans = list(self.spans)
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans]
+        entries.append(f"{total_name};dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace(trace_id=None, metrics=None):
+    trace = Trace(trace_id, metrics)
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+def current_trace_id():
+    trace = _current.get()
+    return trace.id if trace else None
+
+
+def run_in_context(pool, fn, *args, **kwargs):
+    """pool.submit that carries the current trace into the worker thread"""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts, count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    series[0][i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, count, total) in sorted(self._series.items()):
+                cumulative = 0
+                for upper, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if upper == float("inf") else repr(upper)
+                    lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (le,))} {cumulative}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total:.6f}")
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Metrics:
+    """Per-service registry with the request/span metrics every service shares"""
+
+    def __init__(self, service):
+        self.service = service
+        self._metrics = []
+        self._gauges = {}
+        self.requests = self.histogram(
+            "http_request_duration_seconds", "Request latency by route", ("service", "method", "route", "status"))
+        self.errors = self.counter(
+            "http_request_errors_total", "Requests answered with a 5xx", ("service", "route"))
+        self.spans = self.histogram(
+            "span_duration_seconds", "Time spent in each hop/span inside a request", ("service", "span"))
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, read):
+        """read() -> {label tuple or (): value}, evaluated at scrape time"""
+        self._gauges[name] = (help_text, read)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, (help_text, read) in self._gauges.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for labels, value in read().items():
+                lines.append(f"{name}{_labels(tuple(k for k, _ in labels), tuple(v for _, v in labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics_by_service = {}
+
+
+def metrics_for(service):
+    if service not in _metrics_by_service:
+        _metrics_by_service[service] = Metrics(service)
+    return _metrics_by_service[service]
+
+
+@contextmanager
+def span(name):
+    """Time a block as a named hop of the current request (no-op outside a request)"""
+    trace = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add(name, time.perf_counter() - start)
+
+
+def instrument_flask(app, service):
+    """Trace every request, add X-Request-ID/Server-Timing headers and serve /metrics"""
+    from flask import Response, g, request
+
+    metrics = metrics_for(service)
+
+    @app.before_request
+    def _start_trace():
+        g.trace = start_trace(request.headers.get(TRACE_HEADER), metrics)
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = getattr(g, "trace", None)
+        if trace is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.requests.observe(trace.elapsed(), service=service, method=request.method,
+                                 route=route, status=response.status_code)
+        if response.status_code >= 500:
+            metrics.errors.inc(service=service, route=route)
+        response.headers[TRACE_HEADER] = trace.id
+        response.headers["Server-Timing"] = trace.server_timing()
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    return metrics
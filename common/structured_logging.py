@@ -0,0 +1,196 @@
+# common/structured_logging.py
+"""
+JSON logging shared by all four services.
+
+- One JSON object per line on stdout: time, level, service, logger, message,
+  the current X-Request-ID and any extra={...} fields.
+- Request threads never write to stdout themselves: records go onto a bounded
+  queue and a single listener thread formats and writes them. When the queue
+  is full the record is dropped and counted rather than blocking the request.
+- High-frequency success events are logged with extra={"sampled": True};
+  only 1 in round(1 / LOG_SAMPLE_RATE) of each such message is kept, and the
+  kept line says so ("sample_1_in"), so counts can be scaled back up.
+- API keys, tokens and passwords are redacted from messages and fields, as
+  are the values of the secret environment variables.
+
+    log = setup_logging("weather")
+    log.info("Weather fetched", extra={"city": city, "sampled": True})
+
+LOG_LEVEL (INFO), LOG_FORMAT (json | text), LOG_SAMPLE_RATE (0.01) and
+LOG_QUEUE_SIZE (10000) configure it.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from instrumentation import current_trace_id, metrics_for
+
+SECRET_ENV_VARS = ("WEATHER_API_KEY", "OPENWEATHER_API_KEY", "CB_REDIS_URL", "RESPONSE_CACHE_REDIS_URL")
+SECRET_FIELD = re.compile(r"(api[_-]?key|appid|token|secret|password|authorization)", re.IGNORECASE)
+SECRET_IN_TEXT = re.compile(r"((?:api[_-]?key|appid|token|secret|password)[\"']?\s*[=:]\s*[\"']?)([^\s&\"',}]+)",
+                            re.IGNORECASE)
+URL_PASSWORD = re.compile(r"(://[^:/@\s]*:)([^@\s]+)(@)")
+REDACTED = "[REDACTED]"
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+def redact(text, secrets=()):
+    text = SECRET_IN_TEXT.sub(lambda m: m.group(1) + REDACTED, text)
+    text = URL_PASSWORD.sub(lambda m: m.group(1) + REDACTED + m.group(3), text)
+    for secret in secrets:
+        text = text.replace(secret, REDACTED)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service, secrets=()):
+        super().__init__()
+        self.service = service
+        self.secrets = secrets
+
+    def scrub(self, name, value):
+        if isinstance(value, bool):
+            return value
+        if SECRET_FIELD.search(str(name)):
+            return REDACTED
+        if isinstance(value, str):
+            return redact(value, self.secrets)
+        if isinstance(value, dict):
+            return {key: self.scrub(key, item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.scrub(name, item) for item in value]
+        return value
+
+    def fields(self, record):
+        return {name: self.scrub(name, value) for name, value in vars(record).items()
+                if name not in _RECORD_ATTRS and name != "sampled" and value is not None}
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": redact(record.getMessage(), self.secrets)
+        }
+        entry.update(self.fields(record))
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info), self.secrets)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(JsonFormatter):
+    """Human-readable variant for running a service in a terminal"""
+
+    def format(self, record):
+        fields = " ".join(f"{name}={value}" for name, value in self.fields(record).items())
+        line = (f"{datetime.fromtimestamp(record.created).strftime('%H:%M:%S')} {record.levelname:<7} "
+                f"{record.name}: {redact(record.getMessage(), self.secrets)} {fields}").rstrip()
+        if record.exc_info:
+            line += "\n" + redact(self.formatException(record.exc_info), self.secrets)
+        return line
+
+
+class SuccessSampler(logging.Filter):
+    """Keeps 1 in `every` of each sampled message; unsampled records always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False) or self.every == 1:
+            return True
+        if not self.every:
+            return False
+        with self._lock:
+            seen = self._seen.get(record.msg, 0)
+            self._seen[record.msg] = seen + 1
+        if seen % self.every:
+            return False
+        record.sample_1_in = self.every
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of waiting on a full queue"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; only capture what can't wait:
+        # the request ID (a contextvar) and the final message text
+        if not hasattr(record, "request_id"):
+            record.request_id = current_trace_id()
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+
+
+def setup_logging(service):
+    """Route the root logger through the queue to stdout as JSON; returns the service's logger"""
+    global _listener, _handler
+    if _listener is not None:
+        return logging.getLogger(service)
+
+    secrets = tuple(value for value in (os.getenv(name) for name in SECRET_ENV_VARS) if value and len(value) >= 6)
+    formatter_class = TextFormatter if os.getenv("LOG_FORMAT", "json").lower() == "text" else JsonFormatter
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter_class(service, secrets))
+
+    _handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    _handler.addFilter(SuccessSampler(float(os.getenv("LOG_SAMPLE_RATE", "0.01"))))
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_stop_listener)  # flush what's queued on shutdown
+    # The listener thread doesn't survive a fork (gunicorn --preload): give each worker its own
+    os.register_at_fork(after_in_child=_restart_listener)
+
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    # httpx logs every outgoing request at INFO; the spans and metrics already cover that
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    metrics_for(service).gauge("log_records_dropped", "Log records dropped because the log queue was full",
+                               lambda: {(): dropped_records()})
+    return logging.getLogger(service)
+
+
+def _restart_listener():
+    global _listener
+    _handler.queue = queue.Queue(maxsize=_handler.queue.maxsize)
+    _handler.dropped = 0
+    _listener = QueueListener(_handler.queue, *_listener.handlers, respect_handler_level=False)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def dropped_records():
+    return _handler.dropped if _handler else 0
@@ -0,0 +1,96 @@
+# common/wire.py
+"""
+Wire format for the gateway's calls to the internal services.
+
+Browsers and other external clients keep getting JSON. The gateway's clients
+ask for more (see INTERNAL_HEADERS):
+
+    Accept: application/x-msgpack   -> msgpack body instead of JSON
+    Prefer: return=minimal          -> only the fields the gateway reads,
+                                       nothing echoed back from the request
+
+and send their own request bodies as msgpack. Services answer with
+respond(), which honours both headers, and read bodies with request_body(),
+which takes either encoding.
+
+msgpack is optional: if it isn't installed, or INTERNAL_WIRE_FORMAT=json
+(e.g. while a rolling deploy mixes old and new services), everything stays
+JSON and only the minimal shapes remain.
+"""
+import json
+import os
+from datetime import date, datetime
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK = "application/x-msgpack"
+JSON = "application/json"
+MINIMAL = "return=minimal"
+
+USE_MSGPACK = msgpack is not None and os.getenv("INTERNAL_WIRE_FORMAT", "msgpack").lower() == "msgpack"
+INTERNAL_HEADERS = {"Accept": f"{MSGPACK}, {JSON};q=0.5" if USE_MSGPACK else JSON, "Prefer": MINIMAL}
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def packb(body):
+    return msgpack.packb(body, default=_default, use_bin_type=True)
+
+
+def unpackb(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def encode(body):
+    """Request body for an internal call -> (bytes, content type)"""
+    if USE_MSGPACK:
+        return packb(body), MSGPACK
+    return json.dumps(body, default=_default).encode(), JSON
+
+
+def decode(response):
+    """Body of a requests/httpx response in whichever format the service chose"""
+    if response.headers.get("Content-Type", "").startswith(MSGPACK):
+        return unpackb(response.content)
+    return response.json()
+
+
+# Flask side
+
+def wants_minimal():
+    from flask import request
+    return MINIMAL in request.headers.get("Prefer", "")
+
+
+def respond(body, status=200, headers=None):
+    """jsonify(body), unless the caller asked for msgpack and we can produce it"""
+    from flask import Response, jsonify, request
+
+    if msgpack is not None and request.accept_mimetypes.best_match([JSON, MSGPACK]) == MSGPACK:
+        response = Response(packb(body), status=status, mimetype=MSGPACK)
+    else:
+        response = jsonify(body)
+        response.status_code = status
+    response.headers.update(headers or {})
+    response.vary.add("Accept")
+    response.vary.add("Prefer")
+    return response
+
+
+def request_body():
+    """Decoded JSON or msgpack request body, or None if missing/malformed"""
+    from flask import request
+
+    if request.mimetype == MSGPACK and msgpack is not None:
+        try:
+            return unpackb(request.get_data())
+        except Exception:
+            return None
+    return request.get_json(silent=True)
@@ -1,14 +1,42 @@
-from flask import Flask, jsonify, request
-import requests
+from flask import Flask, g, jsonify, request
+import atexit
+import hmac
+import json
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
 from flask_cors import CORS  
 import os
+import sys
 from dotenv import load_dotenv
 from pathlib import Path
+# Shared modules: ../common when run from the repo, copied next to this file in the image
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from instrumentation import TRACE_HEADER, instrument_flask, run_in_context
+from structured_logging import setup_logging
+from wire import decode
+from http_clients import client_from_env
+from bulkhead import admission_from_env, bulkheads_from_env, queued_since
+from circuit_breaker import OPEN, CLOSED, HALF_OPEN, backend_from_env, breaker_from_env
+from health_monitor import HealthMonitor
+from last_known_good import Hedger, last_known_good_from_env, staleness
+from materializer import materializer_from_env
+from response_cache import normalize_city, response_cache_from_env
 
+log = setup_logging("gateway")
 app = Flask(__name__)
-CORS(app)  
+CORS(app, expose_headers=[TRACE_HEADER, "Server-Timing"])
+metrics = instrument_flask(app, "gateway")
+fallbacks = metrics.counter("gateway_fallbacks_total", "Responses built from fallback data", ("service",))
+bulkhead_rejections = metrics.counter("gateway_bulkhead_rejections_total",
+                                      "Downstream calls answered by fallback because the bulkhead was full", ("service",))
+admission_rejections = metrics.counter("gateway_admission_rejections_total", "Requests shed with a 503")
+admission_queue = metrics.histogram("gateway_admission_queue_seconds", "Time requests spent queued before admission")
+last_known_good_served = metrics.counter("gateway_last_known_good_total",
+                                         "Answers served from last-known-good data, on failure or to hedge a slow call",
+                                         ("service", "reason"))
+materialized_hits = metrics.counter("gateway_materialized_responses_total",
+                                    "Responses built from precomputed hot-city outfits", ("route",))
 
 # Service URLs
 env_locations = [
@@ -22,32 +50,167 @@ WEATHER_SERVICE = os.getenv('WEATHER_SERVICE_URL', 'http://weather-service:5001'
 OUTFIT_SERVICE = os.getenv('OUTFIT_SERVICE_URL', 'http://outfit-service:5002')
 WARDROBE_SERVICE = os.getenv('WARDROBE_SERVICE_URL', 'http://wardrobe-service:5003')
 
-# Circuit breaker state
-service_status = {
-    "weather": {"healthy": True, "last_failure": None, "failure_count": 0},
-    "outfit": {"healthy": True, "last_failure": None, "failure_count": 0},
-    "wardrobe": {"healthy": True, "last_failure": None, "failure_count": 0}
-}
+# Pooled keep-alive clients, one per downstream service
+weather_client = client_from_env("weather", WEATHER_SERVICE, timeout=3)
+outfit_client = client_from_env("outfit", OUTFIT_SERVICE, timeout=3)
+wardrobe_client = client_from_env("wardrobe", WARDROBE_SERVICE, timeout=5)
+service_clients = {"weather": weather_client, "outfit": outfit_client, "wardrobe": wardrobe_client}
+
+# Overall time budget for one /smart-outfit request, shared by all downstream calls
+SMART_OUTFIT_BUDGET = float(os.getenv('SMART_OUTFIT_BUDGET', '6'))
+
+# /weather/batch waits for many upstream fetches, so it gets a longer timeout
+WEATHER_BATCH_TIMEOUT = float(os.getenv('WEATHER_BATCH_TIMEOUT', '15'))
+# Same for the materializer's streamed multi-user wardrobe matches
+WARDROBE_BATCH_TIMEOUT = float(os.getenv('WARDROBE_BATCH_TIMEOUT', '30'))
+
+# Bounded pool used to overlap independent downstream calls
+fanout_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('GATEWAY_FANOUT_WORKERS', '32')),
+    thread_name_prefix='fanout'
+)
+
+class Deadline:
+    """Per-request time budget; each downstream call gets whatever is left"""
+
+    def __init__(self, budget):
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, cap):
+        return min(cap, self.remaining())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+# Circuit breakers, one per downstream; state is shared through the backend
+breaker_backend = backend_from_env()
+breakers = {name: breaker_from_env(name, breaker_backend) for name in ("weather", "outfit", "wardrobe")}
 
 def circuit_breaker(service_name):
-    """Simple circuit breaker pattern"""
-    service = service_status[service_name]
-    
-    if not service["healthy"] and service["last_failure"]:
-        time_since_failure = datetime.now() - service["last_failure"]
-        if time_since_failure < timedelta(minutes=1):
-            return False
-    return True
-
-def report_service_failure(service_name):
-    service_status[service_name]["healthy"] = False
-    service_status[service_name]["last_failure"] = datetime.now()
-    service_status[service_name]["failure_count"] += 1
-    print(f"🔴 {service_name} service marked as unhealthy")
-
-def report_service_success(service_name):
-    service_status[service_name]["healthy"] = True
-    print(f"🟢 {service_name} service recovered")
+    """True if a call to service_name may go ahead (closed, or a half-open probe slot)"""
+    return breakers[service_name].allow_request()
+
+def report_service_failure(service_name, duration=None):
+    if breakers[service_name].record_failure(duration) == OPEN:
+        log.warning("%s service marked as unhealthy", service_name, extra={"downstream": service_name})
+
+def report_service_success(service_name, duration=None):
+    transition = breakers[service_name].record_success(duration)
+    if transition == CLOSED:
+        log.info("%s service recovered", service_name, extra={"downstream": service_name})
+    elif transition == OPEN:
+        log.warning("%s service too slow, marked as unhealthy", service_name, extra={"downstream": service_name})
+
+def circuit_breaker_state():
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
+
+# Concurrency caps per downstream, so one slow service can't hold every worker thread
+bulkheads = bulkheads_from_env(("weather", "outfit", "wardrobe"))
+
+def enter_bulkhead(service_name):
+    """
+    True if a call to service_name fits in its bulkhead (release it afterwards); False means fall back now.
+    Enter it before asking the breaker, so a half-open probe is only granted to a call that will be made.
+    """
+    if bulkheads[service_name].try_acquire():
+        return True
+    bulkhead_rejections.inc(service=service_name)
+    log.info("%s bulkhead full, using fallback", service_name, extra={"downstream": service_name, "sampled": True})
+    return False
+
+# Load shedding in front of the routes. Queued requests wait on their worker
+# thread, so running plus queued requests are kept two below the thread count
+# and /health and the other exempt routes always find a thread.
+ADMISSION_THREADS = max(2, int(os.getenv('GUNICORN_THREADS', '16')) - 2)
+admission = admission_from_env(ADMISSION_THREADS - ADMISSION_THREADS // 4, ADMISSION_THREADS // 4)
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_EXEMPT = {"/health", "/metrics", "/service-status", "/client-pools", "/cache/stats",
+                    "/cache/invalidate", "/materialized/stats"}
+
+def shed_load(controller):
+    """(body, headers) for a request turned away by admission control"""
+    admission_rejections.inc()
+    retry_after = controller.retry_after()
+    return {"error": "Gateway overloaded, try again shortly", "retry_after": retry_after}, \
+        {"Retry-After": str(retry_after)}
+
+# Probes every downstream in the background; /service-status serves its snapshot.
+# Its results never count as breaker calls, they only hold back half-open probes
+# to a service that is failing its health checks.
+health_monitor = HealthMonitor(
+    service_clients,
+    interval=float(os.getenv('HEALTH_CHECK_INTERVAL', '10')),
+    timeout=float(os.getenv('HEALTH_CHECK_TIMEOUT', '2'))
+)
+HEALTH_MONITOR_ENABLED = os.getenv('HEALTH_MONITOR_ENABLED', 'true').lower() == 'true'
+if HEALTH_MONITOR_ENABLED:
+    for breaker in breakers.values():
+        breaker.probe_gate = health_monitor.reachable
+
+# Whole-response cache for the city endpoints, per user for /smart-outfit
+response_cache = response_cache_from_env()
+
+# /cache/invalidate sits on the public port, so callers must present the token
+# shared with the wardrobe service; without CACHE_INVALIDATE_TOKEN it is off
+CACHE_INVALIDATE_TOKEN = os.getenv('CACHE_INVALIDATE_TOKEN', '')
+INVALIDATE_TOKEN_HEADER = "X-Invalidate-Token"
+
+def invalidation_allowed(token):
+    return bool(CACHE_INVALIDATE_TOKEN) and \
+        hmac.compare_digest((token or "").encode(), CACHE_INVALIDATE_TOKEN.encode())
+
+# Real weather/outfit answers from before an outage, served by the fallbacks
+last_known_good = last_known_good_from_env()
+atexit.register(last_known_good.save)
+
+# A live weather/outfit call slower than HEDGE_BUDGET_MS is answered from
+# last-known-good data no older than HEDGE_MAX_AGE, while the call finishes in
+# the background and refreshes it; 0 turns hedging off
+HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET_MS', '1000')) / 1000
+HEDGE_MAX_AGE = float(os.getenv('HEDGE_MAX_AGE', '900'))
+hedger = Hedger(
+    ThreadPoolExecutor(max_workers=int(os.getenv('GATEWAY_HEDGE_WORKERS', '16')), thread_name_prefix='hedge'),
+    HEDGE_BUDGET
+)
+
+# Scrape-time views of state the gateway already keeps
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+metrics.gauge("gateway_circuit_breaker_state", "Breaker state per downstream: 0=closed, 1=half_open, 2=open",
+              lambda: {(("service", name),): BREAKER_STATE_VALUES[state["state"]]
+                       for name, state in circuit_breaker_state().items()})
+metrics.gauge("gateway_bulkhead_in_use", "Calls in flight per downstream bulkhead",
+              lambda: {(("service", name),): bulkhead.in_use for name, bulkhead in bulkheads.items()})
+metrics.gauge("gateway_admission_in_flight", "Admitted requests in flight", lambda: {(): admission.in_flight})
+metrics.gauge("gateway_admission_waiting", "Requests waiting for admission", lambda: {(): admission.waiting})
+metrics.gauge("gateway_response_cache_lookups", "Response cache lookups by result",
+              lambda: {(("result", "hit"),): response_cache.hits, (("result", "miss"),): response_cache.misses})
+
+@app.before_request
+def admit_request():
+    if not ADMISSION_ENABLED or request.path in ADMISSION_EXEMPT:
+        return None
+    admitted, queued = admission.enter(queued_since(request.headers.get("X-Request-Start")))
+    admission_queue.observe(queued)
+    if not admitted:
+        body, headers = shed_load(admission)
+        return jsonify(body), 503, headers
+    g.admitted = True
+
+@app.teardown_request
+def release_admission(exc=None):
+    if g.pop("admitted", False):
+        admission.leave()
+
+@app.before_request
+def ensure_health_monitor():
+    # Started lazily (and once per worker process) so forked workers get their own thread
+    if HEALTH_MONITOR_ENABLED:
+        health_monitor.start()
+    materializer.start()
+    last_known_good.start()
 
 @app.route('/health')
 def health():
@@ -57,91 +220,256 @@ def health():
         "timestamp": datetime.now().isoformat()
     })
 
+@app.route('/client-pools')
+def client_pools():
+    """Connection-count and pool-wait metrics, for sizing pools per replica"""
+    return jsonify({name: client.stats() for name, client in service_clients.items()})
+
 @app.route('/service-status')
 def service_status_route():
-    status = {}
-    
-    # Check weather service
-    try:
-        response = requests.get(f"{WEATHER_SERVICE}/health", timeout=2)
-        status["weather"] = {"status": "healthy", "response": response.json()}
-        report_service_success("weather")
-    except:
-        status["weather"] = {"status": "unhealthy", "error": "Cannot connect"}
-        report_service_failure("weather")
-    
-    # Check outfit service
-    try:
-        response = requests.get(f"{OUTFIT_SERVICE}/health", timeout=2)
-        status["outfit"] = {"status": "healthy", "response": response.json()}
-        report_service_success("outfit")
-    except:
-        status["outfit"] = {"status": "unhealthy", "error": "Cannot connect"}
-        report_service_failure("outfit")
-        
-    # Check wardrobe service
-    try:
-        response = requests.get(f"{WARDROBE_SERVICE}/health", timeout=2)
-        status["wardrobe"] = {"status": "healthy", "response": response.json()}
-        report_service_success("wardrobe")
-    except:
-        status["wardrobe"] = {"status": "unhealthy", "error": "Cannot connect"}
-        report_service_failure("wardrobe")
-    
+    # Answered from the background monitor's last probe, never probes inline
     return jsonify({
-        "microservices_status": status,
-        "circuit_breaker_state": service_status
+        "microservices_status": health_monitor.snapshot(),
+        "circuit_breaker_state": circuit_breaker_state(),
+        "bulkheads": {name: bulkhead.snapshot() for name, bulkhead in bulkheads.items()},
+        "admission": admission.snapshot(),
+        "last_known_good": {**last_known_good.stats(), "hedged_calls": hedger.hedged}
     })
 
-def get_weather_with_fallback(city):
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """Called by the wardrobe service when a user's clothes change; no user_id clears everything"""
+    if not invalidation_allowed(request.headers.get(INVALIDATE_TOKEN_HEADER)):
+        return jsonify({"error": "Cache invalidation is for internal callers only"}), 403
+    body = request.get_json(silent=True) if request.data else {}
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object, optionally with a user_id"}), 400
+    user_id = body.get("user_id")
+    invalidate_caches(user_id)
+    return jsonify({"invalidated": user_id or "all"})
+
+def invalidate_caches(user_id=None):
+    """Drop the user's cached and materialized outfits, or everyone's"""
+    if user_id:
+        response_cache.invalidate_user(user_id)
+        materializer.invalidate_user(user_id)
+    else:
+        response_cache.clear()
+        materializer.clear()
+
+@app.route('/materialized/stats')
+def materialized_stats():
+    return jsonify(materializer.stats())
+
+def cache_lookup(endpoint, city, user_id=None, bypass=False):
+    """(key, (body, age) or None); `Cache-Control: no-cache` from the client skips the read"""
+    key = response_cache.key(endpoint, city, user_id)
+    return key, None if bypass else response_cache.get(key)
+
+def cache_store(endpoint, key, body, user_id=None):
+    """Cache a freshly built response unless it contains fallback data; returns its headers"""
+    live = all(status == "live" for status in body["system_status"].values())
+    if live:
+        response_cache.set(endpoint, key, body)
+    return response_cache.headers(endpoint, user_id, cacheable=live)
+
+def materialized_response(endpoint, city, user_id=None):
+    """(body, headers) built from the hot-city materializer, or None if it has nothing current"""
+    if endpoint == "smart-outfit":
+        found = materializer.smart_outfit(city, user_id)
+        if found is None:
+            return None
+        weather_data, outfit_data, wardrobe_data, age = found
+        body = build_smart_outfit_result(city, weather_data, outfit_data, wardrobe_data)
+    else:
+        found = materializer.outfit_for_city(city)
+        if found is None:
+            return None
+        weather_data, outfit_data, age = found
+        body = build_outfit_for_city_result(city, weather_data, outfit_data)
+    materialized_hits.inc(route=endpoint)
+    return body, {**response_cache.headers(endpoint, user_id, age), "X-Cache": "MATERIALIZED"}
+
+def bypass_cache():
+    return "no-cache" in request.headers.get("Cache-Control", "")
+
+def get_weather_with_fallback(city, deadline=None):
+    """Live weather, hedged with recent last-known-good data when there is some"""
+    recent = last_known_good.weather(city, HEDGE_MAX_AGE) if HEDGE_BUDGET > 0 else None
+    if recent is None:
+        return fetch_weather(city, deadline)
+    # The shared live call runs on its own timeout; each caller waits at most its own budget
+    weather = hedger.call(last_known_good.weather_key(city), fetch_weather, city,
+                          timeout=deadline.remaining() if deadline else None)
+    if weather is None:
+        # Too slow: answer now, the live call refreshes the store when it lands
+        return stale_weather(*recent, reason="hedge")
+    return weather
+
+def remember_weather(city, weather):
+    last_known_good.put(last_known_good.weather_key(city), weather)
+    return weather
+
+def stale_weather(weather, stored_at, reason):
+    last_known_good_served.inc(service="weather", reason=reason)
+    return {
+        **weather,
+        **staleness(stored_at),
+        "source": "last_known_good",
+        "message": "Last known weather while the weather service recovers"
+    }
+
+def fetch_weather(city, deadline=None):
+    """One live weather call; fallback data if it can't be made or fails"""
+    timeout = deadline.timeout(weather_client.timeout) if deadline else None
+    if timeout is not None and timeout <= 0:
+        log.warning("Request budget exhausted before weather call, using fallback", extra={"city": city})
+        return fallback_weather(city)
+    
+    if not enter_bulkhead("weather"):
+        return fallback_weather(city)
+    
     if not circuit_breaker("weather"):
-        print(f"⏸️ Circuit breaker open for weather service, using fallback")
+        bulkheads["weather"].release()
+        log.info("Circuit breaker open for weather service, using fallback", extra={"sampled": True})
         return fallback_weather(city)
     
+    start = time.monotonic()
     try:
-        response = requests.get(f"{WEATHER_SERVICE}/weather/{city}", timeout=3)
+        response = weather_client.get(f"/weather/{city}", timeout=timeout)
         if response.status_code == 200:
-            report_service_success("weather")
-            return response.json()
+            report_service_success("weather", time.monotonic() - start)
+            return remember_weather(city, decode(response))
+        elif response.status_code == 429:
+            # Weather is up but over its API quota: fall back without tripping the breaker
+            log.warning("Weather service throttled, using fallback", extra={"city": city})
+            breakers["weather"].release()
+            return fallback_weather(city)
         else:
-            report_service_failure("weather")
+            report_service_failure("weather", time.monotonic() - start)
             return fallback_weather(city)
     except Exception as e:
-        print(f"❌ Weather service error: {e}")
-        report_service_failure("weather")
+        log.error("Weather service error: %s", e)
+        report_service_failure("weather", time.monotonic() - start)
         return fallback_weather(city)
+    finally:
+        bulkheads["weather"].release()
+
+def get_weather_batch_with_fallback(cities):
+    """One weather-service call for many cities; every city falls back if the service can't answer"""
+    if not enter_bulkhead("weather"):
+        return fallback_weather_batch(cities)
+    
+    if not circuit_breaker("weather"):
+        bulkheads["weather"].release()
+        log.info("Circuit breaker open for weather service, using fallback", extra={"sampled": True})
+        return fallback_weather_batch(cities)
+    
+    start = time.monotonic()
+    try:
+        response = weather_client.post("/weather/batch", json={"cities": cities}, timeout=WEATHER_BATCH_TIMEOUT)
+        if response.status_code == 200:
+            report_service_success("weather", time.monotonic() - start)
+            return remember_weather_batch(decode(response))
+        if response.status_code == 400:
+            breakers["weather"].release()
+            return decode(response)  # our request was bad, not the service
+        report_service_failure("weather", time.monotonic() - start)
+        return fallback_weather_batch(cities)
+    except Exception as e:
+        log.error("Weather service error: %s", e)
+        report_service_failure("weather", time.monotonic() - start)
+        return fallback_weather_batch(cities)
+    finally:
+        bulkheads["weather"].release()
+
+def remember_weather_batch(result):
+    for city, weather in result.get("results", {}).items():
+        remember_weather(city, weather)
+    return result
+
+def fallback_weather_batch(cities):
+    return {
+        "results": {normalize_city(city): fallback_weather(city) for city in cities},
+        "errors": {},
+        "source": "fallback"
+    }
 
 def fallback_weather(city):
-    print(f"🔄 Using fallback weather data for {city}")
+    fallbacks.inc(service="weather")
+    known = last_known_good.weather(city)
+    if known:
+        return stale_weather(*known, reason="fallback")
+    log.debug("Using default weather data", extra={"city": city})
     return {
         "city": city,
         "temperature": 20,
         "condition": "clear",
         "humidity": 50,
         "source": "fallback",
-        "message": "Using cached data while weather service recovers"
+        "message": "Weather service unavailable and no recent data for this city, showing defaults"
     }
 
-def get_outfit_with_fallback(temperature, condition):
+def get_outfit_with_fallback(temperature, condition, deadline=None):
+    """Live recommendation, hedged with a recent last-known-good one when there is one"""
+    recent = last_known_good.outfit(temperature, condition, HEDGE_MAX_AGE, slack=0) if HEDGE_BUDGET > 0 else None
+    if recent is None:
+        return fetch_outfit(temperature, condition, deadline)
+    outfit = hedger.call(last_known_good.outfit_key(temperature, condition), fetch_outfit,
+                         temperature, condition, timeout=deadline.remaining() if deadline else None)
+    if outfit is None:
+        return stale_outfit(*recent, reason="hedge")
+    return outfit
+
+def remember_outfit(temperature, condition, outfit):
+    last_known_good.put(last_known_good.outfit_key(temperature, condition), outfit["recommendation"])
+    return outfit
+
+def stale_outfit(recommendation, stored_at, reason):
+    last_known_good_served.inc(service="outfit", reason=reason)
+    return {"recommendation": {**recommendation, **staleness(stored_at), "source": "last_known_good"}}
+
+def fetch_outfit(temperature, condition, deadline=None):
+    """One live outfit-service call; fallback data if it can't be made or fails"""
+    timeout = deadline.timeout(outfit_client.timeout) if deadline else None
+    if timeout is not None and timeout <= 0:
+        log.warning("Request budget exhausted before outfit call, using fallback")
+        return fallback_outfit(temperature, condition)
+    
+    if not enter_bulkhead("outfit"):
+        return fallback_outfit(temperature, condition)
+    
     if not circuit_breaker("outfit"):
-        print(f"⏸️ Circuit breaker open for outfit service, using fallback")
+        bulkheads["outfit"].release()
+        log.info("Circuit breaker open for outfit service, using fallback", extra={"sampled": True})
         return fallback_outfit(temperature, condition)
     
+    start = time.monotonic()
     try:
-        response = requests.get(f"{OUTFIT_SERVICE}/recommend/{temperature}/{condition}", timeout=3)
+        response = outfit_client.get(f"/recommend/{temperature}/{condition}", timeout=timeout)
         if response.status_code == 200:
-            report_service_success("outfit")
-            return response.json()
+            report_service_success("outfit", time.monotonic() - start)
+            return remember_outfit(temperature, condition, decode(response))
         else:
-            report_service_failure("outfit")
+            report_service_failure("outfit", time.monotonic() - start)
             return fallback_outfit(temperature, condition)
     except Exception as e:
-        print(f"❌ Outfit service error: {e}")
-        report_service_failure("outfit")
+        log.error("Outfit service error: %s", e)
+        report_service_failure("outfit", time.monotonic() - start)
         return fallback_outfit(temperature, condition)
+    finally:
+        bulkheads["outfit"].release()
 
 def fallback_outfit(temperature, condition):
-    print("🔄 Using fallback outfit recommendation")
+    fallbacks.inc(service="outfit")
+    known = last_known_good.outfit(temperature, condition)
+    if known:
+        return stale_outfit(*known, reason="fallback")
+    log.debug("Using default outfit recommendation")
     
     if temperature > 25:
         outfit = {"base": "t-shirt", "footwear": "sandals", "accessories": ["sunglasses"]}
@@ -160,71 +488,209 @@ def fallback_outfit(temperature, condition):
     }
 
 
-@app.route('/smart-outfit/<city>')
-def get_smart_outfit_from_wardrobe(city):
-    """
-    ULTIMATE endpoint: Real weather + recommendations + YOUR actual clothes!
-    """
-    print(f"🎯 Getting SMART outfit for {city} using real wardrobe")
+def wardrobe_unavailable(reason):
+    """Error result for the wardrobe hop; /smart-outfit reports it as a fallback"""
+    fallbacks.inc(service="wardrobe")
+    return {"error": reason}
+
+def get_wardrobe_match(temperature, condition, recommendation=None, user_id="user123", deadline=None):
+    """Match the user's real clothes to the weather; returns an error dict on failure"""
+    timeout = deadline.timeout(wardrobe_client.timeout) if deadline else None
+    if timeout is not None and timeout <= 0:
+        return wardrobe_unavailable("Request budget exhausted before wardrobe call")
     
-    # 1. Get real weather
-    weather_data = get_weather_with_fallback(city)
+    if not enter_bulkhead("wardrobe"):
+        return wardrobe_unavailable("Wardrobe bulkhead full")
     
-    # 2. Get general recommendation
-    temperature = weather_data["temperature"]
-    condition = weather_data["condition"].lower()
-    outfit_recommendation = get_outfit_with_fallback(temperature, condition)
+    if not circuit_breaker("wardrobe"):
+        bulkheads["wardrobe"].release()
+        return wardrobe_unavailable("Wardrobe circuit breaker open")
     
-    # 3. Match with actual clothes from wardrobe
-    wardrobe_data = {}
+    start = time.monotonic()
     try:
-        if circuit_breaker("wardrobe"):
-            wardrobe_url = f"{WARDROBE_SERVICE}/clothes/match"
-            wardrobe_payload = {
-                "temperature": temperature,
-                "condition": condition,
-                "recommendation": outfit_recommendation["recommendation"],
-                "user_id": "user123"
-            }
-            
-            wardrobe_response = requests.post(wardrobe_url, json=wardrobe_payload, timeout=5)
-            
-            if wardrobe_response.status_code == 200:
-                wardrobe_data = wardrobe_response.json()
-                report_service_success("wardrobe")
-            else:
-                wardrobe_data = {"error": "Wardrobe service unavailable"}
-                report_service_failure("wardrobe")
+        wardrobe_payload = {
+            "temperature": temperature,
+            "condition": condition,
+            "user_id": user_id
+        }
+        if recommendation is not None:
+            wardrobe_payload["recommendation"] = recommendation
+        
+        wardrobe_response = wardrobe_client.post("/clothes/match", json=wardrobe_payload, timeout=timeout)
+        
+        if wardrobe_response.status_code == 200:
+            report_service_success("wardrobe", time.monotonic() - start)
+            return decode(wardrobe_response)
         else:
-            wardrobe_data = {"error": "Wardrobe circuit breaker open"}
+            report_service_failure("wardrobe", time.monotonic() - start)
+            return wardrobe_unavailable("Wardrobe service unavailable")
     except Exception as e:
-        print(f"❌ Wardrobe service error: {e}")
-        wardrobe_data = {"error": "Cannot connect to wardrobe service"}
-        report_service_failure("wardrobe")
+        log.error("Wardrobe service error: %s", e)
+        report_service_failure("wardrobe", time.monotonic() - start)
+        return wardrobe_unavailable("Cannot connect to wardrobe service")
+    finally:
+        bulkheads["wardrobe"].release()
+
+def get_wardrobe_matches(temperature, condition, recommendation, user_ids):
+    """
+    {user_id: match} for many users from one streamed /clothes/match/batch call;
+    users the stream didn't get to are left out. Used by the materializer.
+    """
+    if not enter_bulkhead("wardrobe"):
+        return {}
+    if not circuit_breaker("wardrobe"):
+        bulkheads["wardrobe"].release()
+        return {}
     
-    # 4. Build complete response
-    result = {
+    start = time.monotonic()
+    matches = {}
+    try:
+        response = wardrobe_client.post("/clothes/match/batch", json={
+            "temperature": temperature,
+            "condition": condition,
+            "recommendation": recommendation,
+            "user_ids": user_ids,
+            "top_k": 3  # what /clothes/match returns by default, alternatives included
+        }, timeout=WARDROBE_BATCH_TIMEOUT, stream=True)
+        if response.status_code != 200:
+            report_service_failure("wardrobe", time.monotonic() - start)
+            return {}
+        complete = False
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            if result.get("done"):
+                complete = True
+            else:
+                matches[result["user_id"]] = {"matched_outfit": result["matched_outfit"],
+                                              "match_confidence": result["match_confidence"]}
+        if complete:
+            report_service_success("wardrobe", time.monotonic() - start)
+        else:
+            report_service_failure("wardrobe", time.monotonic() - start)
+    except Exception as e:
+        log.error("Wardrobe batch match error: %s", e)
+        report_service_failure("wardrobe", time.monotonic() - start)
+    finally:
+        bulkheads["wardrobe"].release()
+    return matches
+
+# Hot cities (MATERIALIZE_CITIES) kept precomputed in the background; off when unset
+materializer = materializer_from_env(fetch_weather, fetch_outfit, get_wardrobe_matches, response_cache.generation)
+
+
+def service_status(data):
+    """live, stale (last-known-good data) or fallback (defaults)"""
+    source = data.get("source")
+    if source == "last_known_good":
+        return "stale"
+    return "fallback" if source == "fallback" else "live"
+
+def build_smart_outfit_result(city, weather_data, outfit_recommendation, wardrobe_data):
+    temperature = weather_data["temperature"]
+    condition = weather_data["condition"].lower()
+    return {
         "city": city,
         "real_weather": weather_data,
         "general_recommendation": outfit_recommendation["recommendation"],
         "your_actual_outfit": wardrobe_data.get("matched_outfit", {}),
         "wardrobe_confidence": wardrobe_data.get("match_confidence", 0),
         "system_status": {
-            "weather_service": "live" if weather_data.get("source") != "fallback" else "fallback",
-            "outfit_service": "live" if outfit_recommendation["recommendation"].get("source") != "fallback" else "fallback",
+            "weather_service": service_status(weather_data),
+            "outfit_service": service_status(outfit_recommendation["recommendation"]),
             "wardrobe_service": "live" if "error" not in wardrobe_data else "fallback"
         },
         "fun_message": generate_fun_message(temperature, condition)
     }
+
+def build_outfit_for_city_result(city, weather_data, outfit_data):
+    temperature = weather_data["temperature"]
+    condition = weather_data["condition"].lower()
+    return {
+        "city": city,
+        "real_weather": weather_data,
+        "outfit_recommendation": outfit_data["recommendation"],
+        "system_status": {
+            "weather_service": service_status(weather_data),
+            "outfit_service": service_status(outfit_data["recommendation"])
+        },
+        "fun_message": generate_fun_message(temperature, condition)
+    }
+
+def parse_city_list(value):
+    return [city for city in value.split(",") if city.strip()]
+
+def valid_city_list(cities):
+    return isinstance(cities, list) and cities and all(isinstance(c, str) and c.strip() for c in cities)
+
+@app.route('/weather/batch', methods=['GET', 'POST'])
+def get_weather_batch():
+    """Dashboards: weather for many cities in one round trip (POST {"cities": [...]} or ?cities=a,b)"""
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        cities = body.get("cities") if isinstance(body, dict) else None
+    else:
+        cities = parse_city_list(request.args.get("cities", ""))
+    
+    if not valid_city_list(cities):
+        return jsonify({"error": "cities must be a non-empty list of city names"}), 400
+    
+    result = get_weather_batch_with_fallback(cities)
+    return jsonify(result), 400 if "results" not in result else 200
+
+@app.route('/smart-outfit/<city>')
+def get_smart_outfit_from_wardrobe(city):
+    """
+    ULTIMATE endpoint: Real weather + recommendations + YOUR actual clothes!
+    """
+    user_id = request.args.get('user_id', 'user123')
+    key, cached = cache_lookup("smart-outfit", city, user_id, bypass_cache())
+    if cached:
+        body, age = cached
+        return jsonify(body), 200, response_cache.headers("smart-outfit", user_id, age)
+    materialized = None if bypass_cache() else materialized_response("smart-outfit", city, user_id)
+    if materialized:
+        return jsonify(materialized[0]), 200, materialized[1]
     
-    return jsonify(result)
+    log.info("Getting smart outfit", extra={"city": city, "user_id": user_id, "sampled": True})
+    deadline = Deadline(SMART_OUTFIT_BUDGET)
+    
+    # 1. Get real weather - everything else depends on it
+    weather_data = get_weather_with_fallback(city, deadline)
+    temperature = weather_data["temperature"]
+    condition = weather_data["condition"].lower()
+    
+    # 2 + 3. The wardrobe match only needs temperature/condition, so it runs
+    # in the pool while this thread fetches the general recommendation
+    wardrobe_future = run_in_context(
+        fanout_pool, get_wardrobe_match, temperature, condition, None, user_id, deadline
+    )
+    outfit_recommendation = get_outfit_with_fallback(temperature, condition, deadline)
+    
+    try:
+        wardrobe_data = wardrobe_future.result(timeout=deadline.remaining())
+    except FutureTimeout:
+        wardrobe_data = wardrobe_unavailable("Wardrobe match exceeded request budget")
+    
+    # 4. Build complete response
+    body = build_smart_outfit_result(city, weather_data, outfit_recommendation, wardrobe_data)
+    return jsonify(body), 200, cache_store("smart-outfit", key, body, user_id)
 
 @app.route('/outfit-for-city/<city>')
 def get_outfit_for_city(city):
     """
     BASIC endpoint: Real weather + general recommendations
     """
-    print(f"🎯 Getting BASIC outfit for {city}")
+    key, cached = cache_lookup("outfit-for-city", city, bypass=bypass_cache())
+    if cached:
+        body, age = cached
+        return jsonify(body), 200, response_cache.headers("outfit-for-city", age=age)
+    materialized = None if bypass_cache() else materialized_response("outfit-for-city", city)
+    if materialized:
+        return jsonify(materialized[0]), 200, materialized[1]
+    
+    log.info("Getting basic outfit", extra={"city": city, "sampled": True})
     
     # 1. Get weather (with fallback)
     weather_data = get_weather_with_fallback(city)
@@ -236,18 +702,8 @@ def get_outfit_for_city(city):
     outfit_data = get_outfit_with_fallback(temperature, condition)
     
     # 3. Build response
-    result = {
-        "city": city,
-        "real_weather": weather_data,
-        "outfit_recommendation": outfit_data["recommendation"],
-        "system_status": {
-            "weather_service": "live" if weather_data.get("source") != "fallback" else "fallback",
-            "outfit_service": "live" if outfit_data["recommendation"].get("source") != "fallback" else "fallback"
-        },
-        "fun_message": generate_fun_message(temperature, condition)
-    }
-    
-    return jsonify(result)
+    body = build_outfit_for_city_result(city, weather_data, outfit_data)
+    return jsonify(body), 200, cache_store("outfit-for-city", key, body)
 
 def generate_fun_message(temp, condition):
     messages = {
@@ -260,11 +716,9 @@ def generate_fun_message(temp, condition):
     return messages.get(condition, "Looking great today! 💫")
 
 if __name__ == '__main__':
-    print("🚀 Starting RESILIENT Gateway Service")
-    print("🔗 Features: Circuit Breaker, Fallbacks, Health Checks")
-    print("📍 Endpoints:")
-    print("   http://localhost:8000/outfit-for-city/amizour")
-    print("   http://localhost:8000/smart-outfit/amizour")  # 🆕 THIS IS THE NEW ONE!
-    print("   http://localhost:8000/service-status")
-    print("   http://localhost:8000/health")
+    log.info("Starting resilient gateway service", extra={
+        "features": ["circuit breaker", "fallbacks", "health checks"],
+        "endpoints": ["http://localhost:8000/outfit-for-city/amizour", "http://localhost:8000/smart-outfit/amizour",
+                      "http://localhost:8000/service-status", "http://localhost:8000/health"]
+    })
     app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
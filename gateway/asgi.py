@@ -0,0 +1,579 @@
+# gateway/asgi.py
+"""
+Async serving mode for the gateway.
+
+Same routes, fallbacks and circuit breaker as app.py, but every downstream
+call is a non-blocking httpx request, so thousands of slow upstream calls can
+be in flight without pinning a thread each.
+
+    python asgi.py                       # GATEWAY_WORKERS=4 python asgi.py
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app   # production
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import httpx
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse as StarletteJSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from app import (
+    WEATHER_SERVICE, OUTFIT_SERVICE, WARDROBE_SERVICE, SMART_OUTFIT_BUDGET,
+    Deadline, breaker_backend, breakers, circuit_breaker, report_service_failure, report_service_success,
+    fallback_weather, fallback_outfit, circuit_breaker_state, health_monitor, HEALTH_MONITOR_ENABLED,
+    build_smart_outfit_result, build_outfit_for_city_result, response_cache, cache_lookup, cache_store,
+    WEATHER_BATCH_TIMEOUT, fallback_weather_batch, parse_city_list, valid_city_list, wardrobe_unavailable, metrics,
+    materializer, materialized_response, invalidation_allowed, invalidate_caches, INVALIDATE_TOKEN_HEADER,
+    bulkheads, enter_bulkhead, shed_load, admission_queue,
+    ADMISSION_ENABLED, ADMISSION_EXEMPT, last_known_good, remember_weather, remember_weather_batch,
+    remember_outfit, stale_weather, stale_outfit, HEDGE_BUDGET, HEDGE_MAX_AGE
+)
+from bulkhead import admission_from_env, bulkheads_from_env, queued_since
+from circuit_breaker import RedisBackend
+from response_cache import RedisCacheBackend
+from instrumentation import TRACE_HEADER, current_trace_id, span, start_trace
+from wire import INTERNAL_HEADERS, decode, encode
+
+log = logging.getLogger("gateway.asgi")
+
+
+class JSONResponse(StarletteJSONResponse):
+    """JSON response that, like Flask's jsonify, copes with datetimes"""
+
+    def render(self, content):
+        return json.dumps(content, ensure_ascii=False, default=str).encode("utf-8")
+
+
+class AsyncServiceClient:
+    """Async counterpart of http_clients.ServiceClient, backed by httpx"""
+
+    def __init__(self, name, base_url, pool_size=100, timeout=3, retries=0):
+        self.name = name
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._client = None
+
+    @classmethod
+    def from_env(cls, name, base_url, timeout):
+        prefix = name.upper()
+        return cls(
+            name,
+            base_url,
+            pool_size=int(os.getenv(f'{prefix}_POOL_SIZE', '100')),
+            timeout=float(os.getenv(f'{prefix}_TIMEOUT', str(timeout))),
+            retries=int(os.getenv(f'{prefix}_RETRIES', '0'))
+        )
+
+    async def start(self):
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            transport=httpx.AsyncHTTPTransport(retries=self.retries, limits=limits)
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def request(self, method, path, timeout=None, headers=None, json=None, **kwargs):
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        headers = {**INTERNAL_HEADERS, **(headers or {})}
+        trace_id = current_trace_id()
+        if trace_id:
+            headers[TRACE_HEADER] = trace_id
+        if json is not None:
+            kwargs["content"], headers["Content-Type"] = encode(json)
+        try:
+            with span(self.name):
+                return await self._client.request(method, path,
+                                                  timeout=self.timeout if timeout is None else timeout,
+                                                  headers=headers, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    async def get(self, path, timeout=None, **kwargs):
+        return await self.request("GET", path, timeout=timeout, **kwargs)
+
+    async def post(self, path, timeout=None, **kwargs):
+        return await self.request("POST", path, timeout=timeout, **kwargs)
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "pool_size": self.pool_size,
+            "timeout": self.timeout,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight
+        }
+
+
+weather_client = AsyncServiceClient.from_env("weather", WEATHER_SERVICE, timeout=3)
+outfit_client = AsyncServiceClient.from_env("outfit", OUTFIT_SERVICE, timeout=3)
+wardrobe_client = AsyncServiceClient.from_env("wardrobe", WARDROBE_SERVICE, timeout=5)
+service_clients = {"weather": weather_client, "outfit": outfit_client, "wardrobe": wardrobe_client}
+
+# Coroutines are cheap, so the caps are far higher than the threaded gateway's;
+# updated in place so app.enter_bulkhead and the gauges see them
+bulkheads.update(bulkheads_from_env(service_clients, default_size=256))
+# The event loop has no thread queue to wait in: over the limit is shed at once
+admission = admission_from_env(1000)
+metrics.gauge("gateway_admission_in_flight", "Admitted requests in flight", lambda: {(): admission.in_flight})
+metrics.gauge("gateway_admission_waiting", "Requests waiting for admission", lambda: {(): admission.waiting})
+
+
+# Breaker and response-cache state sits behind sync clients. In memory that is a
+# few lock-guarded dict operations, fine on the loop; with a Redis backend every
+# call is a network round trip, so it runs in the thread pool instead.
+SHARED_STATE = isinstance(breaker_backend, RedisBackend) or isinstance(response_cache.backend, RedisCacheBackend)
+
+
+async def sync_state(fn, *args, **kwargs):
+    if SHARED_STATE:
+        return await run_in_threadpool(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+
+class AsyncHedger:
+    """asyncio twin of last_known_good.Hedger"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self._inflight = {}
+        self.hedged = 0
+
+    async def call(self, key, fn, *args, timeout=None):
+        wait = self.budget if timeout is None else min(self.budget, timeout)
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(fn(*args))
+            task.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+        try:
+            # shield: a hedged-out call keeps running and refreshes last-known-good when it lands
+            return await asyncio.wait_for(asyncio.shield(task), wait)
+        except asyncio.TimeoutError:
+            self.hedged += 1
+            return None
+
+
+hedger = AsyncHedger(HEDGE_BUDGET)
+
+
+async def get_weather_with_fallback(city, deadline=None):
+    recent = last_known_good.weather(city, HEDGE_MAX_AGE) if HEDGE_BUDGET > 0 else None
+    if recent is None:
+        return await fetch_weather(city, deadline)
+    weather = await hedger.call(last_known_good.weather_key(city), fetch_weather, city,
+                                timeout=deadline.remaining() if deadline else None)
+    if weather is None:
+        return stale_weather(*recent, reason="hedge")
+    return weather
+
+
+async def fetch_weather(city, deadline=None):
+    timeout = deadline.timeout(weather_client.timeout) if deadline else None
+    if timeout is not None and timeout <= 0:
+        log.warning("Request budget exhausted before weather call, using fallback", extra={"city": city})
+        return fallback_weather(city)
+
+    if not enter_bulkhead("weather"):
+        return fallback_weather(city)
+
+    if not await sync_state(circuit_breaker, "weather"):
+        bulkheads["weather"].release()
+        log.info("Circuit breaker open for weather service, using fallback", extra={"sampled": True})
+        return fallback_weather(city)
+
+    start = time.monotonic()
+    try:
+        response = await weather_client.get(f"/weather/{city}", timeout=timeout)
+        if response.status_code == 200:
+            await sync_state(report_service_success, "weather", time.monotonic() - start)
+            return remember_weather(city, decode(response))
+        elif response.status_code == 429:
+            # Weather is up but over its API quota: fall back without tripping the breaker
+            log.warning("Weather service throttled, using fallback", extra={"city": city})
+            await sync_state(breakers["weather"].release)
+            return fallback_weather(city)
+        else:
+            await sync_state(report_service_failure, "weather", time.monotonic() - start)
+            return fallback_weather(city)
+    except Exception as e:
+        log.error("Weather service error: %r", e)
+        await sync_state(report_service_failure, "weather", time.monotonic() - start)
+        return fallback_weather(city)
+    finally:
+        bulkheads["weather"].release()
+
+
+async def get_weather_batch_with_fallback(cities):
+    if not enter_bulkhead("weather"):
+        return fallback_weather_batch(cities)
+
+    if not await sync_state(circuit_breaker, "weather"):
+        bulkheads["weather"].release()
+        log.info("Circuit breaker open for weather service, using fallback", extra={"sampled": True})
+        return fallback_weather_batch(cities)
+
+    start = time.monotonic()
+    try:
+        response = await weather_client.post("/weather/batch", json={"cities": cities}, timeout=WEATHER_BATCH_TIMEOUT)
+        if response.status_code == 200:
+            await sync_state(report_service_success, "weather", time.monotonic() - start)
+            return remember_weather_batch(decode(response))
+        if response.status_code == 400:
+            await sync_state(breakers["weather"].release)
+            return decode(response)
+        await sync_state(report_service_failure, "weather", time.monotonic() - start)
+        return fallback_weather_batch(cities)
+    except Exception as e:
+        log.error("Weather service error: %r", e)
+        await sync_state(report_service_failure, "weather", time.monotonic() - start)
+        return fallback_weather_batch(cities)
+    finally:
+        bulkheads["weather"].release()
+
+
+async def get_outfit_with_fallback(temperature, condition, deadline=None):
+    recent = last_known_good.outfit(temperature, condition, HEDGE_MAX_AGE, slack=0) if HEDGE_BUDGET > 0 else None
+    if recent is None:
+        return await fetch_outfit(temperature, condition, deadline)
+    outfit = await hedger.call(last_known_good.outfit_key(temperature, condition), fetch_outfit,
+                               temperature, condition, timeout=deadline.remaining() if deadline else None)
+    if outfit is None:
+        return stale_outfit(*recent, reason="hedge")
+    return outfit
+
+
+async def fetch_outfit(temperature, condition, deadline=None):
+    timeout = deadline.timeout(outfit_client.timeout) if deadline else None
+    if timeout is not None and timeout <= 0:
+        log.warning("Request budget exhausted before outfit call, using fallback")
+        return fallback_outfit(temperature, condition)
+
+    if not enter_bulkhead("outfit"):
+        return fallback_outfit(temperature, condition)
+
+    if not await sync_state(circuit_breaker, "outfit"):
+        bulkheads["outfit"].release()
+        log.info("Circuit breaker open for outfit service, using fallback", extra={"sampled": True})
+        return fallback_outfit(temperature, condition)
+
+    start = time.monotonic()
+    try:
+        response = await outfit_client.get(f"/recommend/{temperature}/{condition}", timeout=timeout)
+        if response.status_code == 200:
+            await sync_state(report_service_success, "outfit", time.monotonic() - start)
+            return remember_outfit(temperature, condition, decode(response))
+        else:
+            await sync_state(report_service_failure, "outfit", time.monotonic() - start)
+            return fallback_outfit(temperature, condition)
+    except Exception as e:
+        log.error("Outfit service error: %r", e)
+        await sync_state(report_service_failure, "outfit", time.monotonic() - start)
+        return fallback_outfit(temperature, condition)
+    finally:
+        bulkheads["outfit"].release()
+
+
+async def get_wardrobe_match(temperature, condition, recommendation=None, user_id="user123", deadline=None):
+    timeout = deadline.timeout(wardrobe_client.timeout) if deadline else None
+    if timeout is not None and timeout <= 0:
+        return wardrobe_unavailable("Request budget exhausted before wardrobe call")
+
+    if not enter_bulkhead("wardrobe"):
+        return wardrobe_unavailable("Wardrobe bulkhead full")
+
+    if not await sync_state(circuit_breaker, "wardrobe"):
+        bulkheads["wardrobe"].release()
+        return wardrobe_unavailable("Wardrobe circuit breaker open")
+
+    start = time.monotonic()
+    try:
+        wardrobe_payload = {
+            "temperature": temperature,
+            "condition": condition,
+            "user_id": user_id
+        }
+        if recommendation is not None:
+            wardrobe_payload["recommendation"] = recommendation
+
+        wardrobe_response = await wardrobe_client.post("/clothes/match", json=wardrobe_payload, timeout=timeout)
+
+        if wardrobe_response.status_code == 200:
+            await sync_state(report_service_success, "wardrobe", time.monotonic() - start)
+            return decode(wardrobe_response)
+        else:
+            await sync_state(report_service_failure, "wardrobe", time.monotonic() - start)
+            return wardrobe_unavailable("Wardrobe service unavailable")
+    except Exception as e:
+        log.error("Wardrobe service error: %r", e)
+        await sync_state(report_service_failure, "wardrobe", time.monotonic() - start)
+        return wardrobe_unavailable("Cannot connect to wardrobe service")
+    finally:
+        bulkheads["wardrobe"].release()
+
+
+async def probe(name):
+    start = time.perf_counter()
+    try:
+        response = await service_clients[name].get("/health", timeout=health_monitor.timeout)
+        healthy = response.status_code == 200
+        health_monitor.record(name, healthy, (time.perf_counter() - start) * 1000,
+                              response=response.json() if healthy else None,
+                              error=None if healthy else f"HTTP {response.status_code}")
+    except Exception:
+        health_monitor.record(name, False, (time.perf_counter() - start) * 1000, error="Cannot connect")
+
+
+async def run_health_monitor():
+    """asyncio twin of HealthMonitor's probe thread"""
+    while True:
+        await asyncio.gather(*(probe(name) for name in service_clients))
+        await asyncio.sleep(health_monitor.interval)
+
+
+class TraceMiddleware:
+    """ASGI twin of instrumentation.instrument_flask: trace ID, Server-Timing and request metrics"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        trace = start_trace(headers.get(TRACE_HEADER.lower().encode(), b"").decode() or None, metrics)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                route = ROUTE_PATHS.get(scope.get("endpoint"), "unmatched")
+                metrics.requests.observe(trace.elapsed(), service="gateway", method=scope["method"],
+                                         route=route, status=status)
+                if status >= 500:
+                    metrics.errors.inc(service="gateway", route=route)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (TRACE_HEADER.lower().encode(), trace.id.encode()),
+                    (b"server-timing", trace.server_timing().encode())
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_trace)
+
+
+class AdmissionMiddleware:
+    """ASGI twin of app.admit_request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED or scope["path"] in ADMISSION_EXEMPT:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        admitted, queued = admission.try_enter(queued_since(headers.get(b"x-request-start", b"").decode()))
+        admission_queue.observe(queued)
+        if not admitted:
+            body, extra_headers = shed_load(admission)
+            return await JSONResponse(body, status_code=503, headers=extra_headers)(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.leave()
+
+
+async def prometheus_metrics(request):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def health(request):
+    return JSONResponse({
+        "status": "healthy",
+        "service": "gateway",
+        "mode": "asgi",
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+async def service_status_route(request):
+    return JSONResponse({
+        "microservices_status": health_monitor.snapshot(),
+        "circuit_breaker_state": await sync_state(circuit_breaker_state),
+        "bulkheads": {name: bulkhead.snapshot() for name, bulkhead in bulkheads.items()},
+        "admission": admission.snapshot(),
+        "last_known_good": {**last_known_good.stats(), "hedged_calls": hedger.hedged}
+    })
+
+
+async def client_pools(request):
+    return JSONResponse({name: client.stats() for name, client in service_clients.items()})
+
+
+async def cache_stats(request):
+    return JSONResponse(await sync_state(response_cache.stats))
+
+
+async def invalidate_cache(request):
+    if not invalidation_allowed(request.headers.get(INVALIDATE_TOKEN_HEADER)):
+        return JSONResponse({"error": "Cache invalidation is for internal callers only"}, status_code=403)
+    body = await request.body()
+    try:
+        # Like Flask's get_json(silent=True): no body means "everyone"
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return JSONResponse({"error": "Expected a JSON object, optionally with a user_id"}, status_code=400)
+    user_id = payload.get("user_id")
+    await run_in_threadpool(invalidate_caches, user_id)
+    return JSONResponse({"invalidated": user_id or "all"})
+
+
+async def materialized_stats(request):
+    return JSONResponse(materializer.stats())
+
+
+def bypass_cache(request):
+    return "no-cache" in request.headers.get("cache-control", "")
+
+
+async def get_weather_batch(request):
+    if request.method == "POST":
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        cities = body.get("cities") if isinstance(body, dict) else None
+    else:
+        cities = parse_city_list(request.query_params.get("cities", ""))
+
+    if not valid_city_list(cities):
+        return JSONResponse({"error": "cities must be a non-empty list of city names"}, status_code=400)
+
+    result = await get_weather_batch_with_fallback(cities)
+    return JSONResponse(result, status_code=400 if "results" not in result else 200)
+
+
+async def get_smart_outfit_from_wardrobe(request):
+    city = request.path_params["city"]
+    user_id = request.query_params.get("user_id", "user123")
+    key, cached = await sync_state(cache_lookup, "smart-outfit", city, user_id, bypass_cache(request))
+    if cached:
+        body, age = cached
+        return JSONResponse(body, headers=response_cache.headers("smart-outfit", user_id, age))
+    materialized = None if bypass_cache(request) else materialized_response("smart-outfit", city, user_id)
+    if materialized:
+        return JSONResponse(materialized[0], headers=materialized[1])
+
+    log.info("Getting smart outfit", extra={"city": city, "user_id": user_id, "sampled": True})
+    deadline = Deadline(SMART_OUTFIT_BUDGET)
+
+    weather_data = await get_weather_with_fallback(city, deadline)
+    temperature = weather_data["temperature"]
+    condition = weather_data["condition"].lower()
+
+    outfit_recommendation, wardrobe_data = await asyncio.gather(
+        get_outfit_with_fallback(temperature, condition, deadline),
+        get_wardrobe_match(temperature, condition, None, user_id, deadline)
+    )
+
+    body = build_smart_outfit_result(city, weather_data, outfit_recommendation, wardrobe_data)
+    return JSONResponse(body, headers=await sync_state(cache_store, "smart-outfit", key, body, user_id))
+
+
+async def get_outfit_for_city(request):
+    city = request.path_params["city"]
+    key, cached = await sync_state(cache_lookup, "outfit-for-city", city, bypass=bypass_cache(request))
+    if cached:
+        body, age = cached
+        return JSONResponse(body, headers=response_cache.headers("outfit-for-city", age=age))
+    materialized = None if bypass_cache(request) else materialized_response("outfit-for-city", city)
+    if materialized:
+        return JSONResponse(materialized[0], headers=materialized[1])
+
+    log.info("Getting basic outfit", extra={"city": city, "sampled": True})
+
+    weather_data = await get_weather_with_fallback(city)
+    temperature = weather_data["temperature"]
+    condition = weather_data["condition"].lower()
+    outfit_data = await get_outfit_with_fallback(temperature, condition)
+
+    body = build_outfit_for_city_result(city, weather_data, outfit_data)
+    return JSONResponse(body, headers=await sync_state(cache_store, "outfit-for-city", key, body))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # httpx clients are bound to the event loop, so each worker opens its own
+    for client in service_clients.values():
+        await client.start()
+    monitor_task = asyncio.create_task(run_health_monitor()) if HEALTH_MONITOR_ENABLED else None
+    # The materializer runs on its own thread with the sync clients, off the event loop
+    materializer.start()
+    last_known_good.start()
+    yield
+    if monitor_task:
+        monitor_task.cancel()
+    for client in service_clients.values():
+        await client.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health),
+        Route('/metrics', prometheus_metrics),
+        Route('/service-status', service_status_route),
+        Route('/client-pools', client_pools),
+        Route('/cache/stats', cache_stats),
+        Route('/cache/invalidate', invalidate_cache, methods=['POST']),
+        Route('/materialized/stats', materialized_stats),
+        Route('/weather/batch', get_weather_batch, methods=['GET', 'POST']),
+        Route('/smart-outfit/{city}', get_smart_outfit_from_wardrobe),
+        Route('/outfit-for-city/{city}', get_outfit_for_city)
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=[TRACE_HEADER, "Server-Timing"]),
+        Middleware(TraceMiddleware),
+        Middleware(AdmissionMiddleware)
+    ],
+    lifespan=lifespan
+)
+# Route templates (not raw paths) label the metrics, so cities don't explode the series count
+ROUTE_PATHS = {route.endpoint: route.path for route in app.routes}
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    limit = os.getenv('GATEWAY_LIMIT_CONCURRENCY')
+    log.info("Starting async gateway service")
+    uvicorn.run(
+        "asgi:app",
+        host='0.0.0.0',
+        port=int(os.getenv('PORT', '8000')),
+        workers=int(os.getenv('GATEWAY_WORKERS', '1')),
+        limit_concurrency=int(limit) if limit else None,
+        backlog=int(os.getenv('GATEWAY_BACKLOG', '4096')),
+        log_config=None  # uvicorn's own loggers go through the JSON queue handler too
+    )
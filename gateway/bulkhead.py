@@ -0,0 +1,157 @@
+# gateway/bulkhead.py
+"""
+Keeping one slow downstream from taking the whole gateway down with it.
+
+Bulkhead: a cap on concurrent calls to one downstream service. When it is
+full the caller gets its fallback at once instead of joining the pile of
+requests waiting out the timeout, so a slow weather service can hold at most
+WEATHER_BULKHEAD_SIZE threads.
+
+AdmissionController: gateway-wide load shedding in front of the routes. At
+most max_in_flight requests run at once and at most max_queue more wait for a
+slot (a waiting request holds its worker thread, so the two together must stay
+below the thread count); beyond that a request is shed at once. One that has
+been queued longer than the target (counting the time it spent in front of the
+gateway, from X-Request-Start when the ingress sets it) gets a 503 with
+Retry-After instead of a late answer.
+
+Both only count, never block the event loop unless asked to, so the ASGI mode
+uses them as-is.
+"""
+import math
+import os
+import threading
+import time
+
+
+class Bulkhead:
+    """Non-blocking concurrency cap for one downstream"""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.rejections = 0
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_use >= self.size:
+                self.rejections += 1
+                return False
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"size": self.size, "in_use": self.in_use, "peak_in_use": self.peak_in_use,
+                    "rejections": self.rejections}
+
+
+def bulkheads_from_env(names, default_size=8):
+    """<NAME>_BULKHEAD_SIZE per downstream"""
+    return {name: Bulkhead(name, int(os.getenv(f'{name.upper()}_BULKHEAD_SIZE', str(default_size))))
+            for name in names}
+
+
+def queued_since(header, now=None, max_skew=60.0):
+    """
+    Seconds a request already spent queued before reaching us, from an
+    X-Request-Start header ("t=<epoch>" in s, ms or us, as nginx/Heroku send it).
+    0 when missing, unparseable, in the future or more than max_skew seconds
+    old: the header comes from outside, so an implausible value is ignored
+    rather than trusted.
+    """
+    if not header:
+        return 0.0
+    try:
+        started = float(header.strip().lstrip("t="))
+    except ValueError:
+        return 0.0
+    if not math.isfinite(started):
+        return 0.0
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    queued = (now or time.time()) - started
+    return queued if 0.0 < queued <= max_skew else 0.0
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight, target, retry_after=1.0, max_queue=0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.target = target
+        self.retry_after_floor = retry_after
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def enter(self, queued=0.0):
+        """
+        Wait (threads only) for a slot until the request has been queued for
+        `target` in total, if fewer than max_queue requests are already waiting.
+        Returns (admitted, seconds queued); when admitted, call leave() once the
+        request is done.
+        """
+        start = time.monotonic()
+        with self._cond:
+            if queued < self.target and self.in_flight >= self.max_in_flight and self.waiting < self.max_queue:
+                self.waiting += 1
+                try:
+                    deadline = start + self.target - queued
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            return self._decide(queued + time.monotonic() - start)
+
+    def try_enter(self, queued=0.0):
+        """enter() without waiting, for the event loop"""
+        with self._cond:
+            return self._decide(queued)
+
+    def _decide(self, queued):
+        if queued > self.target or self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            return False, queued
+        self.in_flight += 1
+        self.admitted += 1
+        return True, queued
+
+    def leave(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def retry_after(self):
+        """Whole seconds for Retry-After: longer the deeper the backlog"""
+        backlog = self.waiting / max(1, self.max_in_flight)
+        return max(1, math.ceil(self.retry_after_floor * (1 + backlog)))
+
+    def snapshot(self):
+        with self._cond:
+            return {"max_in_flight": self.max_in_flight, "max_queue": self.max_queue, "target_ms": round(self.target * 1000),
+                    "in_flight": self.in_flight, "waiting": self.waiting,
+                    "admitted": self.admitted, "rejected": self.rejected}
+
+
+def admission_from_env(default_max_in_flight, default_max_queue=0):
+    return AdmissionController(
+        max_in_flight=int(os.getenv('ADMISSION_MAX_IN_FLIGHT', str(default_max_in_flight))),
+        max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', str(default_max_queue))),
+        target=float(os.getenv('ADMISSION_QUEUE_TARGET_MS', '250')) / 1000,
+        retry_after=float(os.getenv('ADMISSION_RETRY_AFTER', '1'))
+    )
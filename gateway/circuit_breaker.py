@@ -0,0 +1,304 @@
+# gateway/circuit_breaker.py
+"""
+Circuit breaker with a rolling window and half-open probing.
+
+    closed    -> calls flow; failures and slow calls are counted in a rolling
+                 time window. When enough calls were seen and the failure rate
+                 or the slow-call rate crosses its threshold, the breaker opens.
+    open      -> calls are rejected (callers use their fallback) for open_seconds.
+    half_open -> at most half_open_probes trial calls are let through. If they
+                 all succeed the breaker closes; any failure re-opens it.
+                 An optional probe_gate(name) can hold probes back, e.g.
+                 while the service fails its health checks.
+
+The rolling window is kept per process. The open/half-open state lives in a
+backend so several gateway replicas can share it: MemoryBackend (default) or
+RedisBackend (CB_BACKEND=redis, any Redis-compatible store).
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class RollingWindow:
+    """Per-second buckets of (calls, failures, slow calls) over the last N seconds"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._epochs = [None] * seconds
+        self._calls = [0] * seconds
+        self._failures = [0] * seconds
+        self._slow = [0] * seconds
+
+    def record(self, now, failed, slow):
+        second = int(now)
+        i = second % self.seconds
+        if self._epochs[i] != second:
+            self._epochs[i] = second
+            self._calls[i] = self._failures[i] = self._slow[i] = 0
+        self._calls[i] += 1
+        self._failures[i] += failed
+        self._slow[i] += slow
+
+    def totals(self, now):
+        oldest = int(now) - self.seconds
+        calls = failures = slow = 0
+        for i, epoch in enumerate(self._epochs):
+            if epoch is not None and epoch > oldest:
+                calls += self._calls[i]
+                failures += self._failures[i]
+                slow += self._slow[i]
+        return calls, failures, slow
+
+    def reset(self):
+        self._epochs = [None] * self.seconds
+
+
+class MemoryBackend:
+    """Breaker state held in this process, timed with the monotonic clock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def _get(self, name):
+        return self._states.setdefault(name, {
+            "tripped": False, "open_until": 0.0, "probes": 0, "probe_successes": 0
+        })
+
+    def state(self, name):
+        with self._lock:
+            s = self._get(name)
+            if not s["tripped"]:
+                return CLOSED
+            return OPEN if time.monotonic() < s["open_until"] else HALF_OPEN
+
+    def trip(self, name, open_seconds):
+        with self._lock:
+            s = self._get(name)
+            s.update(tripped=True, open_until=time.monotonic() + open_seconds, probes=0, probe_successes=0)
+
+    def acquire_probe(self, name, max_probes, open_seconds):
+        with self._lock:
+            s = self._get(name)
+            now = time.monotonic()
+            # Probes that never reported back must not wedge the breaker
+            if now - s["open_until"] > open_seconds:
+                s.update(open_until=now, probes=0, probe_successes=0)
+            if s["probes"] >= max_probes:
+                return False
+            s["probes"] += 1
+            return True
+
+    def release_probe(self, name):
+        with self._lock:
+            s = self._get(name)
+            s["probes"] = max(0, s["probes"] - 1)
+
+    def probe_succeeded(self, name, required):
+        """Returns True when enough probes succeeded and the breaker closed"""
+        with self._lock:
+            s = self._get(name)
+            s["probe_successes"] += 1
+            if s["probe_successes"] >= required:
+                s.update(tripped=False, probes=0, probe_successes=0)
+                return True
+            return False
+
+    def reset(self, name):
+        with self._lock:
+            self._states.pop(name, None)
+
+
+class RedisBackend:
+    """
+    Breaker state shared through Redis so every gateway replica sees the same circuit.
+
+    Uses key expiry on the server for the open period, so replica clocks never
+    need to agree.
+    """
+
+    def __init__(self, url, prefix="gateway:cb"):
+        import redis  # optional dependency, only needed for the shared backend
+
+        self.redis = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.prefix = prefix
+
+    def _key(self, name, part):
+        return f"{self.prefix}:{name}:{part}"
+
+    def state(self, name):
+        tripped, is_open = self.redis.mget(self._key(name, "tripped"), self._key(name, "open"))
+        if not tripped:
+            return CLOSED
+        return OPEN if is_open else HALF_OPEN
+
+    def trip(self, name, open_seconds):
+        pipe = self.redis.pipeline()
+        pipe.set(self._key(name, "tripped"), 1)
+        pipe.set(self._key(name, "open"), 1, px=int(open_seconds * 1000))
+        pipe.delete(self._key(name, "probes"), self._key(name, "probe_successes"))
+        pipe.execute()
+
+    def acquire_probe(self, name, max_probes, open_seconds):
+        key = self._key(name, "probes")
+        probes = self.redis.incr(key)
+        if probes == 1:
+            # Leaked probes expire instead of wedging the breaker
+            self.redis.pexpire(key, int(open_seconds * 1000))
+        return probes <= max_probes
+
+    def release_probe(self, name):
+        key = self._key(name, "probes")
+        if self.redis.decr(key) < 0:
+            self.redis.delete(key)  # the slot had already expired
+
+    def probe_succeeded(self, name, required):
+        if self.redis.incr(self._key(name, "probe_successes")) >= required:
+            self.reset(name)
+            return True
+        return False
+
+    def reset(self, name):
+        self.redis.delete(*(self._key(name, part) for part in ("tripped", "open", "probes", "probe_successes")))
+
+
+class CircuitBreaker:
+    """Breaker for one downstream service"""
+
+    def __init__(self, name, backend, window_seconds=30, minimum_calls=5,
+                 failure_rate_threshold=0.5, slow_call_seconds=2.0,
+                 slow_call_rate_threshold=0.8, open_seconds=30, half_open_probes=3, probe_gate=None):
+        self.name = name
+        self.backend = backend
+        self.minimum_calls = minimum_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.probe_gate = probe_gate
+        self._window = RollingWindow(window_seconds)
+        self._lock = threading.Lock()
+        self.failure_count = 0
+        self.last_failure = None
+
+    def _state(self):
+        try:
+            return self.backend.state(self.name)
+        except Exception as e:
+            # A broken shared store must not take the gateway down with it
+            log.warning("Circuit breaker backend error for %s: %s", self.name, e)
+            return CLOSED
+
+    def allow_request(self):
+        state = self._state()
+        if state == CLOSED:
+            return True
+        if state == OPEN or (self.probe_gate and not self.probe_gate(self.name)):
+            return False
+        try:
+            return self.backend.acquire_probe(self.name, self.half_open_probes, self.open_seconds)
+        except Exception as e:
+            log.warning("Circuit breaker backend error for %s: %s", self.name, e)
+            return True
+
+    def release(self):
+        """
+        A call let through that ended without a verdict on the service (throttled,
+        or our own request was bad): hand back its half-open probe slot, if it held one
+        """
+        try:
+            if self.backend.state(self.name) == HALF_OPEN:
+                self.backend.release_probe(self.name)
+        except Exception as e:
+            log.warning("Circuit breaker backend error for %s: %s", self.name, e)
+
+    def record_success(self, duration=None):
+        return self._record(failed=False, duration=duration)
+
+    def record_failure(self, duration=None):
+        return self._record(failed=True, duration=duration)
+
+    def _record(self, failed, duration):
+        """Returns the state transition this outcome caused, if any"""
+        slow = duration is not None and duration >= self.slow_call_seconds
+        now = time.monotonic()
+
+        with self._lock:
+            if failed:
+                self.failure_count += 1
+                self.last_failure = datetime.now()
+            self._window.record(now, failed, slow)
+            calls, failures, slow_calls = self._window.totals(now)
+
+        state = self._state()
+        try:
+            return self._transition(state, failed or slow, calls, failures, slow_calls)
+        except Exception as e:
+            log.warning("Circuit breaker backend error for %s: %s", self.name, e)
+            return None
+
+    def _transition(self, state, bad_call, calls, failures, slow_calls):
+        if state == HALF_OPEN:
+            if bad_call:
+                self._trip()
+                return OPEN
+            if self.backend.probe_succeeded(self.name, self.half_open_probes):
+                with self._lock:
+                    self._window.reset()
+                return CLOSED
+            return None
+
+        if state == CLOSED and calls >= self.minimum_calls:
+            if failures / calls >= self.failure_rate_threshold or slow_calls / calls >= self.slow_call_rate_threshold:
+                self._trip()
+                return OPEN
+        return None
+
+    def _trip(self):
+        self.backend.trip(self.name, self.open_seconds)
+
+    def snapshot(self):
+        with self._lock:
+            calls, failures, slow_calls = self._window.totals(time.monotonic())
+        state = self._state()
+        return {
+            "state": state,
+            "healthy": state == CLOSED,
+            "failure_count": self.failure_count,
+            "last_failure": self.last_failure.isoformat() if self.last_failure else None,
+            "window": {
+                "calls": calls,
+                "failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "slow_call_rate": round(slow_calls / calls, 3) if calls else 0.0
+            }
+        }
+
+
+def backend_from_env():
+    if os.getenv('CB_BACKEND', 'memory').lower() == 'redis':
+        return RedisBackend(os.getenv('CB_REDIS_URL', 'redis://localhost:6379/0'))
+    return MemoryBackend()
+
+
+def breaker_from_env(name, backend):
+    return CircuitBreaker(
+        name,
+        backend,
+        window_seconds=int(os.getenv('CB_WINDOW_SECONDS', '30')),
+        minimum_calls=int(os.getenv('CB_MINIMUM_CALLS', '5')),
+        failure_rate_threshold=float(os.getenv('CB_FAILURE_RATE', '0.5')),
+        slow_call_seconds=float(os.getenv('CB_SLOW_CALL_SECONDS', '2.0')),
+        slow_call_rate_threshold=float(os.getenv('CB_SLOW_CALL_RATE', '0.8')),
+        open_seconds=float(os.getenv('CB_OPEN_SECONDS', '30')),
+        half_open_probes=int(os.getenv('CB_HALF_OPEN_PROBES', '3'))
+    )
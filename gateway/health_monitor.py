@@ -0,0 +1,138 @@
+# gateway/health_monitor.py
+"""
+Background health prober for the downstream services.
+
+Probes every service on an interval (concurrently) and keeps last-known state
+and latency histograms, so /service-status can answer from memory instead of
+probing on every poll.
+
+Health is kept apart from the circuit breakers' call outcomes: a service whose
+/health answers can still fail its real endpoints. The breakers only consult
+it before granting a half-open probe, through reachable().
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Upper bounds in milliseconds, Prometheus-style (cumulative, last one is +Inf)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def observe(self, latency_ms):
+        self.count += 1
+        self.total_ms += latency_ms
+        for i, upper in enumerate(self.buckets):
+            if latency_ms <= upper:
+                self.counts[i] += 1
+                break
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = {}
+        for upper, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets["+Inf" if upper == float("inf") else str(upper)] = cumulative
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "buckets_ms": buckets
+        }
+
+
+class HealthMonitor:
+    """
+    Last-known health of each downstream service.
+
+    The monitor itself is transport-agnostic: start() runs a thread that probes
+    with the pooled ServiceClients, while the ASGI mode drives probe results in
+    through record() from its own asyncio task.
+    """
+
+    def __init__(self, clients, interval=10.0, timeout=2.0):
+        self.clients = clients
+        self.interval = interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._state = {
+            name: {
+                "status": "unknown",
+                "checked_at": None,
+                "latency_ms": None,
+                "consecutive_failures": 0,
+                "histogram": LatencyHistogram()
+            }
+            for name in clients
+        }
+        self._pid = None
+        self._stop = threading.Event()
+
+    def record(self, name, healthy, latency_ms, response=None, error=None):
+        with self._lock:
+            state = self._state[name]
+            state["status"] = "healthy" if healthy else "unhealthy"
+            state["checked_at"] = datetime.now().isoformat()
+            state["latency_ms"] = round(latency_ms, 2)
+            state["histogram"].observe(latency_ms)
+            state["consecutive_failures"] = 0 if healthy else state["consecutive_failures"] + 1
+            state.pop("response", None)
+            state.pop("error", None)
+            if healthy:
+                state["response"] = response
+            else:
+                state["error"] = error
+
+    def reachable(self, name):
+        """False once the last /health probe failed; not yet probed counts as reachable"""
+        with self._lock:
+            return self._state[name]["status"] != "unhealthy"
+
+    def probe(self, name):
+        start = time.perf_counter()
+        try:
+            response = self.clients[name].get("/health", timeout=self.timeout)
+            healthy = response.status_code == 200
+            self.record(name, healthy, (time.perf_counter() - start) * 1000,
+                        response=response.json() if healthy else None,
+                        error=None if healthy else f"HTTP {response.status_code}")
+        except Exception:
+            self.record(name, False, (time.perf_counter() - start) * 1000, error="Cannot connect")
+
+    def probe_all(self, pool):
+        list(pool.map(self.probe, self.clients))
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=len(self.clients), thread_name_prefix='health') as pool:
+            while not self._stop.is_set():
+                self.probe_all(pool)
+                self._stop.wait(self.interval)
+
+    def start(self):
+        """Start the probe thread once per process (safe to call after a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+        threading.Thread(target=self._run, name='health-monitor', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {**{k: v for k, v in state.items() if k != "histogram"},
+                       "latency_histogram": state["histogram"].snapshot()}
+                for name, state in self._state.items()
+            }
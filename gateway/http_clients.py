@@ -0,0 +1,170 @@
+# gateway/http_clients.py
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from instrumentation import TRACE_HEADER, current_trace_id, span
+from wire import INTERNAL_HEADERS, encode
+
+
+class PoolMetrics:
+    """Connection and pool-wait counters for one downstream service"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_in_use = 0
+        self.peak_in_use = 0
+        self.pool_wait_total = 0.0
+        self.pool_wait_max = 0.0
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def checked_out(self, waited):
+        with self._lock:
+            self.requests += 1
+            self.connections_in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.connections_in_use)
+            self.pool_wait_total += waited
+            self.pool_wait_max = max(self.pool_wait_max, waited)
+
+    def checked_in(self):
+        with self._lock:
+            self.connections_in_use = max(0, self.connections_in_use - 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_in_use": self.connections_in_use,
+                "peak_in_use": self.peak_in_use,
+                "pool_wait_avg_ms": round(self.pool_wait_total / self.requests * 1000, 3) if self.requests else 0.0,
+                "pool_wait_max_ms": round(self.pool_wait_max * 1000, 3)
+            }
+
+
+class _InstrumentedPoolMixin:
+    """Reports new connections and time spent waiting for a free one"""
+    _metrics = None
+    _pool_timeout = None
+
+    def _new_conn(self):
+        self._metrics.connection_opened()
+        return super()._new_conn()
+
+    def _get_conn(self, timeout=None):
+        start = time.perf_counter()
+        conn = super()._get_conn(timeout=timeout if timeout is not None else self._pool_timeout)
+        self._metrics.checked_out(time.perf_counter() - start)
+        return conn
+
+    def _put_conn(self, conn):
+        self._metrics.checked_in()
+        return super()._put_conn(conn)
+
+
+class _InstrumentedAdapter(HTTPAdapter):
+    def __init__(self, metrics, pool_timeout, **kwargs):
+        self._pool_classes = {
+            "http": type("InstrumentedHTTPConnectionPool", (_InstrumentedPoolMixin, HTTPConnectionPool),
+                         {"_metrics": metrics, "_pool_timeout": pool_timeout}),
+            "https": type("InstrumentedHTTPSConnectionPool", (_InstrumentedPoolMixin, HTTPSConnectionPool),
+                          {"_metrics": metrics, "_pool_timeout": pool_timeout})
+        }
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self._pool_classes
+
+
+class ServiceClient:
+    """
+    Keep-alive HTTP client for one downstream service.
+
+    Each service gets its own requests.Session with a bounded connection pool,
+    a default timeout and a retry policy for idempotent GETs.
+    """
+
+    def __init__(self, name, base_url, pool_size=10, timeout=3, retries=0,
+                 backoff=0.1, pool_block=False, pool_timeout=1.0):
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.pool_block = pool_block
+        self.metrics = PoolMetrics()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False
+        )
+        adapter = _InstrumentedAdapter(
+            self.metrics,
+            pool_timeout,
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=pool_block,
+            max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, timeout=None, headers=None, json=None, **kwargs):
+        """
+        One call, timed as a span of the current request and carrying its trace ID.
+        Asks for the internal wire format (see wire.py); json= bodies are sent in it too,
+        so read responses with wire.decode.
+        """
+        headers = {**INTERNAL_HEADERS, **(headers or {})}
+        trace_id = current_trace_id()
+        if trace_id:
+            headers[TRACE_HEADER] = trace_id
+        if json is not None:
+            kwargs["data"], headers["Content-Type"] = encode(json)
+        with span(self.name):
+            # 0 is a spent budget, not "use the default"
+            return self.session.request(method, f"{self.base_url}{path}",
+                                        timeout=self.timeout if timeout is None else timeout,
+                                        headers=headers, **kwargs)
+
+    def get(self, path, timeout=None, **kwargs):
+        return self.request("GET", path, timeout=timeout, **kwargs)
+
+    def post(self, path, timeout=None, **kwargs):
+        return self.request("POST", path, timeout=timeout, **kwargs)
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "pool_size": self.pool_size,
+            "pool_block": self.pool_block,
+            "timeout": self.timeout,
+            **self.metrics.snapshot()
+        }
+
+
+def client_from_env(name, base_url, timeout, pool_size=10, retries=0):
+    """Build a ServiceClient using <NAME>_POOL_SIZE, <NAME>_TIMEOUT, <NAME>_RETRIES, <NAME>_POOL_BLOCK"""
+    prefix = name.upper()
+    return ServiceClient(
+        name,
+        base_url,
+        pool_size=int(os.getenv(f'{prefix}_POOL_SIZE', str(pool_size))),
+        timeout=float(os.getenv(f'{prefix}_TIMEOUT', str(timeout))),
+        retries=int(os.getenv(f'{prefix}_RETRIES', str(retries))),
+        pool_block=os.getenv(f'{prefix}_POOL_BLOCK', 'false').lower() == 'true'
+    )
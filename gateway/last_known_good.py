@@ -0,0 +1,203 @@
+# gateway/last_known_good.py
+"""
+Last-known-good downstream answers, for fallbacks and hedging.
+
+Every successful weather and outfit response is remembered (LRU-bounded, per
+process, optionally saved to LKG_PATH so a restart during an outage still has
+something real to serve). When a downstream fails, the fallbacks answer from
+here, with the data's age, before resorting to the static stub.
+
+Hedger covers slow-but-alive: a live call gets a latency budget, and past it
+the caller answers from the last-known-good value while the call carries on
+in the background and refreshes the store when it lands. Concurrent hedged
+calls for the same key share one live call, which is not bound by any one
+caller's deadline; each caller waits at most its own.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, timezone
+
+from instrumentation import run_in_context
+from materializer import DEFAULT_BAND_EDGES
+from response_cache import normalize_city
+
+log = logging.getLogger(__name__)
+
+
+def staleness(stored_at):
+    """Metadata every answer served from this store carries"""
+    return {
+        "stale": True,
+        "as_of": datetime.fromtimestamp(stored_at, timezone.utc).isoformat(),
+        "age_seconds": max(0, int(time.time() - stored_at))
+    }
+
+
+class LastKnownGood:
+    def __init__(self, max_entries=5000, max_age=86400.0, path=None, persist_interval=60.0,
+                 band_edges=DEFAULT_BAND_EDGES):
+        self.max_entries = max_entries
+        self.band_edges = sorted(band_edges)
+        self.max_age = max_age
+        self.path = path
+        self.persist_interval = persist_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored_at epoch seconds, value)
+        self._dirty = False
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._load()
+
+    @staticmethod
+    def weather_key(city):
+        return f"weather:{normalize_city(city)}"
+
+    @staticmethod
+    def outfit_key(temperature, condition):
+        return f"outfit:{int(temperature)}:{condition}"
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def get(self, key, max_age=None):
+        """(value, stored_at) if an entry younger than max_age (default: the store's) exists"""
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > max_age:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            stored_at, value = entry
+            return value, stored_at
+
+    def weather(self, city, max_age=None):
+        return self.get(self.weather_key(city), max_age)
+
+    def outfit(self, temperature, condition, max_age=None, slack=3):
+        """
+        Recommendation for the temperature, or failing that the nearest one within
+        slack degrees that is still in the same temperature band (so never an outfit
+        for warmer or colder weather than this)
+        """
+        base = int(temperature)
+        band = bisect_right(self.band_edges, base)
+        for offset in sorted(range(-slack, slack + 1), key=abs):
+            if bisect_right(self.band_edges, base + offset) != band:
+                continue
+            found = self.get(self.outfit_key(base + offset, condition), max_age)
+            if found:
+                return found
+        return None
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable last-known-good file %s: %s", self.path, e)
+            return
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            for key, stored_at, value in sorted(entries, key=lambda entry: entry[1])[-self.max_entries:]:
+                if stored_at >= cutoff:
+                    self._entries[key] = (stored_at, value)
+        log.info("Loaded last-known-good data", extra={"entries": len(self._entries), "path": self.path})
+
+    def save(self):
+        """Write the store to path atomically; no-op without a path or changes"""
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            entries = [[key, stored_at, value] for key, (stored_at, value) in self._entries.items()]
+            self._dirty = False
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(entries, f, default=str)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("Could not save last-known-good data: %s", e)
+            self._dirty = True
+
+    def _run(self):
+        while True:
+            time.sleep(self.persist_interval)
+            self.save()
+
+    def start(self):
+        """Start the persistence thread once per process (safe to call after a fork)"""
+        if not self.path or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='last-known-good', daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            kinds = {}
+            for key in self._entries:
+                kind = key.split(":", 1)[0]
+                kinds[kind] = kinds.get(kind, 0) + 1
+        return {"entries": kinds, "max_entries": self.max_entries, "max_age": self.max_age,
+                "hits": self.hits, "misses": self.misses, "path": self.path}
+
+
+class Hedger:
+    """Live calls with a latency budget, run on pool; one in-flight call per key"""
+
+    def __init__(self, pool, budget):
+        self.pool = pool
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.hedged = 0
+
+    def call(self, key, fn, *args, timeout=None):
+        """
+        fn(*args) if it answers within the budget (or timeout, the caller's own
+        remaining time, if that is shorter), else None (the call keeps running)
+        """
+        wait = self.budget if timeout is None else min(self.budget, timeout)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = run_in_context(self.pool, fn, *args)
+                future.add_done_callback(lambda done: self._forget(key, done))
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeout:
+            self.hedged += 1
+            return None
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+def last_known_good_from_env():
+    return LastKnownGood(
+        max_entries=int(os.getenv('LKG_MAX_ENTRIES', '5000')),
+        max_age=float(os.getenv('LKG_MAX_AGE', str(24 * 3600))),
+        path=os.getenv('LKG_PATH') or None,
+        persist_interval=float(os.getenv('LKG_PERSIST_INTERVAL', '60'))
+    )
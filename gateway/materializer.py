@@ -0,0 +1,234 @@
+# gateway/materializer.py
+"""
+Precomputed outfits for hot cities.
+
+For a configured list of cities (and users), a background thread keeps the
+pieces of /outfit-for-city and /smart-outfit ready: the city's weather, the
+outfit-service recommendation and each user's wardrobe match. The routes
+build their response from these instead of walking the whole chain.
+
+Weather is re-fetched every interval (the weather service caches it, so this
+is cheap), but the recommendation and the wardrobe matches are only
+recomputed when the weather crosses a temperature band edge or the condition
+changes, since nothing else feeds them. A wardrobe write drops that user's
+matches right away (served live until recomputed) and wakes the thread.
+
+State is per process, but each match remembers the user's response-cache
+generation it was computed under and is only served while that is current.
+The generations are shared between workers (or replicas, with Redis), so the
+one /cache/invalidate call a wardrobe write sends retires the user's matches
+in every worker, not just the one that received it; the next refresh there
+recomputes them. Matches are also aged on their own: however steady the
+weather, none is served more than max_age after it was computed.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_right
+
+from response_cache import normalize_city
+
+log = logging.getLogger(__name__)
+
+# Where the answers can change: outfit-service's rule bands (0/10/20C) plus
+# the wardrobe scorer's warmth steps (5/15C)
+DEFAULT_BAND_EDGES = (0, 5, 10, 15, 20)
+
+
+def live(data):
+    """Only real, current answers are materialized: never defaults or last-known-good data"""
+    return data.get("source") not in ("fallback", "last_known_good")
+
+
+class CityView:
+    """Everything materialized for one city"""
+
+    def __init__(self, weather, delta_key, outfit, matches):
+        self.weather = weather
+        self.delta_key = delta_key
+        self.outfit = outfit
+        self.matches = matches  # user_id -> (wardrobe match, generation, computed_at)
+        self.refreshed_at = time.monotonic()  # of the weather; matches keep their own time
+
+
+class Materializer:
+    """
+    fetch_weather(city), fetch_outfit(temperature, condition) and
+    fetch_matches(temperature, condition, recommendation, user_ids) are the
+    gateway's own downstream calls; anything but a live answer is never stored.
+    generation(user_id) returns the user's current wardrobe generation token,
+    or None when it can't be read (nothing is served for the user then).
+    """
+
+    def __init__(self, cities, users, fetch_weather, fetch_outfit, fetch_matches, generation=None,
+                 band_edges=DEFAULT_BAND_EDGES, interval=60.0, max_age=180.0):
+        self.cities = {normalize_city(city): city for city in cities}
+        self.users = list(dict.fromkeys(users))
+        self.fetch_weather = fetch_weather
+        self.fetch_outfit = fetch_outfit
+        self.fetch_matches = fetch_matches
+        self.generation = generation or (lambda user_id: "0")
+        self.band_edges = sorted(band_edges)
+        self.interval = interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._views = {}
+        self._invalidations = {}  # user_id -> count, to spot writes that race a refresh
+        self._wake = threading.Event()
+        self._pid = None
+        self.refreshes = 0
+        self.recomputes = 0
+        self.matches_computed = 0
+        self.failures = 0
+
+    @property
+    def enabled(self):
+        return bool(self.cities)
+
+    def delta_key(self, weather):
+        """(temperature band, condition): the only inputs the recommendation and matches depend on"""
+        return bisect_right(self.band_edges, weather["temperature"]), weather["condition"].lower()
+
+    def refresh(self, key):
+        city = self.cities[key]
+        weather = self.fetch_weather(city)
+        if not live(weather):
+            self.failures += 1
+            return  # keep serving the last view until it's too old
+        temperature, condition = weather["temperature"], weather["condition"].lower()
+        delta_key = self.delta_key(weather)
+
+        with self._lock:
+            view = self._views.get(key)
+            invalidations = dict(self._invalidations)
+        # Read before fetching, like response cache keys: a write mid-fetch leaves these behind
+        generations = {user: self.generation(user) for user in self.users}
+        if view is None or view.delta_key != delta_key:
+            outfit = self.fetch_outfit(temperature, condition)
+            if not live(outfit["recommendation"]):
+                self.failures += 1
+                return
+            matches = {}
+            self.recomputes += 1
+            if view is not None:
+                log.info("Weather moved for %s, recomputing outfits", city,
+                         extra={"city": city, "temperature": temperature, "condition": condition})
+        else:
+            # Recomputed before they would expire, so a steady city never goes unserved
+            keep_until = self.max_age - self.interval
+            outfit = view.outfit
+            matches = {user: entry for user, entry in view.matches.items()
+                       if entry[1] is not None and entry[1] == generations.get(user)
+                       and time.monotonic() - entry[2] < keep_until}
+
+        missing = [user for user in self.users if user not in matches]
+        if missing:
+            fresh = self.fetch_matches(temperature, condition, outfit["recommendation"], missing)
+            self.matches_computed += len(fresh)
+            computed_at = time.monotonic()
+            matches.update((user, (match, generations[user], computed_at)) for user, match in fresh.items())
+
+        with self._lock:
+            # Wardrobes written while we were fetching: those matches may predate the write
+            for user, count in self._invalidations.items():
+                if invalidations.get(user) != count:
+                    matches.pop(user, None)
+            self._views[key] = CityView(weather, delta_key, outfit, matches)
+        self.refreshes += 1
+
+    def refresh_all(self):
+        for key in self.cities:
+            try:
+                self.refresh(key)
+            except Exception as e:
+                log.warning("Materializing %s failed: %s", self.cities[key], e)
+                self.failures += 1
+
+    def _run(self):
+        while True:
+            self.refresh_all()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        """Start the refresh thread once per process (safe to call after a fork)"""
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='materializer', daemon=True).start()
+
+    def invalidate_user(self, user_id):
+        """The user's wardrobe changed: stop serving their matches and recompute them soon"""
+        with self._lock:
+            self._invalidations[user_id] = self._invalidations.get(user_id, 0) + 1
+            for view in self._views.values():
+                view.matches.pop(user_id, None)
+        if user_id in self.users:
+            self._wake.set()
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+        self._wake.set()
+
+    def _view(self, city):
+        with self._lock:
+            view = self._views.get(normalize_city(city))
+        if view is None or time.monotonic() - view.refreshed_at > self.max_age:
+            return None
+        return view
+
+    def outfit_for_city(self, city):
+        """(weather, outfit, age_seconds) or None"""
+        view = self._view(city)
+        if view is None:
+            return None
+        return view.weather, view.outfit, int(time.monotonic() - view.refreshed_at)
+
+    def smart_outfit(self, city, user_id):
+        """(weather, outfit, wardrobe match, age_seconds) or None"""
+        view = self._view(city)
+        entry = view.matches.get(user_id) if view else None
+        if entry is None:
+            return None
+        match, generation, computed_at = entry
+        now = time.monotonic()
+        if now - computed_at > self.max_age or generation is None or generation != self.generation(user_id):
+            return None  # wardrobe changed, maybe via another worker: served live until recomputed
+        return view.weather, view.outfit, match, int(now - min(view.refreshed_at, computed_at))
+
+    def stats(self):
+        with self._lock:
+            views = {
+                key: {"temperature_band": view.delta_key[0], "condition": view.delta_key[1],
+                      "users": len(view.matches), "age_seconds": int(time.monotonic() - view.refreshed_at)}
+                for key, view in self._views.items()
+            }
+        return {
+            "enabled": self.enabled,
+            "cities": views,
+            "users": len(self.users),
+            "refreshes": self.refreshes,
+            "recomputes": self.recomputes,
+            "matches_computed": self.matches_computed,
+            "failures": self.failures
+        }
+
+
+def materializer_from_env(fetch_weather, fetch_outfit, fetch_matches, generation=None):
+    def env_list(name, default=""):
+        return [value.strip() for value in os.getenv(name, default).split(",") if value.strip()]
+
+    interval = float(os.getenv('MATERIALIZE_INTERVAL', '60'))
+    return Materializer(
+        env_list('MATERIALIZE_CITIES'),
+        env_list('MATERIALIZE_USERS', 'user123'),
+        fetch_weather, fetch_outfit, fetch_matches, generation,
+        band_edges=[float(edge) for edge in env_list('MATERIALIZE_BAND_EDGES')] or DEFAULT_BAND_EDGES,
+        interval=interval,
+        max_age=float(os.getenv('MATERIALIZE_MAX_AGE', str(interval * 3)))
+    )
@@ -0,0 +1,281 @@
+# gateway/response_cache.py
+"""
+Short-lived cache for whole gateway responses.
+
+Entries are keyed on (endpoint, user, normalized city). Every user has a
+generation that is part of the key, so invalidating a user (their wardrobe
+changed) is a single counter bump instead of a key scan; the old entries
+simply age out. clear() bumps a global epoch that is part of every generation,
+so a response computed before the clear can never be stored under a key that
+is reachable after it.
+
+Backends mirror circuit_breaker.py: MemoryCacheBackend (default) or
+RedisCacheBackend (RESPONSE_CACHE_BACKEND=redis) shared by all replicas. The
+memory backend's entries are per process, but its generations live in shared
+memory: an invalidation that reaches one gunicorn worker makes every worker
+forked from the same master (GUNICORN_PRELOAD, the default) miss. Without a
+shared parent (preload off, uvicorn --workers) they are per process too, and
+a multi-worker gateway needs the Redis backend for invalidations to reach
+every worker.
+"""
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+def normalize_city(city):
+    return " ".join(city.split()).lower()
+
+
+class SharedGenerations:
+    """
+    Generation counters in an anonymous shared mapping, inherited by forked
+    workers. Users hash into a fixed number of slots, so a collision only
+    invalidates another user's entries too; slot 0 is the global epoch.
+    """
+
+    def __init__(self, slots=65536):
+        self.slots = slots
+        self._map = mmap.mmap(-1, (slots + 1) * 8)  # MAP_SHARED: writes are seen across fork
+        self._counters = memoryview(self._map).cast("Q")
+        self._lock = multiprocessing.Lock()
+
+    def _slot(self, user):
+        return 1 + zlib.crc32(user.encode()) % self.slots
+
+    def get(self, user):
+        return f"{self._counters[0]}.{self._counters[self._slot(user)]}"
+
+    def bump(self, user=None):
+        """Bump one user's generation, or with no user the epoch (everyone's)"""
+        slot = 0 if user is None else self._slot(user)
+        with self._lock:
+            self._counters[slot] += 1
+
+
+class MemoryCacheBackend:
+    """LRU-bounded dict; expiry on the monotonic clock, ages on the wall clock"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, stored_at, body)
+        self._generations = SharedGenerations()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, stored_at, body = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return stored_at, body
+
+    def set(self, key, body, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, time.time(), body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def generation(self, user):
+        return self._generations.get(user)
+
+    def bump(self, user):
+        self._generations.bump(user)
+
+    def clear(self):
+        self._generations.bump()
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Entries shared through Redis; expiry is left to key TTLs on the server"""
+
+    def __init__(self, url, prefix="gateway:cache"):
+        import redis  # optional dependency, only needed for the shared backend
+
+        self.redis = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        raw = self.redis.get(f"{self.prefix}:{key}")
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry["stored_at"], entry["body"]
+
+    def set(self, key, body, ttl):
+        entry = json.dumps({"stored_at": time.time(), "body": body}, default=str)
+        self.redis.set(f"{self.prefix}:{key}", entry, px=int(ttl * 1000))
+
+    def generation(self, user):
+        epoch, generation = self.redis.mget(f"{self.prefix}:epoch", f"{self.prefix}:gen:{user}")
+        return f"{int(epoch or 0)}.{int(generation or 0)}"
+
+    def bump(self, user):
+        self.redis.incr(f"{self.prefix}:gen:{user}")
+
+    def clear(self):
+        # Epoch first: responses already in flight then store under unreachable keys
+        self.redis.incr(f"{self.prefix}:epoch")
+        for key in self.redis.scan_iter(f"{self.prefix}:*"):
+            if not key.decode().startswith((f"{self.prefix}:gen:", f"{self.prefix}:epoch")):
+                self.redis.delete(key)
+
+    def size(self):
+        return None  # not tracked for a shared store
+
+
+class ResponseCache:
+    """
+    Cached response bodies per endpoint.
+
+    ttls maps endpoint -> seconds; endpoints with a user are private to that
+    user, the others are shared (public) across users.
+    """
+
+    def __init__(self, backend, ttls, enabled=True):
+        self.backend = backend
+        self.ttls = ttls
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def key(self, endpoint, city, user=None):
+        """
+        Cache key for one request. Taken once, before computing the response, so
+        an invalidation that lands mid-request makes the result unreachable.
+        """
+        try:
+            # Shared entries get a generation too, so clear() covers them
+            generation = self.backend.generation(user or "*") if self.enabled else 0
+        except Exception as e:
+            log.warning("Response cache backend error: %s", e)
+            self._count("errors")
+            return None
+        return f"{endpoint}:{user or '*'}:{generation}:{normalize_city(city)}"
+
+    def generation(self, user):
+        """The user's current generation token, None if the backend can't say"""
+        try:
+            return self.backend.generation(user)
+        except Exception as e:
+            log.warning("Response cache backend error: %s", e)
+            self._count("errors")
+            return None
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        """(body, age_seconds) for a fresh entry, else None"""
+        if not self.enabled or key is None:
+            return None
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            # A broken shared store only costs us the cache, never the request
+            log.warning("Response cache backend error: %s", e)
+            self._count("errors")
+            return None
+        if entry is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        stored_at, body = entry
+        return body, max(0, int(time.time() - stored_at))
+
+    def set(self, endpoint, key, body):
+        if not self.enabled or key is None:
+            return
+        try:
+            self.backend.set(key, body, self.ttls[endpoint])
+            self._count("stores")
+        except Exception as e:
+            log.warning("Response cache backend error: %s", e)
+            self._count("errors")
+
+    def invalidate_user(self, user):
+        try:
+            self.backend.bump(user)
+            self._count("invalidations")
+        except Exception as e:
+            log.warning("Response cache backend error: %s", e)
+            self._count("errors")
+
+    def clear(self):
+        try:
+            self.backend.clear()
+            self._count("invalidations")
+        except Exception as e:
+            log.warning("Response cache backend error: %s", e)
+            self._count("errors")
+
+    def headers(self, endpoint, user=None, age=None, cacheable=True):
+        """
+        Cache-Control/Age so the browser and the ingress can reuse the response
+        too; age is None for a freshly computed response.
+        """
+        if not self.enabled or not cacheable:
+            return {"Cache-Control": "no-store"}
+        scope = "private" if user else "public"
+        return {
+            "Cache-Control": f"{scope}, max-age={max(0, int(self.ttls[endpoint]) - (age or 0))}",
+            "Age": str(age or 0),
+            "X-Cache": "MISS" if age is None else "HIT"
+        }
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "ttls": self.ttls,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "evictions": self.backend.evictions,
+            "size": self.backend.size()
+        }
+
+
+def response_cache_from_env():
+    if os.getenv('RESPONSE_CACHE_BACKEND', 'memory').lower() == 'redis':
+        backend = RedisCacheBackend(os.getenv('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+    else:
+        backend = MemoryCacheBackend(int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000')))
+    return ResponseCache(
+        backend,
+        ttls={
+            "outfit-for-city": float(os.getenv('CACHE_TTL_OUTFIT_FOR_CITY', '60')),
+            "smart-outfit": float(os.getenv('CACHE_TTL_SMART_OUTFIT', '30'))
+        },
+        enabled=os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    )
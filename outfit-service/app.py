@@ -1,81 +1,181 @@
 # outfit-service/app.py
 from flask import Flask, jsonify
+import math
+import os
+import sys
+from pathlib import Path
+# Shared modules: ../common when run from the repo, copied next to this file in the image
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from instrumentation import instrument_flask
+from structured_logging import setup_logging
+from wire import request_body, respond, wants_minimal
 
+log = setup_logging("outfit")
 app = Flask(__name__)
+instrument_flask(app, "outfit")
 
-# Clothing rules engine
-def get_outfit_recommendation(temperature, condition):
-    recommendations = {
-        "base": "",
-        "layers": [],
+# Clothing rules, as data: temperature bands (upper bound exclusive, None = no bound)
+TEMPERATURE_BANDS = [
+    (0, {
+        "base": "thermal wear",
+        "layers": ["warm sweater", "winter coat"],
+        "accessories": ["scarf", "gloves", "beanie"],
+        "footwear": "insulated boots",
+        "style_tip": "Layer up! It's freezing out there ❄️"
+    }),
+    (10, {
+        "base": "long-sleeve shirt",
+        "layers": ["jacket or hoodie"],
+        "accessories": ["scarf"],
+        "footwear": "closed shoes or boots",
+        "style_tip": "Perfect jacket weather! 🍂"
+    }),
+    (20, {
+        "base": "t-shirt or light sweater",
+        "layers": ["light jacket (optional)"],
         "accessories": [],
-        "footwear": "",
-        "style_tip": ""
+        "footwear": "sneakers or casual shoes",
+        "style_tip": "Comfortable and casual 🌤️"
+    }),
+    (None, {
+        "base": "t-shirt or tank top",
+        "layers": [],
+        "accessories": ["sunglasses"],
+        "footwear": "sandals or breathable shoes",
+        "style_tip": "Stay cool and hydrated! ☀️"
+    })
+]
+
+# Weather condition adjustments applied on top of the temperature band
+CONDITION_ADJUSTMENTS = {
+    "rainy": {"add_accessories": ["umbrella"], "footwear": "waterproof shoes", "style_tip": " Don't forget rain protection! ☔"},
+    "snow": {"add_accessories": ["warm gloves", "earmuffs"], "style_tip": " Winter wonderland ready! ⛄"},
+    "sunny": {"add_accessories": ["sunglasses"], "style_tip": " Perfect for sunglasses! 😎"}
+}
+
+# Integer temperatures the lookup table covers; anything outside is clamped,
+# which is exact because both ends fall inside the open-ended outer bands
+MIN_TEMPERATURE = int(os.getenv('RULES_MIN_TEMPERATURE', '-60'))
+MAX_TEMPERATURE = int(os.getenv('RULES_MAX_TEMPERATURE', '60'))
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '1000'))
+
+
+class FrozenDict(dict):
+    """dict that refuses mutation, so cached results can be shared safely (still JSON-serializable)"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("recommendations are immutable")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+def build_recommendation(temperature, condition):
+    """Apply the rule table to one (temperature, condition) pair"""
+    for upper, band in TEMPERATURE_BANDS:
+        if upper is None or temperature < upper:
+            break
+    recommendation = {
+        "base": band["base"],
+        "layers": list(band["layers"]),
+        "accessories": list(band["accessories"]),
+        "footwear": band["footwear"],
+        "style_tip": band["style_tip"]
     }
-    
-    # Temperature-based logic
-    if temperature < 0:
-        recommendations.update({
-            "base": "thermal wear",
-            "layers": ["warm sweater", "winter coat"],
-            "accessories": ["scarf", "gloves", "beanie"],
-            "footwear": "insulated boots",
-            "style_tip": "Layer up! It's freezing out there ❄️"
-        })
-    elif temperature < 10:
-        recommendations.update({
-            "base": "long-sleeve shirt",
-            "layers": ["jacket or hoodie"],
-            "accessories": ["scarf"],
-            "footwear": "closed shoes or boots", 
-            "style_tip": "Perfect jacket weather! 🍂"
-        })
-    elif temperature < 20:
-        recommendations.update({
-            "base": "t-shirt or light sweater",
-            "layers": ["light jacket (optional)"],
-            "accessories": [],
-            "footwear": "sneakers or casual shoes",
-            "style_tip": "Comfortable and casual 🌤️"
-        })
-    else:
-        recommendations.update({
-            "base": "t-shirt or tank top",
-            "layers": [],
-            "accessories": ["sunglasses"],
-            "footwear": "sandals or breathable shoes",
-            "style_tip": "Stay cool and hydrated! ☀️"
-        })
-    
-    # Weather condition adjustments
-    if condition == "rainy":
-        recommendations["accessories"].append("umbrella")
-        recommendations["footwear"] = "waterproof shoes"
-        recommendations["style_tip"] += " Don't forget rain protection! ☔"
-    elif condition == "snow":
-        recommendations["accessories"].extend(["warm gloves", "earmuffs"])
-        recommendations["style_tip"] += " Winter wonderland ready! ⛄"
-    elif condition == "sunny":
-        recommendations["accessories"].append("sunglasses")
-        recommendations["style_tip"] += " Perfect for sunglasses! 😎"
-    
-    return recommendations
+    adjustment = CONDITION_ADJUSTMENTS.get(condition)
+    if adjustment:
+        recommendation["accessories"].extend(adjustment.get("add_accessories", []))
+        recommendation["footwear"] = adjustment.get("footwear", recommendation["footwear"])
+        recommendation["style_tip"] += adjustment.get("style_tip", "")
+    return FrozenDict(
+        (key, tuple(value) if isinstance(value, list) else value)
+        for key, value in recommendation.items()
+    )
+
+
+def compile_rules():
+    """Precompute every answer: {condition: [result for each integer temperature]}"""
+    conditions = [None] + list(CONDITION_ADJUSTMENTS)
+    temperatures = range(MIN_TEMPERATURE, MAX_TEMPERATURE + 1)
+    return {
+        condition: tuple(build_recommendation(t, condition) for t in temperatures)
+        for condition in conditions
+    }
+
+
+RULE_TABLE = compile_rules()
+
+
+# Clothing rules engine
+def get_outfit_recommendation(temperature, condition):
+    """
+    O(1) lookup into the precompiled rule table; the result is shared and immutable.
+    Fractional temperatures round to the nearest degree on every route (-0.6 is -1, not 0).
+    """
+    row = RULE_TABLE.get(condition) or RULE_TABLE[None]
+    index = min(max(int(round(temperature)), MIN_TEMPERATURE), MAX_TEMPERATURE) - MIN_TEMPERATURE
+    return row[index]
 
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "healthy", "service": "outfit"})
 
-@app.route('/recommend/<int:temperature>/<condition>', methods=['GET'])
+@app.route('/recommend/<temperature>/<condition>', methods=['GET'])
 def recommend_outfit(temperature, condition):
+    try:
+        temperature = float(temperature)
+    except ValueError:
+        temperature = math.nan
+    if not math.isfinite(temperature):
+        return respond({"error": "temperature must be a number"}, 400)
+    temperature = int(round(temperature))
     try:
         recommendation = get_outfit_recommendation(temperature, condition)
-        return jsonify({
+        if wants_minimal():
+            return respond({"recommendation": recommendation})
+        return respond({
             "temperature": temperature,
             "condition": condition,
             "recommendation": recommendation
         })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return respond({"error": str(e)}, 500)
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """
+    Many recommendations in one round trip.
+    Body: {"queries": [{"temperature": 5, "condition": "rainy"}, [22, "sunny"], ...]}
+    """
+    payload = request_body()
+    queries = payload.get("queries") if isinstance(payload, dict) else None
+    if not isinstance(queries, list):
+        return respond({"error": "Expected a JSON body with a 'queries' list"}, 400)
+    if len(queries) > MAX_BATCH_SIZE:
+        return respond({"error": f"Batch too large, max {MAX_BATCH_SIZE} queries"}, 400)
+    
+    minimal = wants_minimal()
+    results = []
+    for i, query in enumerate(queries):
+        if isinstance(query, dict):
+            temperature, condition = query.get("temperature"), query.get("condition")
+        elif isinstance(query, (list, tuple)) and len(query) == 2:
+            temperature, condition = query
+        else:
+            return respond({"error": f"Query {i} must be an object or a [temperature, condition] pair"}, 400)
+        if isinstance(temperature, bool) or not isinstance(temperature, (int, float)) or not isinstance(condition, str):
+            return respond({"error": f"Query {i} needs a numeric temperature and a string condition"}, 400)
+        if not math.isfinite(temperature):  # json accepts NaN, Infinity and 1e400
+            return respond({"error": f"Query {i} needs a finite temperature"}, 400)
+        
+        temperature = int(round(temperature))
+        recommendation = get_outfit_recommendation(temperature, condition)
+        if minimal:
+            results.append({"recommendation": recommendation})
+        else:
+            results.append({"temperature": temperature, "condition": condition, "recommendation": recommendation})
+    
+    return respond({"results": results, "count": len(results)})
 
 if __name__ == '__main__':
+    log.info("Starting outfit service", extra={"endpoint": "http://localhost:5002/recommend/15/sunny"})
     app.run(host='0.0.0.0', port=5002, debug=True)
\ No newline at end of file
@@ -1,12 +1,33 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context
+import base64
+import hashlib
+import json
+import multiprocessing
 import os
+import sys
+import threading
+import time
+import urllib.request
 import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import chain, islice
+from pathlib import Path
+# Shared modules: ../common when run from the repo, copied next to this file in the image
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from instrumentation import instrument_flask, span
+from structured_logging import setup_logging
+from wire import request_body, respond, wants_minimal
+from wardrobe_store import WardrobeStore, ClothingItem
+from outfit_optimizer import Scorer, match_chunk, match_outfit
 
+log = setup_logging("wardrobe")
 app = Flask(__name__)
+instrument_flask(app, "wardrobe")
 
-# In-memory "database" - in real app, use PostgreSQL/MongoDB
-user_clothes = {
+# Demo wardrobe loaded into the store at startup
+SEED_CLOTHES = {
     "user123": [
         {
             "id": "1",
@@ -65,70 +86,258 @@ user_clothes = {
     ]
 }
 
+MAX_IMPORT_ITEMS = int(os.getenv('MAX_IMPORT_ITEMS', '10000'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '1000'))
+MAX_TOP_K = int(os.getenv('MAX_TOP_K', '10'))
+# Batch matching: explicit user lists are capped; batches this big go to the process pool
+MATCH_BATCH_MAX_USERS = int(os.getenv('MATCH_BATCH_MAX_USERS', '100000'))
+MATCH_BATCH_PROCESSES = int(os.getenv('MATCH_BATCH_PROCESSES', str(os.cpu_count() or 1)))
+MATCH_BATCH_PROCESS_MIN_USERS = int(os.getenv('MATCH_BATCH_PROCESS_MIN_USERS', '200'))
+MATCH_BATCH_CHUNK_USERS = int(os.getenv('MATCH_BATCH_CHUNK_USERS', '50'))
+# Gateway response-cache hook, e.g. http://gateway:8000/cache/invalidate (unset = no hook)
+CACHE_INVALIDATE_URL = os.getenv('CACHE_INVALIDATE_URL')
+# Shared with the gateway, which refuses invalidations without it
+CACHE_INVALIDATE_TOKEN = os.getenv('CACHE_INVALIDATE_TOKEN', '')
+
+def create_repository():
+    """WARDROBE_BACKEND=sqlite (default, persistent) or memory (indexed, in-process, for tests)"""
+    backend = os.getenv('WARDROBE_BACKEND', 'sqlite').lower()
+    if backend == 'memory':
+        return WardrobeStore()
+    from sqlite_repository import SQLiteRepository
+    return SQLiteRepository(
+        os.getenv('WARDROBE_DB_PATH', 'wardrobe.db'),
+        pool_size=int(os.getenv('WARDROBE_DB_POOL_SIZE', '4'))
+    )
+
+wardrobe_repository = create_repository()
+wardrobe_repository.seed(SEED_CLOTHES)
+
+def notify_wardrobe_changed(user_id):
+    """Tell the gateway to drop the user's cached outfits; fire-and-forget so writes never wait on it"""
+    if not CACHE_INVALIDATE_URL:
+        return
+    
+    def send():
+        try:
+            req = urllib.request.Request(
+                CACHE_INVALIDATE_URL,
+                data=json.dumps({"user_id": user_id}).encode(),
+                headers={"Content-Type": "application/json", "X-Invalidate-Token": CACHE_INVALIDATE_TOKEN},
+                method="POST"
+            )
+            urllib.request.urlopen(req, timeout=2).close()
+        except Exception as e:
+            log.warning("Cache invalidation for %s failed: %s", user_id, e)
+    
+    threading.Thread(target=send, daemon=True).start()
+
 @app.route('/health')
 def health():
     return jsonify({
         "status": "healthy",
         "service": "wardrobe",
-        "clothes_count": len(user_clothes["user123"]),
+        "clothes_count": wardrobe_repository.count("user123"),
         "timestamp": datetime.now().isoformat()
     })
 
+def encode_cursor(seq):
+    return base64.urlsafe_b64encode(str(seq).encode()).decode()
+
+def decode_cursor(cursor):
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+def parse_listing_args(args):
+    """Filters, projection and paging from the query string; ValueError on bad input"""
+    filters = {key: args[key] for key in ("type", "color", "category") if args.get(key)}
+    for key in ("min_warmth", "max_warmth"):
+        if args.get(key):
+            filters[key] = int(args[key])
+    
+    fields = None
+    if args.get('fields'):
+        fields = tuple(field.strip() for field in args['fields'].split(','))
+        unknown = set(fields) - set(ClothingItem.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    
+    limit = None
+    if args.get('limit'):
+        limit = min(max(int(args['limit']), 1), MAX_PAGE_SIZE)
+    after_seq = decode_cursor(args['cursor']) if args.get('cursor') else 0
+    return filters, fields, limit, after_seq
+
+def project(item, fields):
+    return item.to_dict() if fields is None else {field: getattr(item, field) for field in fields}
+
 @app.route('/clothes', methods=['GET'])
 def get_all_clothes():
-    """Get all clothes for a user"""
+    """
+    Get clothes for a user.
+    Optional: type, color, category, min_warmth, max_warmth filters; fields=a,b projection;
+    limit + cursor pagination; format=ndjson (or Accept: application/x-ndjson) streaming.
+    """
     user_id = request.args.get('user_id', 'user123')
-    return jsonify({
-        "user_id": user_id,
-        "clothes": user_clothes.get(user_id, []),
-        "total_items": len(user_clothes.get(user_id, []))
-    })
+    try:
+        filters, fields, limit, after_seq = parse_listing_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    
+    # Same wardrobe version + same query = same body, so clients can revalidate cheaply
+    version = wardrobe_repository.version(user_id)
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    etag = hashlib.sha1(f"{user_id}|{version}|{query}".encode()).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+    
+    ndjson = (request.args.get('format') == 'ndjson'
+              or request.accept_mimetypes.best == 'application/x-ndjson')
+    
+    next_cursor = None
+    if limit is not None:
+        items = wardrobe_repository.page(user_id, after_seq=after_seq, limit=limit + 1, **filters)
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1].seq)
+    else:
+        items = wardrobe_repository.iter_items(user_id, after_seq=after_seq, **filters)
+    
+    if ndjson:
+        def generate():
+            for item in items:
+                yield json.dumps(project(item, fields)) + "\n"
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+    else:
+        clothes = [project(item, fields) for item in items]
+        response = jsonify({
+            "user_id": user_id,
+            "clothes": clothes,
+            "total_items": len(clothes),
+            "next_cursor": next_cursor
+        })
+    
+    response.set_etag(etag)
+    return response
 
-@app.route('/clothes/add', methods=['POST'])
-def add_clothing():
-    """Add a new clothing item"""
-    user_id = request.json.get('user_id', 'user123')
-    new_item = {
+def new_clothing_item(data):
+    """Build a stored item from request JSON; ValueError saying what is wrong with it"""
+    if not isinstance(data, dict):
+        raise ValueError("must be an object")
+    missing = [field for field in ("name", "type", "color", "warmth") if field not in data]
+    if missing:
+        raise ValueError(f"needs {', '.join(missing)}")
+    item = {
         "id": str(uuid.uuid4())[:8],
-        "name": request.json['name'],
-        "type": request.json['type'],
-        "color": request.json['color'],
-        "warmth": request.json['warmth'],
-        "category": request.json.get('category', 'casual'),
-        "image_url": request.json.get('image_url', '/images/default.jpg'),
+        "name": data['name'],
+        "type": data['type'],
+        "color": data['color'],
+        "warmth": data['warmth'],
+        "category": data.get('category', 'casual'),
+        "image_url": data.get('image_url', '/images/default.jpg'),
         "added_date": datetime.now().isoformat()
     }
+    for field in ("name", "type", "color", "category", "image_url"):
+        if not isinstance(item[field], str) or not item[field].strip():
+            raise ValueError(f"{field} must be a non-empty string")
+    # The scorer does arithmetic on warmth: 1 (light) to 3 (warm)
+    if isinstance(item["warmth"], bool) or not isinstance(item["warmth"], int) or not 1 <= item["warmth"] <= 3:
+        raise ValueError("warmth must be an integer from 1 to 3")
+    return item
+
+def request_user(body):
+    """(user_id, None) from a write request body, or (None, error response)"""
+    if not isinstance(body, dict):
+        return None, (jsonify({"error": "Expected a JSON object"}), 400)
+    user_id = body.get('user_id', 'user123')
+    if not isinstance(user_id, str) or not user_id:
+        return None, (jsonify({"error": "user_id must be a non-empty string"}), 400)
+    return user_id, None
+
+@app.route('/clothes/add', methods=['POST'])
+def add_clothing():
+    """Add a new clothing item"""
+    body = request.get_json(silent=True)
+    user_id, error = request_user(body)
+    if error:
+        return error
+    try:
+        new_item = new_clothing_item(body)
+    except ValueError as e:
+        return jsonify({"error": f"Item {e}"}), 400
     
-    if user_id not in user_clothes:
-        user_clothes[user_id] = []
-    
-    user_clothes[user_id].append(new_item)
+    wardrobe_repository.add(user_id, new_item)
+    notify_wardrobe_changed(user_id)
     
     return jsonify({
         "message": "Clothing item added successfully",
         "item": new_item,
-        "total_items": len(user_clothes[user_id])
+        "total_items": wardrobe_repository.count(user_id)
+    })
+
+@app.route('/clothes/import', methods=['POST'])
+def import_clothes():
+    """Bulk-add many items for one user in a single transaction"""
+    body = request.get_json(silent=True)
+    user_id, error = request_user(body)
+    if error:
+        return error
+    items = body.get('items')
+    if not isinstance(items, list):
+        return jsonify({"error": "Expected an 'items' list"}), 400
+    if len(items) > MAX_IMPORT_ITEMS:
+        return jsonify({"error": f"Too many items, max {MAX_IMPORT_ITEMS} per import"}), 400
+    
+    new_items = []
+    for i, data in enumerate(items):
+        try:
+            new_items.append(new_clothing_item(data))
+        except ValueError as e:
+            return jsonify({"error": f"Item {i} {e}"}), 400
+    
+    imported = wardrobe_repository.add_many(user_id, new_items)
+    notify_wardrobe_changed(user_id)
+    
+    return jsonify({
+        "message": f"Imported {imported} clothing items",
+        "imported": imported,
+        "total_items": wardrobe_repository.count(user_id)
     })
 
+def parse_top_k(body, default):
+    """top_k from a match request, clamped to 1..MAX_TOP_K; None if it isn't a number"""
+    try:
+        return min(max(int(body.get('top_k', default)), 1), MAX_TOP_K)
+    except (TypeError, ValueError):
+        return None
+
 @app.route('/clothes/match', methods=['POST'])
 def match_clothes_to_weather():
     """
     Match user's actual clothes to weather conditions
     This is where the magic happens!
     """
-    user_id = request.json.get('user_id', 'user123')
-    temperature = request.json['temperature']
-    condition = request.json['condition']
-    recommendation = request.json.get('recommendation', {})
+    body = request_body()
+    if not isinstance(body, dict) or "temperature" not in body or "condition" not in body:
+        return respond({"error": "temperature and condition are required"}, 400)
+    user_id = body.get('user_id', 'user123')
+    temperature = body['temperature']
+    condition = body['condition']
+    recommendation = body.get('recommendation', {})
+    top_k = parse_top_k(body, 3)
+    if top_k is None:
+        return respond({"error": "top_k must be an integer"}, 400)
     
-    user_items = user_clothes.get(user_id, [])
-    
-    print(f"🎯 Matching clothes for {temperature}°C, {condition}")
+    log.info("Matching clothes", extra={"temperature": temperature, "condition": condition, "sampled": True})
     
     # Smart matching algorithm
-    matched_outfit = find_best_outfit(user_items, temperature, condition, recommendation)
+    matched_outfit = find_best_outfit(user_id, temperature, condition, recommendation, top_k)
     
-    return jsonify({
+    if wants_minimal():
+        # The gateway already knows the weather and the recommendation it sent
+        return respond({"matched_outfit": matched_outfit, "match_confidence": matched_outfit["confidence"]})
+    return respond({
         "weather_conditions": {"temperature": temperature, "condition": condition},
         "recommendation": recommendation,
         "matched_outfit": matched_outfit,
@@ -136,58 +345,113 @@ def match_clothes_to_weather():
         "message": "Found the perfect outfit from your wardrobe! 👗"
     })
 
-def find_best_outfit(clothes, temperature, condition, recommendation):
-    """Smart algorithm to find best outfit combination"""
+@app.route('/clothes/match/batch', methods=['POST'])
+def match_clothes_batch():
+    """
+    Today's outfit for many users under the same weather, streamed as NDJSON.
+    Body: {"temperature": 5, "condition": "rainy", "recommendation": {...},
+           "user_ids": ["u1", "u2", ...] or "all", "top_k": 1}
+    One line per user ({"user_id", "matched_outfit", "match_confidence"}), then
+    a final {"done": true, "users": n} line so clients can tell a complete stream
+    from a cut one.
+    """
+    body = request_body()
+    if not isinstance(body, dict) or "temperature" not in body or "condition" not in body:
+        return respond({"error": "temperature and condition are required"}, 400)
+    user_ids = body.get('user_ids', 'all')
+    if user_ids == 'all':
+        user_ids = wardrobe_repository.iter_user_ids()
+    elif not isinstance(user_ids, list) or not all(isinstance(user_id, str) for user_id in user_ids):
+        return respond({"error": "user_ids must be a list of user IDs or \"all\""}, 400)
+    elif len(user_ids) > MATCH_BATCH_MAX_USERS:
+        return respond({"error": f"Too many users, max {MATCH_BATCH_MAX_USERS} per batch (or use \"all\")"}, 400)
+    temperature = body['temperature']
+    condition = body['condition']
+    recommendation = body.get('recommendation', {})
+    # Checked before streaming starts: an error inside generate() would cut the stream short
+    top_k = parse_top_k(body, 1)
+    if top_k is None:
+        return respond({"error": "top_k must be an integer"}, 400)
+    
+    def generate():
+        started = time.perf_counter()
+        count = 0
+        # Same weather for everyone: the advice is worked out once
+        advice = get_fashion_advice(temperature, condition)
+        for user_id, outfit in match_users(user_ids, temperature, condition, recommendation, top_k):
+            outfit["fashion_advice"] = advice
+            count += 1
+            yield json.dumps({"user_id": user_id, "matched_outfit": outfit,
+                              "match_confidence": outfit["confidence"]}) + "\n"
+        log.info("Batch match streamed", extra={"users": count, "condition": condition,
+                                                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+        yield json.dumps({"done": True, "users": count}) + "\n"
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+def load_candidates(user_id):
+    """(tops, bottoms, layers, footwear) for one user, in a single repository read"""
+    tops, bottoms, layers, footwear = [], [], [], []
+    slots = {"top": tops, "dress": tops, "bottom": bottoms, "layer": layers, "footwear": footwear}
+    for item in wardrobe_repository.of_types(user_id, tuple(slots)):
+        slots[item.type].append(item)
+    return tops, bottoms, layers, footwear
+
+def find_best_outfit(user_id, temperature, condition, recommendation, top_k=1):
+    """Smart algorithm to find best outfit combination: scores every top x bottom x layer x footwear"""
+    scorer = Scorer(temperature, condition, recommendation)
     
-    # Determine warmth level needed
-    if temperature < 5:
-        needed_warmth = 3  # Very warm
-    elif temperature < 15:
-        needed_warmth = 2  # Medium warm
-    else:
-        needed_warmth = 1  # Light
-    
-    # Filter clothes by type and warmth
-    tops = [item for item in clothes if item['type'] in ['top', 'dress'] and item['warmth'] <= needed_warmth]
-    bottoms = [item for item in clothes if item['type'] == 'bottom' and item['warmth'] <= needed_warmth]
-    layers = [item for item in clothes if item['type'] == 'layer' and item['warmth'] >= needed_warmth]
-    footwear = [item for item in clothes if item['type'] == 'footwear']
-    
-    # Weather-specific adjustments
-    if condition == "rainy":
-        footwear = [item for item in footwear if item['category'] != 'summer']
-    elif condition == "snow":
-        footwear = [item for item in footwear if item['category'] == 'winter']
-    elif condition == "sunny":
-        tops = [item for item in tops if item['color'] not in ['black', 'navy']]  # Prefer lighter colors
-    
-    # Select best matches
-    selected_top = tops[0] if tops else {"name": "No top found", "type": "top"}
-    selected_bottom = bottoms[0] if bottoms else {"name": "No bottom found", "type": "bottom"}
-    selected_layer = layers[0] if layers else None
-    selected_footwear = footwear[0] if footwear else {"name": "No footwear found", "type": "footwear"}
-    
-    # Calculate confidence score
-    confidence = min(len(tops), len(bottoms), len(footwear)) / 3.0
-    
-    return {
-        "top": selected_top,
-        "bottom": selected_bottom,
-        "layer": selected_layer,
-        "footwear": selected_footwear,
-        "confidence": round(confidence, 2),
-        "outfit_style": get_outfit_style(selected_top, selected_bottom),
-        "fashion_advice": get_fashion_advice(temperature, condition)
-    }
+    # Candidates per slot straight from the type indexes
+    with span("candidates"):
+        candidates = load_candidates(user_id)
+    with span("search"):
+        best = match_outfit(scorer, *candidates, top_k=top_k)
+    
+    best["fashion_advice"] = get_fashion_advice(temperature, condition)
+    return best
 
-def get_outfit_style(top, bottom):
-    colors = [top.get('color', ''), bottom.get('color', '')]
-    if any(c in ['red', 'yellow', 'pink'] for c in colors):
-        return "bold and colorful"
-    elif all(c in ['black', 'white', 'gray'] for c in colors):
-        return "minimalist and chic"
-    else:
-        return "casual and stylish"
+_match_pool = None
+_match_pool_lock = threading.Lock()
+
+def match_process_pool():
+    """Started on first use; spawn, not fork, so workers never inherit this process's threads and locks"""
+    global _match_pool
+    with _match_pool_lock:
+        if _match_pool is None:
+            _match_pool = ProcessPoolExecutor(max_workers=MATCH_BATCH_PROCESSES,
+                                              mp_context=multiprocessing.get_context("spawn"))
+        return _match_pool
+
+def match_users(user_ids, temperature, condition, recommendation, top_k):
+    """
+    (user_id, outfit) for each user, in order. One Scorer serves the whole batch.
+    Small batches are matched inline; big ones are read here and scored on the
+    process pool, with a bounded number of chunks in flight so memory stays flat.
+    """
+    user_ids = iter(user_ids)
+    head = list(islice(user_ids, MATCH_BATCH_PROCESS_MIN_USERS))
+    if MATCH_BATCH_PROCESSES <= 0 or len(head) < MATCH_BATCH_PROCESS_MIN_USERS:
+        scorer = Scorer(temperature, condition, recommendation)
+        for user_id in chain(head, user_ids):
+            yield user_id, match_outfit(scorer, *load_candidates(user_id), top_k=top_k)
+        return
+    
+    pool = match_process_pool()
+    query = (temperature, condition, recommendation, top_k)
+    pending = deque()
+    user_ids = chain(head, user_ids)
+    try:
+        while True:
+            chunk = [(user_id, *load_candidates(user_id)) for user_id in islice(user_ids, MATCH_BATCH_CHUNK_USERS)]
+            if chunk:
+                pending.append(pool.submit(match_chunk, query, chunk))
+            if pending and (not chunk or len(pending) >= 2 * MATCH_BATCH_PROCESSES):
+                yield from pending.popleft().result()
+            elif not chunk:
+                return
+    finally:
+        for future in pending:
+            future.cancel()  # the client went away: don't score chunks nobody will read
 
 def get_fashion_advice(temp, condition):
     advice = {
@@ -199,8 +463,5 @@ def get_fashion_advice(temp, condition):
     return advice.get(condition, "✨ You're going to look amazing!")
 
 if __name__ == '__main__':
-    print("👕 Starting Wardrobe Service on port 5003")
-    print("📁 Manages user's clothing inventory")
-    print("🎯 Smart outfit matching from real clothes")
-    print("📍 Endpoint: http://localhost:5003/clothes")
+    log.info("Starting wardrobe service", extra={"endpoint": "http://localhost:5003/clothes"})
     app.run(host='0.0.0.0', port=5003, debug=True)
\ No newline at end of file
@@ -0,0 +1,234 @@
+# wardrobe-service/outfit_optimizer.py
+"""
+Scored outfit search: top x bottom x layer x footwear.
+
+Every candidate item gets a unary score (warmth fit, condition suitability,
+overlap with the outfit-service recommendation). The only pairwise term is the
+top/bottom color harmony, so layer and footwear are ranked independently and
+the top/bottom pairs are explored best-first with branch-and-bound: once even
+the most optimistic completion of a branch cannot beat the k-th best outfit
+found so far, the rest of that (sorted) branch is skipped.
+
+A Scorer only depends on the weather and the recommendation, so batch matching
+builds one and reuses it (and its memoized scores) for every user.
+"""
+import heapq
+import re
+from operator import attrgetter, itemgetter
+
+SCORE_KEY = attrgetter("warmth", "color", "category")
+NAME = attrgetter("name")
+
+WEIGHTS = {"warmth": 0.4, "condition": 0.3, "recommendation": 0.15, "harmony": 0.15}
+
+# How well each outfit style (see get_outfit_style) holds together
+STYLE_HARMONY = {"minimalist and chic": 1.0, "casual and stylish": 0.8, "bold and colorful": 0.6}
+
+# condition -> slot -> {category or color: suitability}; missing keys score "default"
+CONDITION_SUITABILITY = {
+    "rainy": {"footwear": {"summer": 0.0, "winter": 1.0, "default": 0.8}},
+    "snow": {"footwear": {"winter": 1.0, "default": 0.1}, "layer": {"winter": 1.0, "default": 0.7}},
+    "sunny": {"top": {"black": 0.2, "navy": 0.2, "default": 1.0}, "footwear": {"summer": 1.0, "default": 0.8}}
+}
+
+WORD = re.compile(r"[a-z]{3,}")
+
+
+def get_outfit_style(top, bottom):
+    colors = [top.get('color', ''), bottom.get('color', '')]
+    if any(c in ['red', 'yellow', 'pink'] for c in colors):
+        return "bold and colorful"
+    elif all(c in ['black', 'white', 'gray'] for c in colors):
+        return "minimalist and chic"
+    else:
+        return "casual and stylish"
+
+
+def needed_warmth_for(temperature):
+    if temperature < 5:
+        return 3  # Very warm
+    elif temperature < 15:
+        return 2  # Medium warm
+    return 1  # Light
+
+
+def recommendation_words(recommendation):
+    """Words like 'boots' or 'jacket' from the outfit-service recommendation"""
+    words = set()
+    for value in (recommendation or {}).values():
+        for text in (value if isinstance(value, (list, tuple)) else [value]):
+            if isinstance(text, str):
+                words.update(WORD.findall(text.lower()))
+    return words
+
+
+class Scorer:
+    """Unary item scores for one (temperature, condition, recommendation) query"""
+
+    def __init__(self, temperature, condition, recommendation=None):
+        self.needed_warmth = needed_warmth_for(temperature)
+        self.rules = CONDITION_SUITABILITY.get(condition, {})
+        self.words = recommendation_words(recommendation)
+        # Without a recommendation that term is dropped instead of scoring everyone 0
+        weights = dict(WEIGHTS)
+        if not self.words:
+            weights.pop("recommendation")
+        total = sum(weights.values())
+        self.weights = {name: weight / total for name, weight in weights.items()}
+        self.w_warmth = self.weights["warmth"]
+        self.w_condition = self.weights["condition"]
+        self.w_recommendation = self.weights.get("recommendation", 0.0)
+        self.w_harmony = self.weights["harmony"]
+        # One regex search per name instead of tokenizing every name in Python
+        self.name_matches = re.compile(
+            r"(?<![a-z])(?:%s)(?![a-z])" % "|".join(map(re.escape, sorted(self.words))), re.IGNORECASE
+        ).search if self.words else None
+        self._harmony = {}
+        self._bases = {}  # (slot, warmth, color, category) -> base score, across every rank() call
+
+    def suitability(self, slot, color, category):
+        table = self.rules.get("top" if slot == "dress" else slot)
+        if not table:
+            return 1.0
+        return table.get(category, table.get(color, table["default"]))
+
+    def base(self, slot, warmth, color, category):
+        """Everything but the name term, shared by all items with the same warmth/color/category"""
+        fit = 1.0 - min(abs(warmth - self.needed_warmth), 2) / 2.0
+        return self.w_warmth * fit + self.w_condition * self.suitability(slot, color, category)
+
+    def rank(self, slot, items):
+        """(score, item) pairs, best first; ties keep their input order"""
+        # map() keeps the per-item work in C; Python only runs once per distinct key
+        keys = list(map(SCORE_KEY, items))
+        bases = self._bases.setdefault(slot, {})
+        for key in set(keys).difference(bases):
+            bases[key] = self.base(slot, *key)
+        scores = map(bases.__getitem__, keys)
+        if self.name_matches:
+            bonus = self.w_recommendation
+            scores = [score + bonus if found else score
+                      for score, found in zip(scores, map(self.name_matches, map(NAME, items)))]
+        return sorted(zip(scores, items), key=itemgetter(0), reverse=True)
+
+    def no_layer(self):
+        """Going without a layer is perfect in the heat and poor in the cold"""
+        fit = {1: 1.0, 2: 0.4, 3: 0.0}[self.needed_warmth]
+        return self.w_warmth * fit + self.w_condition
+
+    def harmony(self, top, bottom):
+        colors = (top.color, bottom.color)
+        score = self._harmony.get(colors)
+        if score is None:
+            score = self._harmony[colors] = self.w_harmony * STYLE_HARMONY[get_outfit_style(top, bottom)]
+        return score
+
+    def max_total(self):
+        # best possible unary for the 4 slots + best harmony
+        return 4 * (self.w_warmth + self.w_condition + self.w_recommendation) + self.w_harmony
+
+
+def best_outfits(scorer, tops, bottoms, layers, footwear, k=3):
+    """
+    Top-k (score, top, bottom, layer, footwear) combinations, best first.
+    layer may be None (no layer); every other slot needs at least one candidate.
+    """
+    tops = scorer.rank("top", tops)  # dresses score exactly like tops
+    bottoms = scorer.rank("bottom", bottoms)
+    if not tops or not bottoms or not footwear:
+        return []
+
+    # Layer and footwear don't interact with anything: their best k pairs are enough
+    layer_options = scorer.rank("layer", layers) + [(scorer.no_layer(), None)]
+    layer_options.sort(key=itemgetter(0), reverse=True)
+    shoes = scorer.rank("footwear", footwear)
+    rest = heapq.nlargest(
+        k,
+        ((ls + fs, layer, shoe) for ls, layer in layer_options[:k] for fs, shoe in shoes[:k]),
+        key=lambda combo: combo[0]
+    )
+
+    best_rest = rest[0][0]
+    max_harmony = scorer.w_harmony
+    best_bottom = bottoms[0][0]
+    results = []  # min-heap of (score, tiebreak, outfit)
+    counter = 0
+
+    for top_score, top in tops:
+        if len(results) == k and top_score + best_bottom + max_harmony + best_rest <= results[0][0]:
+            break  # tops are sorted, so no later top can do better
+        for bottom_score, bottom in bottoms:
+            bound = top_score + bottom_score + max_harmony + best_rest
+            if len(results) == k and bound <= results[0][0]:
+                break
+            pair_score = top_score + bottom_score + scorer.harmony(top, bottom)
+            for rest_score, layer, shoe in rest:
+                score = pair_score + rest_score
+                if len(results) == k and score <= results[0][0]:
+                    break
+                counter += 1
+                entry = (score, -counter, (top, bottom, layer, shoe))
+                if len(results) < k:
+                    heapq.heappush(results, entry)
+                else:
+                    heapq.heapreplace(results, entry)
+
+    return [(score, *outfit) for score, _, outfit in sorted(results, reverse=True)]
+
+
+def outfit_to_dict(scorer, score, top, bottom, layer, footwear):
+    top, bottom = top.to_dict(), bottom.to_dict()
+    return {
+        "top": top,
+        "bottom": bottom,
+        "layer": layer.to_dict() if layer else None,
+        "footwear": footwear.to_dict(),
+        "score": round(score, 3),
+        "confidence": round(score / scorer.max_total(), 2),
+        "outfit_style": get_outfit_style(top, bottom)
+    }
+
+
+def match_outfit(scorer, tops, bottoms, layers, footwear, top_k=1):
+    """Best outfit dict (plus alternatives) from one user's candidates"""
+    outfits = best_outfits(scorer, tops, bottoms, layers, footwear, k=top_k)
+    if outfits:
+        best, *alternatives = [outfit_to_dict(scorer, *outfit) for outfit in outfits]
+        best["alternatives"] = alternatives
+        return best
+
+    # Something is missing: still show the best of what there is
+    def pick(slot, items, placeholder):
+        ranked_items = scorer.rank(slot, items)
+        return ranked_items[0][1].to_dict() if ranked_items else placeholder
+
+    top = pick("top", tops, {"name": "No top found", "type": "top"})
+    bottom = pick("bottom", bottoms, {"name": "No bottom found", "type": "bottom"})
+    return {
+        "top": top,
+        "bottom": bottom,
+        "layer": pick("layer", layers, None),
+        "footwear": pick("footwear", footwear, {"name": "No footwear found", "type": "footwear"}),
+        "score": 0.0,
+        "confidence": 0.0,
+        "outfit_style": get_outfit_style(top, bottom),
+        "alternatives": []
+    }
+
+
+_process_scorers = {}
+
+
+def match_chunk(query, chunk):
+    """
+    Process-pool task: [(user_id, outfit dict)] for [(user_id, tops, bottoms, layers, footwear)].
+    query is (temperature, condition, recommendation, top_k); each worker process
+    builds its Scorer once per query and reuses it for every chunk of that batch.
+    """
+    temperature, condition, recommendation, top_k = query
+    key = (temperature, condition, repr(recommendation))
+    scorer = _process_scorers.get(key)
+    if scorer is None:
+        _process_scorers.clear()  # one batch at a time is the common case; don't grow forever
+        scorer = _process_scorers[key] = Scorer(temperature, condition, recommendation)
+    return [(user_id, match_outfit(scorer, *candidates, top_k=top_k)) for user_id, *candidates in chunk]
@@ -0,0 +1,69 @@
+# wardrobe-service/repository.py
+"""
+Storage interface for wardrobes.
+
+Backends:
+    memory  -> wardrobe_store.WardrobeStore (indexed, in-process; used for tests)
+    sqlite  -> sqlite_repository.SQLiteRepository (persistent, WAL mode)
+"""
+
+
+class WardrobeRepository:
+    """Everything the routes need from wardrobe storage"""
+
+    def add(self, user_id, data):
+        """Store one item dict, returns the stored ClothingItem"""
+        raise NotImplementedError
+
+    def add_many(self, user_id, items):
+        """Store many item dicts atomically, returns how many were stored"""
+        raise NotImplementedError
+
+    def list(self, user_id):
+        """All of a user's ClothingItems in insertion order"""
+        raise NotImplementedError
+
+    def count(self, user_id):
+        raise NotImplementedError
+
+    def page(self, user_id, after_seq=0, limit=None, type=None, color=None, category=None,
+             min_warmth=None, max_warmth=None):
+        """Up to limit matching ClothingItems added after after_seq, in insertion order"""
+        raise NotImplementedError
+
+    def of_types(self, user_id, types):
+        """All of a user's items of the given types, in no particular order"""
+        return [item for item_type in types for item in self.iter_items(user_id, type=item_type)]
+
+    def version(self, user_id):
+        """Opaque token that changes whenever the user's wardrobe changes"""
+        raise NotImplementedError
+
+    def user_ids(self, after=None, limit=None):
+        """Up to limit IDs of users with at least one item, sorted, all greater than after"""
+        raise NotImplementedError
+
+    def iter_user_ids(self, chunk_size=1000):
+        """Every user ID, page by page"""
+        after = None
+        while True:
+            user_ids = self.user_ids(after=after, limit=chunk_size)
+            yield from user_ids
+            if len(user_ids) < chunk_size:
+                return
+            after = user_ids[-1]
+
+    def iter_items(self, user_id, after_seq=0, chunk_size=500, **filters):
+        """Stream matching items page by page, so no full listing is ever held in memory"""
+        while True:
+            items = self.page(user_id, after_seq=after_seq, limit=chunk_size, **filters)
+            yield from items
+            if len(items) < chunk_size:
+                return
+            after_seq = items[-1].seq
+
+    def seed(self, clothes_by_user):
+        """Load demo data for users that have no items yet"""
+        for user_id, items in clothes_by_user.items():
+            if self.count(user_id) == 0:
+                self.add_many(user_id, items)
@@ -0,0 +1,169 @@
+# wardrobe-service/sqlite_repository.py
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from repository import WardrobeRepository
+from wardrobe_store import ClothingItem
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clothes (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    id         TEXT NOT NULL,
+    user_id    TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    type       TEXT NOT NULL,
+    color      TEXT NOT NULL,
+    warmth     INTEGER NOT NULL,
+    category   TEXT NOT NULL,
+    image_url  TEXT,
+    added_date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_clothes_user_type_warmth ON clothes (user_id, type, warmth);
+CREATE INDEX IF NOT EXISTS idx_clothes_user_type_category ON clothes (user_id, type, category);
+"""
+
+COLUMNS = "seq, id, name, type, color, warmth, category, image_url, added_date"
+
+INSERT_SQL = (
+    "INSERT INTO clothes (id, user_id, name, type, color, warmth, category, image_url, added_date) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+class ConnectionPool:
+    """Fixed set of SQLite connections shared by the request threads"""
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self.size = size
+        self._open()
+        # SQLite connections must not cross a fork (gunicorn --preload): each worker opens its own
+        os.register_at_fork(after_in_child=self._open)
+
+    def _open(self):
+        self._pool = queue.Queue()
+        for _ in range(self.size):
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                                   cached_statements=256, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._pool.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+
+def _row_to_item(row):
+    seq, id, name, type, color, warmth, category, image_url, added_date = row
+    return ClothingItem(id, name, type, color, warmth, category, image_url, added_date, seq=seq)
+
+
+def _params(user_id, data):
+    return (
+        data["id"], user_id, data["name"], data["type"], data["color"], data["warmth"],
+        data.get("category", "casual"), data.get("image_url", "/images/default.jpg"), data.get("added_date")
+    )
+
+
+class SQLiteRepository(WardrobeRepository):
+    """
+    Persistent wardrobe in SQLite (WAL mode, so readers never block the writer).
+
+    All SQL is parameterized with a small, fixed set of statement shapes, so
+    sqlite3's per-connection statement cache keeps them prepared.
+    """
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        self.pool = ConnectionPool(path, pool_size)
+        self._write_lock = threading.Lock()
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def add(self, user_id, data):
+        with self._write_lock, self.pool.transaction() as conn:
+            seq = conn.execute(INSERT_SQL, _params(user_id, data)).lastrowid
+        return ClothingItem.from_dict(data, seq=seq)
+
+    def add_many(self, user_id, items):
+        # One transaction for the whole batch: one fsync instead of one per item
+        with self._write_lock, self.pool.transaction() as conn:
+            conn.executemany(INSERT_SQL, (_params(user_id, data) for data in items))
+        return len(items)
+
+    def list(self, user_id):
+        with self.pool.connection() as conn:
+            rows = conn.execute(f"SELECT {COLUMNS} FROM clothes WHERE user_id = ? ORDER BY seq", (user_id,))
+            return [_row_to_item(row) for row in rows]
+
+    def count(self, user_id):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM clothes WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def page(self, user_id, after_seq=0, limit=None, type=None, color=None, category=None,
+             min_warmth=None, max_warmth=None):
+        clauses = ["user_id = ?", "seq > ?"]
+        params = [user_id, after_seq]
+        for column, value in (("type", type), ("color", color), ("category", category)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if min_warmth is not None:
+            clauses.append("warmth >= ?")
+            params.append(min_warmth)
+        if max_warmth is not None:
+            clauses.append("warmth <= ?")
+            params.append(max_warmth)
+        params.append(-1 if limit is None else limit)
+
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {COLUMNS} FROM clothes WHERE {' AND '.join(clauses)} ORDER BY seq LIMIT ?", params
+            )
+            return [_row_to_item(row) for row in rows]
+
+    def of_types(self, user_id, types):
+        placeholders = ", ".join("?" * len(types))
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {COLUMNS} FROM clothes WHERE user_id = ? AND type IN ({placeholders})",
+                (user_id, *types)
+            )
+            return [_row_to_item(row) for row in rows]
+
+    def user_ids(self, after=None, limit=None):
+        # DISTINCT over the leading column of the (user_id, type, ...) indexes: no table scan
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT user_id FROM clothes WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                ("" if after is None else after, -1 if limit is None else limit)
+            )
+            return [row[0] for row in rows]
+
+    def version(self, user_id):
+        # Items are append-only, so (count, newest seq) identifies the wardrobe state
+        with self.pool.connection() as conn:
+            count, newest = conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(seq), 0) FROM clothes WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return f"{count}-{newest}"
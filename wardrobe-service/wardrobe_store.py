@@ -0,0 +1,181 @@
+# wardrobe-service/wardrobe_store.py
+"""
+In-memory wardrobe storage with per-user secondary indexes.
+
+Items are compact slotted objects. Every user's wardrobe keeps its items
+bucketed by type -> warmth and by type -> category, updated incrementally on
+add(). Listing and outfit matching read candidates of one type (and warmth
+range) from the buckets instead of scanning the whole list.
+"""
+import heapq
+import sys
+import threading
+from itertools import islice
+
+from repository import WardrobeRepository
+
+
+class ClothingItem:
+    """One piece of clothing; __slots__ and interned strings keep it small"""
+    FIELDS = ("id", "name", "type", "color", "warmth", "category", "image_url", "added_date")
+    __slots__ = FIELDS + ("seq",)
+
+    def __init__(self, id, name, type, color, warmth, category="casual",
+                 image_url="/images/default.jpg", added_date=None, seq=0):
+        self.id = id
+        self.name = name
+        # Low-cardinality fields are shared across all items
+        self.type = sys.intern(type)
+        self.color = sys.intern(color)
+        self.warmth = warmth
+        self.category = sys.intern(category)
+        self.image_url = image_url
+        self.added_date = added_date
+        self.seq = seq
+
+    @classmethod
+    def from_dict(cls, data, seq=0):
+        return cls(seq=seq, **{field: data[field] for field in cls.FIELDS if field in data})
+
+    def to_dict(self):
+        item = {field: getattr(self, field) for field in self.FIELDS}
+        if item["added_date"] is None:
+            del item["added_date"]
+        return item
+
+    def get(self, field, default=None):
+        """dict-style access so matching code works on items and plain dicts alike"""
+        return getattr(self, field, default)
+
+
+def matches(item, type=None, color=None, category=None, min_warmth=None, max_warmth=None):
+    return ((type is None or item.type == type)
+            and (color is None or item.color == color)
+            and (category is None or item.category == category)
+            and (min_warmth is None or item.warmth >= min_warmth)
+            and (max_warmth is None or item.warmth <= max_warmth))
+
+
+def index_after(items, after_seq):
+    """Position of the first item with seq > after_seq in a seq-ordered list"""
+    lo, hi = 0, len(items)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if items[mid].seq <= after_seq:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class Bucket:
+    """Items of one (type, warmth) or (type, category) in insertion order"""
+    __slots__ = ("items",)
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, item):
+        self.items.append(item)
+
+
+class UserWardrobe:
+    """One user's items plus their secondary indexes"""
+    __slots__ = ("items", "ordered", "by_type_warmth", "by_type_category")
+
+    def __init__(self):
+        self.items = {}            # id -> item, insertion ordered
+        self.ordered = []          # items by seq, for cursor pagination
+        self.by_type_warmth = {}   # type -> {warmth: Bucket}
+        self.by_type_category = {} # type -> {category: Bucket}
+
+    def add(self, item):
+        self.items[item.id] = item
+        self.ordered.append(item)
+        self.by_type_warmth.setdefault(item.type, {}).setdefault(item.warmth, Bucket()).add(item)
+        self.by_type_category.setdefault(item.type, {}).setdefault(item.category, Bucket()).add(item)
+
+    def buckets(self, types, min_warmth=None, max_warmth=None, category=None):
+        """Index buckets holding items of the given types (and warmth range or category)"""
+        found = []
+        for item_type in types:
+            if category is not None:
+                bucket = self.by_type_category.get(item_type, {}).get(category)
+                if bucket:
+                    found.append(bucket)
+                continue
+            for warmth, bucket in self.by_type_warmth.get(item_type, {}).items():
+                if (min_warmth is None or warmth >= min_warmth) and (max_warmth is None or warmth <= max_warmth):
+                    found.append(bucket)
+        return found
+
+    def page(self, after_seq=0, limit=None, **filters):
+        if filters.get("type") is not None:
+            # Walk only the index buckets of that type, merged back into seq order
+            sources = [bucket.items for bucket in self.buckets(
+                (filters["type"],), filters.get("min_warmth"), filters.get("max_warmth"), filters.get("category"))]
+            stream = heapq.merge(*(islice(items, index_after(items, after_seq), None) for items in sources),
+                                 key=lambda item: item.seq)
+        else:
+            stream = islice(self.ordered, index_after(self.ordered, after_seq), None)
+        return list(islice((item for item in stream if matches(item, **filters)), limit))
+
+    def __len__(self):
+        return len(self.items)
+
+
+class WardrobeStore(WardrobeRepository):
+    """All users' wardrobes; writes are serialized, index reads are lock-protected"""
+
+    def __init__(self):
+        self._users = {}
+        self._lock = threading.RLock()
+        self._seq = 0
+
+    def add(self, user_id, data):
+        with self._lock:
+            self._seq += 1
+            item = ClothingItem.from_dict(data, seq=self._seq)
+            self._users.setdefault(user_id, UserWardrobe()).add(item)
+            return item
+
+    def add_many(self, user_id, items):
+        with self._lock:
+            # Build every item before touching the wardrobe, so a bad one stores none
+            built = [ClothingItem.from_dict(data, seq=self._seq + i) for i, data in enumerate(items, 1)]
+            if built:
+                wardrobe = self._users.setdefault(user_id, UserWardrobe())
+                for item in built:
+                    wardrobe.add(item)
+                self._seq += len(built)
+        return len(built)
+
+    def wardrobe(self, user_id):
+        return self._users.get(user_id) or UserWardrobe()
+
+    def list(self, user_id):
+        with self._lock:
+            return list(self.wardrobe(user_id).items.values())
+
+    def count(self, user_id):
+        return len(self.wardrobe(user_id))
+
+    def page(self, user_id, after_seq=0, limit=None, **filters):
+        with self._lock:
+            return self.wardrobe(user_id).page(after_seq, limit, **filters)
+
+    def of_types(self, user_id, types):
+        # Order doesn't matter to the caller, so the warmth buckets are just concatenated
+        with self._lock:
+            return [item for bucket in self.wardrobe(user_id).buckets(types) for item in bucket.items]
+
+    def user_ids(self, after=None, limit=None):
+        with self._lock:
+            user_ids = sorted(user_id for user_id, wardrobe in self._users.items()
+                              if len(wardrobe) and (after is None or user_id > after))
+        return user_ids if limit is None else user_ids[:limit]
+
+    def version(self, user_id):
+        with self._lock:
+            ordered = self.wardrobe(user_id).ordered
+            return f"{len(ordered)}-{ordered[-1].seq if ordered else 0}"
@@ -1,7 +1,18 @@
-from flask import Flask, jsonify
-import requests
+from flask import Flask, jsonify, request
 import os
-from datetime import datetime
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+# Shared modules: ../common when run from the repo, copied next to this file in the image
+sys.path.append(str(Path(__file__).resolve().parent.parent / "common"))
+from instrumentation import instrument_flask, run_in_context, span
+from structured_logging import setup_logging
+from wire import request_body, respond
+from cache import WeatherCache, normalize_city
+from history import history_from_env
+from providers import ProviderError, ProviderThrottled, provider_from_env
+from rate_limiter import BACKGROUND, INTERACTIVE, TokenBucket
 # from pathlib import Path
 # from dotenv import load_dotenv
 
@@ -20,65 +31,139 @@ from datetime import datetime
 #     print("⚠️ No .env file found, checking environment variables...")
 #     load_dotenv()  
 
+log = setup_logging("weather")
 app = Flask(__name__)
+metrics = instrument_flask(app, "weather")
 
 # Get your free API key from https://openweathermap.org/api
-# API_KEY = "c1e5437f731b74d1a78ab5e73e2cfc28" 
 # API_KEY = os.getenv('OPENWEATHER_API_KEY') 
 # API_KEY = os.getenv('WEATHER_API_KEY', 'demo_key')
 API_KEY = os.getenv('WEATHER_API_KEY')
+# WEATHER_PROVIDER=openweathermap (default) | synthetic | replay, see providers.py
+weather_provider = provider_from_env()
 
-print(f"🔑 API_KEY type: {(API_KEY)}")
-print(f"🔑 API_KEY type: {type(API_KEY)}")
-print(f"🔑 API_KEY is None: {API_KEY is None}")
-print(f"🔑 API_KEY == 'demo_key': {API_KEY == 'demo_key'}")
+log.info("Weather provider configured", extra={
+    "provider": weather_provider.name, "api_key_configured": bool(API_KEY and API_KEY != 'demo_key')
+})
 
-def get_real_weather(city):
-    """Get REAL weather data from OpenWeatherMap API"""
+# OpenWeatherMap's free plan allows 60 calls/minute; every upstream call takes a token,
+# users first, background cache refreshes after them. Under gunicorn each worker
+# process has its own bucket, so each gets its share of the quota.
+WORKER_PROCESSES = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+upstream_limiter = TokenBucket(
+    rate=max(1, int(os.getenv('WEATHER_API_RATE_PER_MINUTE', '60')) // WORKER_PROCESSES),
+    burst=max(1, int(os.getenv('WEATHER_API_BURST', '10')) // WORKER_PROCESSES),
+    max_backoff=float(os.getenv('WEATHER_API_MAX_BACKOFF', '60'))
+)
+WEATHER_API_RATE_WAIT = float(os.getenv('WEATHER_API_RATE_WAIT', '5'))
+WEATHER_API_BACKGROUND_WAIT = float(os.getenv('WEATHER_API_BACKGROUND_WAIT', '30'))
+
+# Batch lookups: how many cities per request, and how many upstream fetches at once
+BATCH_MAX_CITIES = int(os.getenv('WEATHER_BATCH_MAX_CITIES', '100'))
+BATCH_TIMEOUT = float(os.getenv('WEATHER_BATCH_TIMEOUT', '15'))
+batch_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('WEATHER_BATCH_CONCURRENCY', '8')),
+    thread_name_prefix='weather-batch'
+)
+
+# Every upstream observation is kept on disk, so history costs no API calls
+weather_history = history_from_env()
+HISTORY_DEFAULT_WINDOW = int(os.getenv('WEATHER_HISTORY_DEFAULT_WINDOW', str(24 * 3600)))
+
+def rate_limited(retry_after):
+    return {
+        "error": "Weather API rate limit reached, try again shortly",
+        "rate_limited": True,
+        "retry_after": max(1, round(retry_after))
+    }
+
+def get_real_weather(city, background=False):
+    """Get REAL weather data from the configured provider (OpenWeatherMap by default)"""
+    if weather_provider.uses_quota:
+        with span("rate_limit_wait"):
+            if background:
+                acquired = upstream_limiter.acquire(BACKGROUND, timeout=WEATHER_API_BACKGROUND_WAIT)
+            else:
+                acquired = upstream_limiter.acquire(INTERACTIVE, timeout=WEATHER_API_RATE_WAIT)
+        if not acquired:
+            return rate_limited(upstream_limiter.retry_after())
+    
     try:
-        if not API_KEY or API_KEY == 'demo_key':
-            print(f"❌ No API key available, using mock data for {city}")
-            
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={API_KEY}&units=metric&lang=en"
-        
-        print(f"🌐 Fetching REAL weather for: {city}")
-        print(f"🔗 API URL: {url.replace(API_KEY, 'API_KEY_REDACTED')}") 
-        response = requests.get(url, timeout=10)
-
-        print(f"🔍 API Response Status: {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Successfully got weather data for {data['name']}")
-
-            return {
-                "city": data["name"],
-                "country": data["sys"]["country"],
-                "temperature": round(data["main"]["temp"]),
-                "feels_like": round(data["main"]["feels_like"]),
-                "condition": data["weather"][0]["main"],
-                "description": data["weather"][0]["description"],
-                "humidity": data["main"]["humidity"],
-                "wind_speed": data["wind"]["speed"],
-                "pressure": data["main"]["pressure"],
-                "visibility": data.get("visibility", "N/A"),
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "source": "OpenWeatherMap API",
-                "coordinates": {
-                    "lat": data["coord"]["lat"],
-                    "lon": data["coord"]["lon"]
-                }
-            }
-        else:
-            error_data = response.json()
-            print(f"❌ Weather API error: {error_data}")
-            # return {"error": f"City '{city}' not found or API error"}
-            return {"error": f"Weather API error: {error_data.get('message', 'Unknown error')}"}
-            
-    except requests.exceptions.Timeout:
-        return {"error": "Weather API timeout"}
+        with span("upstream"):
+            weather = weather_provider.current(city)
+    except ProviderThrottled as e:
+        pause = upstream_limiter.throttled(e.retry_after)
+        log.warning("Weather API quota exceeded, backing off for %.1fs", pause)
+        return rate_limited(pause)
+    except ProviderError as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"API call failed: {str(e)}"}
+    
+    upstream_limiter.succeeded()
+    if weather_history is not None:
+        try:
+            weather_history.append(city, weather)
+        except OSError as e:
+            log.warning("Could not record weather history: %s", e, extra={"city": city})
+    return weather
+
+# Weather changes every few minutes, so serve repeated cities from memory
+weather_cache = WeatherCache(
+    get_real_weather,
+    ttl=int(os.getenv('WEATHER_CACHE_TTL', '300')),
+    stale_ttl=int(os.getenv('WEATHER_CACHE_STALE_TTL', '600')),
+    max_entries=int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '1000')),
+    error_ttl=float(os.getenv('WEATHER_CACHE_ERROR_TTL', '10')),
+    stale_if_error=int(os.getenv('WEATHER_CACHE_STALE_IF_ERROR', '3600'))
+)
+
+metrics.gauge("weather_cache_lookups", "Weather cache lookups by result",
+              lambda: {(("result", result),): count for result, count in weather_cache.stats().items()
+                       if result in ("hits", "stale_hits", "misses", "coalesced", "negative_hits")})
+metrics.gauge("weather_cache_entries", "Cities currently cached", lambda: {(): weather_cache.stats()["size"]})
+metrics.gauge("weather_rate_limiter_tokens", "Upstream API tokens available",
+              lambda: {(): round(upstream_limiter.available(), 2)})
+metrics.gauge("weather_rate_limiter_queue_depth", "Calls waiting for an upstream token",
+              lambda: {(("priority", priority),): depth
+                       for priority, depth in upstream_limiter.stats()["queue_depth"].items()})
+
+def get_weather_many(cities):
+    """
+    Weather for many cities: duplicates collapse, cached cities are answered
+    inline and the rest are fetched concurrently on the bounded batch pool.
+    Returns ({normalized city: data}, {normalized city: error}, stats).
+    """
+    unique = {}
+    for city in cities:
+        unique.setdefault(normalize_city(city), city)
+    
+    results, errors, pending = {}, {}, {}
+    for key, city in unique.items():
+        cached = weather_cache.peek(city)
+        if cached is not None:
+            results[key] = cached
+        else:
+            pending[key] = run_in_context(batch_pool, weather_cache.get, city)
+    from_cache = len(results)
+    
+    done, not_done = wait(pending.values(), timeout=BATCH_TIMEOUT)
+    for key, future in pending.items():
+        if future not in done:
+            errors[key] = "Timed out waiting for the weather API"
+            continue
+        data = future.result()
+        if "error" in data:
+            errors[key] = data["error"]
+        else:
+            results[key] = data
+    
+    return results, errors, {
+        "requested": len(cities),
+        "unique": len(unique),
+        "from_cache": from_cache,
+        "fetched": len(pending)
+    }
 
 @app.route('/')
 def home():
@@ -89,6 +174,7 @@ def home():
         <li><a href="/weather/amizour">/weather/amizour</a></li>
         <li><a href="/weather/algiers">/weather/algiers</a></li>
         <li><a href="/weather/paris">/weather/paris</a></li>
+        <li><a href="/weather/batch?cities=paris,algiers,london">/weather/batch?cities=paris,algiers,london</a></li>
         <li><a href="/health">/health</a></li>
     </ul>
     <p><em>Real-time data from OpenWeatherMap API</em></p>
@@ -99,32 +185,109 @@ def health():
     return jsonify({
         "status": "healthy", 
         "service": "real-weather",
+        "cache": weather_cache.stats(),
+        "provider": weather_provider.describe(),
+        "rate_limiter": upstream_limiter.stats(),
+        "history": weather_history.stats() if weather_history is not None else None,
         "timestamp": datetime.now().isoformat()
     })
 
 @app.route('/weather/<city>')
 def get_weather(city):
-    print(f"📍 Received request for: {city}")
-    print(f"🔑 API_KEY available: {bool(API_KEY and API_KEY != 'demo_key')}")
+    log.debug("Received weather request", extra={"city": city})
+    
+    weather_data = weather_cache.get(city)
     
-    weather_data = get_real_weather(city)
+    if weather_data.get("rate_limited"):
+        # Throttled, not missing: tell the caller when to come back
+        return respond({"error": weather_data["error"]}, 429, {"Retry-After": str(weather_data["retry_after"])})
     
     if "error" in weather_data:
-        print(f"❌ Returning error for {city}: {weather_data['error']}")
-        return jsonify({
+        log.warning("Returning weather error", extra={"city": city, "error": weather_data["error"]})
+        return respond({
             "error": weather_data["error"],
             "try_cities": ["amizour", "algiers", "paris", "london", "newyork"],
             "api_guide": "Get free API key from https://openweathermap.org/api"
-        }), 404
+        }, 404)
+    
+    log.info("Weather served", extra={"city": city, "sampled": True})
+    return respond(weather_data)
+
+# Last second datetime can represent; anything past it (or inf/nan) is a bad request
+MAX_TIMESTAMP = datetime(9999, 12, 31, 23, 59, 59, tzinfo=timezone.utc).timestamp()
+
+def parse_time(value):
+    """Epoch seconds or ISO 8601 (UTC unless it says otherwise); ValueError if out of range"""
+    try:
+        seconds = float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        seconds = parsed.timestamp()
+    if not 0 <= seconds <= MAX_TIMESTAMP:  # also false for nan
+        raise ValueError(f"time out of range: {value}")
+    return seconds
+
+@app.route('/weather/<city>/history')
+def get_weather_history(city):
+    """
+    Recorded observations: ?from=&to= (epoch seconds or ISO 8601; default the
+    last 24h), ?points=N to average them down to at most N
+    """
+    if weather_history is None:
+        return respond({"error": "Weather history is disabled"}, 404)
+    try:
+        end = parse_time(request.args["to"]) if "to" in request.args else datetime.now(timezone.utc).timestamp()
+        start = parse_time(request.args["from"]) if "from" in request.args else end - HISTORY_DEFAULT_WINDOW
+        points = int(request.args["points"]) if "points" in request.args else None
+    except ValueError:
+        return respond({"error": "from/to must be epoch seconds or ISO 8601, points a positive integer"}, 400)
+    if start > end or (points is not None and points < 1):
+        return respond({"error": "from must not be after to, and points must be positive"}, 400)
+    
+    with span("history"):
+        observations, matched = weather_history.query(city, start, end, points)
+    for observation in observations:
+        observation["time"] = datetime.fromtimestamp(observation["timestamp"], timezone.utc).isoformat()
+    return respond({
+        "city": city,
+        "from": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+        "to": datetime.fromtimestamp(end, timezone.utc).isoformat(),
+        "matched": matched,
+        "downsampled": len(observations) < matched,
+        "observations": observations
+    })
+
+@app.route('/weather/batch', methods=['GET', 'POST'])
+def get_weather_batch():
+    """Many cities in one call: POST {"cities": [...]} or GET ?cities=paris,london"""
+    if request.method == 'POST':
+        body = request_body()
+        cities = body.get("cities") if isinstance(body, dict) else None
+    else:
+        cities = [city for city in request.args.get("cities", "").split(",") if city.strip()]
+    
+    if not isinstance(cities, list) or not cities or not all(isinstance(c, str) and c.strip() for c in cities):
+        return respond({"error": "cities must be a non-empty list of city names"}, 400)
+    if len(cities) > BATCH_MAX_CITIES:
+        return respond({"error": f"Too many cities, max {BATCH_MAX_CITIES} per batch"}, 400)
     
-    print(f"✅ Success response for {city}")
-    return jsonify(weather_data)
+    results, errors, stats = get_weather_many(cities)
+    log.info("Batch weather served", extra={"cities": stats["unique"], "from_cache": stats["from_cache"],
+                                           "failed": len(errors), "sampled": True})
+    return respond({"results": results, "errors": errors, **stats})
 
 @app.route('/compare/<city1>/<city2>')
 def compare_weather(city1, city2):
     """Compare real weather between two cities"""
-    weather1 = get_real_weather(city1)
-    weather2 = get_real_weather(city2)
+    results, errors, _ = get_weather_many([city1, city2])
+    
+    def weather_for(city):
+        key = normalize_city(city)
+        return results[key] if key in results else {"error": errors[key]}
+    
+    weather1, weather2 = weather_for(city1), weather_for(city2)
     
     return jsonify({
         "comparison": {
@@ -135,8 +298,5 @@ def compare_weather(city1, city2):
     })
 
 if __name__ == '__main__':
-    print("🚀 Starting REAL Weather Microservice...")
-    print("🌐 Using Live OpenWeatherMap API")
-    print("📡 Endpoint: http://localhost:5001/weather/amizour")
-    print("⚠️  Don't forget to add your REAL API key!")
+    log.info("Starting weather service", extra={"endpoint": "http://localhost:5001/weather/amizour"})
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
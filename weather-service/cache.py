@@ -0,0 +1,178 @@
+# weather-service/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_city(city):
+    """'Paris', 'paris ' and 'PARIS' all map to the same cache key"""
+    return " ".join(city.split()).lower()
+
+
+class _Inflight:
+    """One upstream fetch that concurrent callers for the same city wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class WeatherCache:
+    """
+    Per-city weather cache: TTL + LRU bound + request coalescing + stale-while-revalidate.
+
+    - fresh entries (age < ttl) are served directly
+    - stale entries (ttl <= age < ttl + stale_ttl) are served immediately while
+      a single background refresh runs
+    - anything older is a miss; concurrent misses for one city share one fetch
+    Error results are handed to the waiting callers; if an entry younger than
+    ttl + stale_ttl + stale_if_error exists it is served instead, marked
+    "stale": true. Either way the answer is remembered for error_ttl seconds
+    (negative caching) and background refreshes hold off for that long, so an
+    upstream outage doesn't send every miss back to the API.
+    """
+
+    def __init__(self, fetch, ttl=300, stale_ttl=600, max_entries=1000, error_ttl=10, stale_if_error=3600):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.error_ttl = error_ttl
+        self.stale_if_error = stale_if_error
+        self._entries = OrderedDict()  # key -> (data, fetched_at)
+        self._errors = OrderedDict()   # key -> (error or stale data, expires_at)
+        self._inflight = {}            # key -> _Inflight
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "upstream_errors": 0,
+            "negative_hits": 0,
+            "evictions": 0
+        }
+
+    def _cached(self, key, city):
+        """Fresh or stale-but-servable entry, else None; caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        data, fetched_at = entry
+        age = time.monotonic() - fetched_at
+        if age < self.ttl:
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return data
+        if age < self.ttl + self.stale_ttl:
+            self._entries.move_to_end(key)
+            self._stats["stale_hits"] += 1
+            if key not in self._inflight and not self._backing_off(key):
+                inflight = self._inflight[key] = _Inflight()
+                threading.Thread(target=self._refresh, args=(key, city, inflight), daemon=True).start()
+            return data
+        return None
+
+    def _backing_off(self, key):
+        error = self._errors.get(key)
+        return error is not None and time.monotonic() < error[1]
+
+    def peek(self, city):
+        """Like get(), but never fetches: None when the city isn't cached"""
+        with self._lock:
+            return self._cached(normalize_city(city), city)
+
+    def get(self, city):
+        key = normalize_city(city)
+
+        with self._lock:
+            data = self._cached(key, city)
+            if data is not None:
+                return data
+            error = self._errors.get(key)
+            if error is not None:
+                if time.monotonic() < error[1]:
+                    self._stats["negative_hits"] += 1
+                    return error[0]
+                del self._errors[key]
+
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                inflight = self._inflight[key] = _Inflight()
+                self._stats["misses"] += 1
+                leader = True
+
+        if not leader:
+            inflight.done.wait()
+            return inflight.result
+
+        return self._load(key, city, inflight)
+
+    def _refresh(self, key, city, inflight):
+        with self._lock:
+            self._stats["refreshes"] += 1
+        self._load(key, city, inflight, background=True)
+
+    def _load(self, key, city, inflight, background=False):
+        try:
+            # Refreshes tell fetch they're background work, so they can queue behind users
+            data = self.fetch(city, background=background)
+        except Exception as e:
+            data = {"error": f"API call failed: {str(e)}"}
+
+        with self._lock:
+            if "error" in data:
+                self._stats["upstream_errors"] += 1
+                # Stale-if-error: serve a bounded-age entry, flagged so callers can tell
+                error = data
+                stale = self._entries.get(key)
+                if stale is not None and time.monotonic() - stale[1] < self.ttl + self.stale_ttl + self.stale_if_error:
+                    data = {**stale[0], "stale": True}
+                self._store_error(key, error, data)
+            else:
+                self._store(key, data)
+            inflight.result = data
+            del self._inflight[key]
+        inflight.done.set()
+        return data
+
+    def _store_error(self, key, error, served):
+        # A throttled answer says when to come back; don't hold it past that
+        ttl = min(self.error_ttl, error.get("retry_after", self.error_ttl))
+        if ttl <= 0:
+            return
+        self._errors[key] = (served, time.monotonic() + ttl)
+        self._errors.move_to_end(key)
+        while len(self._errors) > self.max_entries:
+            self._errors.popitem(last=False)
+
+    def _store(self, key, data):
+        self._errors.pop(key, None)
+        self._entries[key] = (data, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, city=None):
+        with self._lock:
+            if city is None:
+                self._entries.clear()
+                self._errors.clear()
+            else:
+                self._entries.pop(normalize_city(city), None)
+                self._errors.pop(normalize_city(city), None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"] + stats["coalesced"] + stats["negative_hits"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 3) if lookups else 0.0
+        stats.update({"ttl_seconds": self.ttl, "stale_ttl_seconds": self.stale_ttl, "error_ttl_seconds": self.error_ttl,
+                      "stale_if_error_seconds": self.stale_if_error, "max_entries": self.max_entries})
+        return stats
@@ -0,0 +1,214 @@
+# weather-service/history.py
+"""
+Append-only weather history, one directory per city, one file per column.
+
+Every column is a flat array of fixed-width little-endian values, so row i of
+a column sits at offset i * width and the row count is just the file size
+divided by the width:
+
+    timestamp.q    int64    epoch seconds, strictly increasing
+    temperature.f  float32
+    feels_like.f   float32
+    humidity.B     uint8    %
+    wind_speed.f   float32  m/s
+    pressure.H     uint16   hPa
+    condition.B    uint8    index into CONDITIONS
+
+Reads memory-map the column files and binary-search the timestamp column, so
+a range query only touches the pages it returns, however long the history.
+Appends take an flock per city, so the workers of one gunicorn instance can
+share a directory; the timestamp column is written last and defines how many
+rows exist, so a row torn by a crash is trimmed on the next append.
+"""
+import bisect
+import fcntl
+import hashlib
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from cache import normalize_city
+
+# OpenWeatherMap's "main" conditions; anything else is stored as Unknown
+CONDITIONS = ["Unknown", "Clear", "Clouds", "Rain", "Drizzle", "Thunderstorm", "Snow", "Mist",
+              "Smoke", "Haze", "Dust", "Fog", "Sand", "Ash", "Squall", "Tornado"]
+CONDITION_CODES = {name.lower(): code for code, name in enumerate(CONDITIONS)}
+
+# name -> struct format; timestamp first, it is the index
+COLUMNS = {
+    "timestamp": "q",
+    "temperature": "f",
+    "feels_like": "f",
+    "humidity": "B",
+    "wind_speed": "f",
+    "pressure": "H",
+    "condition": "B",
+}
+WIDTHS = {name: struct.calcsize("<" + fmt) for name, fmt in COLUMNS.items()}
+INTEGER_LIMITS = {"B": (0, 255), "H": (0, 65535)}
+
+
+def _clamp(fmt, value):
+    if fmt in INTEGER_LIMITS:
+        low, high = INTEGER_LIMITS[fmt]
+        return min(max(int(round(value)), low), high)
+    return value
+
+
+class _MappedColumns:
+    """Read-only memoryviews over a city's column files; close() before the files go away"""
+
+    def __init__(self, directory):
+        self._maps = []
+        self.views = {}
+        sizes = {name: (directory / f"{name}.{fmt}").stat().st_size // WIDTHS[name]
+                 for name, fmt in COLUMNS.items()}
+        self.rows = min(sizes.values())
+        if self.rows == 0:
+            return
+        for name, fmt in COLUMNS.items():
+            with open(directory / f"{name}.{fmt}", "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps.append(mapped)
+            self.views[name] = memoryview(mapped)[:self.rows * WIDTHS[name]].cast(fmt)
+
+    def close(self):
+        for view in self.views.values():
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+
+
+class WeatherHistory:
+    """Per-city observation log under root; append() after each upstream fetch, query() to read"""
+
+    def __init__(self, root, max_points=1000):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_points = max_points
+        self._lock = threading.Lock()
+        self.appended = 0
+        self.skipped = 0
+
+    def _directory(self, city):
+        key = normalize_city(city)
+        slug = re.sub(r"[^a-z0-9]+", "-", key).strip("-") or "city"
+        # The hash keeps "são paulo" and "s o paulo" apart
+        return self.root / f"{slug}-{hashlib.sha1(key.encode()).hexdigest()[:8]}"
+
+    def append(self, city, weather, observed_at=None):
+        """Store one observation; ignored unless it is newer than the last one stored"""
+        observed_at = int(observed_at if observed_at is not None else time.time())
+        row = {
+            "timestamp": observed_at,
+            "temperature": float(weather["temperature"]),
+            "feels_like": float(weather.get("feels_like", weather["temperature"])),
+            "humidity": weather.get("humidity") or 0,
+            "wind_speed": float(weather.get("wind_speed") or 0.0),
+            "pressure": weather.get("pressure") or 0,
+            "condition": CONDITION_CODES.get(str(weather.get("condition", "")).lower(), 0),
+        }
+        directory = self._directory(city)
+        directory.mkdir(exist_ok=True)
+        with self._lock, open(directory / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            files = {name: open(directory / f"{name}.{fmt}", "ab+") for name, fmt in COLUMNS.items()}
+            try:
+                timestamps = files["timestamp"]
+                rows = os.fstat(timestamps.fileno()).st_size // WIDTHS["timestamp"]
+                if rows:
+                    timestamps.seek((rows - 1) * WIDTHS["timestamp"])
+                    (last,) = struct.unpack("<q", timestamps.read(WIDTHS["timestamp"]))
+                    if observed_at <= last:
+                        self.skipped += 1
+                        return False
+                for name, fmt in COLUMNS.items():
+                    if name == "timestamp":
+                        continue
+                    f = files[name]
+                    f.truncate(rows * WIDTHS[name])  # drop anything a crash left past the last full row
+                    f.write(struct.pack("<" + fmt, _clamp(fmt, row[name])))
+                    f.flush()
+                timestamps.truncate(rows * WIDTHS["timestamp"])  # and any torn partial timestamp
+                timestamps.write(struct.pack("<q", observed_at))
+                timestamps.flush()
+            finally:
+                for f in files.values():
+                    f.close()
+        self.appended += 1
+        return True
+
+    def query(self, city, start, end, points=None):
+        """
+        Observations with start <= timestamp <= end (epoch seconds), oldest first.
+        More than `points` (default and cap: max_points) are averaged down to that many.
+        Returns (observations, rows in range).
+        """
+        points = min(points or self.max_points, self.max_points)
+        directory = self._directory(city)
+        if not (directory / "timestamp.q").exists():
+            return [], 0
+        columns = _MappedColumns(directory)
+        try:
+            if columns.rows == 0:
+                return [], 0
+            timestamps = columns.views["timestamp"]
+            first = bisect.bisect_left(timestamps, start)
+            last = bisect.bisect_right(timestamps, end)
+            count = last - first
+            if count <= points:
+                return [self._row(columns.views, i) for i in range(first, last)], count
+            return self._downsample(columns.views, first, last, points), count
+        finally:
+            columns.close()
+
+    @staticmethod
+    def _row(views, i):
+        return {
+            "timestamp": views["timestamp"][i],
+            "temperature": round(views["temperature"][i], 1),
+            "feels_like": round(views["feels_like"][i], 1),
+            "humidity": views["humidity"][i],
+            "wind_speed": round(views["wind_speed"][i], 1),
+            "pressure": views["pressure"][i],
+            "condition": CONDITIONS[views["condition"][i]] if views["condition"][i] < len(CONDITIONS) else "Unknown",
+        }
+
+    @staticmethod
+    def _downsample(views, first, last, points):
+        """points buckets of consecutive rows: mean of the numbers, commonest condition, bucket start time"""
+        buckets = []
+        count = last - first
+        for b in range(points):
+            lo = first + count * b // points
+            hi = first + count * (b + 1) // points
+            n = hi - lo
+            condition = Counter(views["condition"][lo:hi]).most_common(1)[0][0]
+            buckets.append({
+                "timestamp": views["timestamp"][lo],
+                "temperature": round(sum(views["temperature"][lo:hi]) / n, 1),
+                "feels_like": round(sum(views["feels_like"][lo:hi]) / n, 1),
+                "humidity": round(sum(views["humidity"][lo:hi]) / n),
+                "wind_speed": round(sum(views["wind_speed"][lo:hi]) / n, 1),
+                "pressure": round(sum(views["pressure"][lo:hi]) / n),
+                "condition": CONDITIONS[condition] if condition < len(CONDITIONS) else "Unknown",
+                "samples": n,
+            })
+        return buckets
+
+    def stats(self):
+        return {"root": str(self.root), "appended": self.appended, "skipped": self.skipped,
+                "max_points": self.max_points}
+
+
+def history_from_env():
+    """WEATHER_HISTORY_DIR (default weather_history); 'off' disables recording"""
+    root = os.getenv('WEATHER_HISTORY_DIR', 'weather_history')
+    if root.lower() in ('', 'off', 'false', 'none'):
+        return None
+    return WeatherHistory(root, max_points=int(os.getenv('WEATHER_HISTORY_MAX_POINTS', '1000')))
@@ -0,0 +1,259 @@
+# weather-service/providers.py
+"""
+Where current weather comes from.
+
+    openweathermap -> the real API (needs WEATHER_API_KEY, costs quota)
+    synthetic      -> deterministic in-process weather with configurable
+                      latency, error and 429 rates; for offline load tests
+    replay         -> OpenWeatherMap responses recorded to disk earlier
+                      (WEATHER_RECORD_DIR) served back, optionally at their
+                      recorded latency
+
+Every provider returns the same normalized dict from current(city), or raises
+ProviderError / ProviderThrottled. Only providers with uses_quota spend tokens
+from the upstream rate limiter.
+"""
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+from cache import normalize_city
+
+log = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """The provider answered (or failed) without usable weather"""
+
+
+class ProviderThrottled(ProviderError):
+    """The provider's quota is exhausted (HTTP 429)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None  # missing, or an HTTP date: the limiter uses its own backoff
+
+
+def parse_openweathermap(data, source="OpenWeatherMap API"):
+    return {
+        "city": data["name"],
+        "country": data["sys"]["country"],
+        "temperature": round(data["main"]["temp"]),
+        "feels_like": round(data["main"]["feels_like"]),
+        "condition": data["weather"][0]["main"],
+        "description": data["weather"][0]["description"],
+        "humidity": data["main"]["humidity"],
+        "wind_speed": data["wind"]["speed"],
+        "pressure": data["main"]["pressure"],
+        "visibility": data.get("visibility", "N/A"),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "source": source,
+        "coordinates": {
+            "lat": data["coord"]["lat"],
+            "lon": data["coord"]["lon"]
+        }
+    }
+
+
+def recording_path(directory, city):
+    return Path(directory) / (re.sub(r"[^a-z0-9]+", "_", normalize_city(city)) + ".json")
+
+
+class WeatherProvider:
+    name = "base"
+    uses_quota = False
+
+    def current(self, city):
+        raise NotImplementedError
+
+    def describe(self):
+        return {"name": self.name}
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+    name = "openweathermap"
+    uses_quota = True
+
+    def __init__(self, api_key, url="http://api.openweathermap.org/data/2.5/weather", timeout=10, record_dir=None):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.record_dir = record_dir
+        self.session = requests.Session()
+        if record_dir:
+            Path(record_dir).mkdir(parents=True, exist_ok=True)
+
+    def current(self, city):
+        if not self.api_key or self.api_key == 'demo_key':
+            log.warning("No API key configured", extra={"city": city})
+
+        start = time.perf_counter()
+        try:
+            response = self.session.get(
+                self.url,
+                params={"q": city, "appid": self.api_key, "units": "metric", "lang": "en"},
+                timeout=self.timeout
+            )
+        except requests.exceptions.Timeout:
+            raise ProviderError("Weather API timeout")
+        except Exception as e:
+            raise ProviderError(f"API call failed: {str(e)}")
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        log.debug("Weather API answered", extra={"city": city, "status": response.status_code,
+                                                 "latency_ms": round(latency_ms, 1)})
+        if response.status_code == 429:
+            raise ProviderThrottled("Weather API rate limit reached",
+                                    parse_retry_after(response.headers.get("Retry-After")))
+        try:
+            data = response.json()
+        except ValueError:
+            raise ProviderError(f"Weather API error: HTTP {response.status_code}")
+
+        if self.record_dir:
+            self.record(city, response.status_code, latency_ms, data)
+        if response.status_code != 200:
+            log.warning("Weather API error", extra={"city": city, "status": response.status_code, "body": data})
+            raise ProviderError(f"Weather API error: {data.get('message', 'Unknown error')}")
+
+        log.info("Got weather data", extra={"city": data["name"], "sampled": True})
+        return parse_openweathermap(data)
+
+    def record(self, city, status, latency_ms, data):
+        path = recording_path(self.record_dir, city)
+        path.write_text(json.dumps({"city": city, "status": status, "latency_ms": round(latency_ms, 2), "body": data}))
+
+    def describe(self):
+        return {"name": self.name, "url": self.url, "recording_to": self.record_dir}
+
+
+class SyntheticProvider(WeatherProvider):
+    """
+    Made-up but stable weather: each city's conditions come from a hash of its
+    name, so every run and every replica agrees. Latency is log-normal around
+    latency_ms; errors and 429s are injected at the given rates from a seeded RNG.
+    """
+    name = "synthetic"
+    CONDITIONS = ["Clear", "Clouds", "Rain", "Snow", "Drizzle", "Mist"]
+
+    def __init__(self, latency_ms=50.0, latency_sigma=0.3, error_rate=0.0, throttle_rate=0.0, seed=42):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            latency = self.latency_ms * math.exp(self._rng.gauss(0, self.latency_sigma)) if self.latency_ms else 0.0
+            roll = self._rng.random()
+        return latency, roll
+
+    def payload(self, city):
+        """OpenWeatherMap-shaped body, so synthetic data goes through the real parser"""
+        h = zlib.crc32(normalize_city(city).encode())
+        condition = self.CONDITIONS[h % len(self.CONDITIONS)]
+        temperature = (h >> 8) % 45 - 10  # -10..34 C
+        if condition == "Snow":
+            temperature = min(temperature, 1)
+        return {
+            "name": city.strip().title(),
+            "sys": {"country": "ZZ"},
+            "main": {"temp": temperature, "feels_like": temperature - (h >> 16) % 4,
+                     "humidity": 30 + (h >> 4) % 70, "pressure": 990 + (h >> 12) % 40},
+            "weather": [{"main": condition, "description": condition.lower()}],
+            "wind": {"speed": round((h >> 20) % 150 / 10, 1)},
+            "coord": {"lat": round((h % 18000) / 100 - 90, 2), "lon": round(((h >> 3) % 36000) / 100 - 180, 2)},
+            "visibility": 10000
+        }
+
+    def current(self, city):
+        latency_ms, roll = self._draw()
+        time.sleep(latency_ms / 1000)
+        if roll < self.throttle_rate:
+            raise ProviderThrottled("Synthetic rate limit", retry_after=1)
+        if roll < self.throttle_rate + self.error_rate:
+            raise ProviderError("Weather API error: synthetic failure")
+        return parse_openweathermap(self.payload(city), source="synthetic")
+
+    def describe(self):
+        return {"name": self.name, "latency_ms": self.latency_ms, "latency_sigma": self.latency_sigma,
+                "error_rate": self.error_rate, "throttle_rate": self.throttle_rate, "seed": self.seed}
+
+
+class ReplayProvider(WeatherProvider):
+    """Serves OpenWeatherMapProvider recordings; unknown cities are errors, never live calls"""
+    name = "replay"
+
+    def __init__(self, directory, replay_latency=False):
+        self.directory = directory
+        self.replay_latency = replay_latency
+        self._recordings = {}
+        self._lock = threading.Lock()
+
+    def _load(self, city):
+        path = recording_path(self.directory, city)
+        with self._lock:
+            if path not in self._recordings:
+                try:
+                    self._recordings[path] = json.loads(path.read_text())
+                except FileNotFoundError:
+                    self._recordings[path] = None
+            return self._recordings[path]
+
+    def current(self, city):
+        recording = self._load(city)
+        if recording is None:
+            raise ProviderError(f"Weather API error: no recording for {city}")
+        if self.replay_latency:
+            time.sleep(recording.get("latency_ms", 0) / 1000)
+        if recording["status"] == 429:
+            raise ProviderThrottled("Recorded rate limit", retry_after=1)
+        if recording["status"] != 200:
+            raise ProviderError(f"Weather API error: {recording['body'].get('message', 'Unknown error')}")
+        return parse_openweathermap(recording["body"], source="replay")
+
+    def describe(self):
+        return {"name": self.name, "directory": str(self.directory), "replay_latency": self.replay_latency}
+
+
+def provider_from_env():
+    name = os.getenv('WEATHER_PROVIDER', 'openweathermap').lower()
+    if name == 'synthetic':
+        return SyntheticProvider(
+            latency_ms=float(os.getenv('SYNTHETIC_LATENCY_MS', '50')),
+            latency_sigma=float(os.getenv('SYNTHETIC_LATENCY_SIGMA', '0.3')),
+            error_rate=float(os.getenv('SYNTHETIC_ERROR_RATE', '0')),
+            throttle_rate=float(os.getenv('SYNTHETIC_THROTTLE_RATE', '0')),
+            seed=int(os.getenv('SYNTHETIC_SEED', '42'))
+        )
+    if name == 'replay':
+        return ReplayProvider(
+            os.getenv('WEATHER_REPLAY_DIR', 'recordings'),
+            replay_latency=os.getenv('WEATHER_REPLAY_LATENCY', 'false').lower() == 'true'
+        )
+    return OpenWeatherMapProvider(
+        os.getenv('WEATHER_API_KEY'),
+        url=os.getenv('WEATHER_API_URL', 'http://api.openweathermap.org/data/2.5/weather'),
+        timeout=float(os.getenv('WEATHER_API_TIMEOUT', '10')),
+        record_dir=os.getenv('WEATHER_RECORD_DIR')
+    )
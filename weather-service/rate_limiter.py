@@ -0,0 +1,156 @@
+# weather-service/rate_limiter.py
+"""
+Quota-aware scheduler for upstream weather API calls.
+
+A token bucket refills at the provider's quota. Callers that find it empty
+queue by priority (interactive requests ahead of background cache refreshes,
+FIFO within a priority) and are released one token at a time.
+
+When the provider still answers 429, throttled() pauses the bucket (honoring
+Retry-After, otherwise exponential backoff) and halves the refill rate; every
+successful call wins a little of it back (AIMD, like TCP congestion control).
+"""
+import heapq
+import itertools
+import threading
+import time
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class WaitStats:
+    def __init__(self):
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def observe(self, waited):
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def snapshot(self):
+        return {
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait / self.acquired * 1000, 2) if self.acquired else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2)
+        }
+
+
+class TokenBucket:
+    """
+    Upstream quota guard: `rate` calls per `per` seconds, bursts of up to `burst`.
+
+    acquire() blocks until this caller is first in the priority queue and a
+    token is free, or the timeout runs out.
+    """
+
+    def __init__(self, rate, per=60.0, burst=None, min_rate=None, initial_backoff=1.0, max_backoff=60.0):
+        self.rate = rate                       # configured quota
+        self.current_rate = float(rate)        # lowered after 429s, recovers on success
+        self.min_rate = min_rate or max(1.0, rate / 10)
+        self.per = per
+        self.capacity = burst or rate
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff = initial_backoff
+        self.paused_until = 0.0
+        self.throttled_count = 0
+        self._queue = []                       # heap of [priority, ticket]
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = {priority: WaitStats() for priority in PRIORITY_NAMES}
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.current_rate / self.per)
+        self.updated = now
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        entry = [priority, next(self._tickets)]
+
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    at_head = self._queue[0] is entry
+                    if at_head and now >= self.paused_until and self.tokens >= 1:
+                        heapq.heappop(self._queue)
+                        self.tokens -= 1
+                        self._stats[priority].observe(now - start)
+                        return True
+
+                    if deadline is not None and now >= deadline:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                        self._stats[priority].timeouts += 1
+                        return False
+
+                    # The head sleeps until its token is due; everyone else until notified
+                    wait = None
+                    if at_head:
+                        wait = max(self.paused_until - now, (1 - self.tokens) * self.per / self.current_rate, 0.001)
+                    if deadline is not None:
+                        wait = deadline - now if wait is None else min(wait, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                # Whoever is at the head now (maybe a new one) re-checks the bucket
+                self._cond.notify_all()
+
+    def throttled(self, retry_after=None):
+        """The provider answered 429: pause, then come back at a lower rate"""
+        with self._cond:
+            pause = retry_after if retry_after is not None else self.backoff
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self.current_rate = max(self.min_rate, self.current_rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            self.throttled_count += 1
+            self._cond.notify_all()
+        return pause
+
+    def succeeded(self):
+        """An upstream call went through: creep back toward the configured quota"""
+        with self._cond:
+            self.backoff = self.initial_backoff
+            if self.current_rate < self.rate:
+                self.current_rate = min(float(self.rate), self.current_rate + max(1.0, self.rate / 20))
+
+    def retry_after(self):
+        """Rough seconds until the next token, for Retry-After headers"""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return max(self.paused_until - now, (1 - self.tokens) * self.per / self.current_rate, 0.0)
+
+    def available(self):
+        with self._cond:
+            self._refill(time.monotonic())
+            return self.tokens
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._queue:
+                depth[PRIORITY_NAMES[priority]] += 1
+            return {
+                "tokens_available": round(self.tokens, 2),
+                "capacity": self.capacity,
+                "rate_per_minute": round(self.current_rate * 60 / self.per, 2),
+                "configured_rate_per_minute": round(self.rate * 60 / self.per, 2),
+                "queue_depth": depth,
+                "paused_for_seconds": round(max(0.0, self.paused_until - now), 2),
+                "throttled_responses": self.throttled_count,
+                "waits": {PRIORITY_NAMES[p]: stats.snapshot() for p, stats in self._stats.items()}
+            }